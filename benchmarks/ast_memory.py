@@ -0,0 +1,52 @@
+"""Memory held by a ~100k-node syntax tree as objects and as a FlatTree.
+
+Run from the directory that holds the `interpreter` package (like test.py):
+
+    python -m benchmarks.ast_memory
+"""
+import gc
+import sys
+import tracemalloc
+
+from interpreter.table_lexer import TableTokenMaker
+from interpreter.pratt_parser import PrattParser
+from interpreter.flat_ast import FlatTree
+from interpreter.position import keep_source
+
+SNIPPET = 'RECKON x == {i} THEN f({i}, "s") ELSE [{i}, y * 2 - 1]'
+
+def build_source(count):
+    return '[' + ', '.join(SNIPPET.format(i=i) for i in range(count)) + ']'
+
+def traced(build):
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+def parse_tree(source):
+    tokenizer = TableTokenMaker('<bench>', source)
+    tokens, issue = tokenizer.generate_tokens()
+    if issue: raise Exception(issue.display_error())
+    result = PrattParser(tokens).parse()
+    if result.error: raise Exception(result.error.display_error())
+    keep_source(result.node, tokenizer.source)
+    return result.node
+
+def main():
+    nodes = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    source = build_source(nodes // 15)
+
+    syntax_tree, tree_size = traced(lambda: parse_tree(source))
+    flat_tree, flat_size = traced(lambda: FlatTree.from_tree(syntax_tree))
+    count = len(flat_tree)
+
+    print(f'{count} nodes, {len(flat_tree.token_types)} tokens')
+    print(f'  objects: {tree_size / (1 << 20):7.2f} MB ({tree_size / count:6.1f} bytes/node)')
+    print(f'flat tree: {flat_size / (1 << 20):7.2f} MB ({flat_size / count:6.1f} bytes/node)')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""Element-wise arithmetic over a Collection of numbers, with the built-ins
+that work on its packed array against the same with a TROT loop.
+
+Run from the directory that holds the `interpreter` package (like test.py):
+
+    python -m benchmarks.broadcast [elements]
+"""
+import sys
+import time
+
+from interpreter.init import ENGINES, execute, setup_global_symbols
+from interpreter.context import ExecutionContext
+
+# Each is the timed line, which makes a new collection from numbers
+PROGRAMS = {
+    'scale': ("BEEFUP(numbers, 3)", "TROT i = 0 T' {last} THEN (numbers / i) * 3"),
+    'add': ("PILEON(numbers, numbers)", "TROT i = 0 T' {last} THEN (numbers / i) + (numbers / i)"),
+    'divide': ("DIVVY(numbers, 4)", "TROT i = 0 T' {last} THEN (numbers / i) / 4"),
+}
+
+def run(line, engine, count):
+    context = ExecutionContext('<bench>')
+    context.symbol_storage = setup_global_symbols()
+    _, issue = execute('<bench>', f"THANG numbers = TROT i = 1 T' {count} THEN i", context, engine=engine)
+    if issue: raise Exception(issue.display_error())
+    started = time.perf_counter()
+    _, issue = execute('<bench>', line.format(last=count - 1), context, engine=engine)
+    elapsed = time.perf_counter() - started
+    if issue: raise Exception(issue.display_error())
+    return elapsed
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+
+    for name, (built_in, loop) in PROGRAMS.items():
+        print(name)
+        for engine in ENGINES:
+            batched = min(run(built_in, engine, count) for _ in range(3))
+            looped = min(run(loop, engine, count) for _ in range(3))
+            print(f'  {engine:>8}: built-in {batched * 1000:7.1f} ms, loop {looped * 1000:7.1f} ms '
+                  f'({looped / batched:.0f}x)')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Run time of a few programs under every engine in init.ENGINES.
+
+Run from the directory that holds the `interpreter` package (like test.py):
+
+    python -m benchmarks.engines
+"""
+import sys
+import time
+
+from interpreter.init import ENGINES, execute, setup_global_symbols
+from interpreter.context import ExecutionContext
+from interpreter.operation_cache import operation_stats
+
+# Each program is setup lines followed by the timed line, run in one context like the REPL
+PROGRAMS = {
+    'loop': ["THANG x = 3", "TROT i = 1 T' {n} THEN i * 2 + x - 1 / 2"],
+    'while': ["THANG n = 0", "THANG total = 0",
+              "WHILES n < {n} THEN THANG n = n + 1, THANG total = total + n * n"],
+    'calls': ["FIXIN' fib(n) -> RECKON n < 2 THEN n ELSE fib(n - 1) + fib(n - 2)", "fib({depth})"],
+    'tail': ["FIXIN' total(n, acc) -> RECKON n < 1 THEN acc ELSE total(n - 1, acc + n)", "total({n}, 0)"],
+    'globals': ["THANG rate = 3", "FIXIN' inner(n) -> TROT i = 1 T' n THEN i * rate",
+                "FIXIN' outer(n) -> inner(n)", "outer({n})"],
+    'mixed': ["THANG s = \"ab\"", "TROT i = 1 T' {n} THEN [i * 3 < 7, s + \"c\", s * 2, i + 0.5]"],
+}
+
+def run(lines, engine):
+    context = ExecutionContext('<bench>')
+    context.symbol_storage = setup_global_symbols()
+    for line in lines:
+        started = time.perf_counter()
+        _, issue = execute('<bench>', line, context, engine=engine)
+        elapsed = time.perf_counter() - started
+        if issue: raise Exception(issue.display_error())
+    return elapsed
+
+def measure(lines, engine, repeat):
+    return min(run(lines, engine) for _ in range(repeat))
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    sys.setrecursionlimit(10_000)
+
+    for name, template in PROGRAMS.items():
+        lines = [line.format(n=size, depth=size.bit_length() + 3) for line in template]
+        times = {engine: measure(lines, engine, repeat) for engine in ENGINES}
+        baseline = times['tree']
+        print(name)
+        for engine, elapsed in times.items():
+            print(f'  {engine:>8}: {elapsed * 1000:8.1f} ms ({baseline / elapsed:4.1f}x)')
+
+    stats = operation_stats()
+    print(f"operator sites: {stats['monomorphic']} of {stats['sites']} monomorphic, "
+          f"{stats['polymorphic']} polymorphic, {stats['megamorphic']} megamorphic; "
+          f"{stats['hits']} fast paths taken, {stats['misses']} misses")
+
+if __name__ == '__main__':
+    main()
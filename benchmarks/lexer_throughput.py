@@ -0,0 +1,49 @@
+"""Tokens/sec of the classic and table-driven lexers on ~1 MB of source.
+
+Run from the directory that holds the `interpreter` package (like test.py):
+
+    python -m benchmarks.lexer_throughput
+"""
+import sys
+import time
+
+from interpreter.lexer import TokenMaker
+from interpreter.table_lexer import TableTokenMaker
+
+SNIPPET = (
+    "THANG total = 0 # running total\n"
+    "TROT i = 1 T' 100 BY_A_PEICE 2 THEN THANG total = total + i * 3.5 - (i / 2) "
+    "RECKON total >= 1000 AN' AIN'T done THEN HOLLER(\"big number\") "
+    "MIGHTCOULD total != 0 THEN SHOVE(items, [total, \"ok\"]) ELSE NULL "
+    "FIXIN' square(n) -> n * n # helper\n"
+)
+
+def build_source(size):
+    return SNIPPET * (size // len(SNIPPET) + 1)
+
+def measure(lexer_class, source, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        tokens, issue = lexer_class('<bench>', source).generate_tokens()
+        elapsed = time.perf_counter() - started
+        if issue: raise Exception(issue.display_error())
+        best = elapsed if best is None else min(best, elapsed)
+    return len(tokens), best
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 1024 * 1024
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    source = build_source(size)
+    print(f'input: {len(source)} chars')
+
+    results = {}
+    for name, lexer_class in (('classic', TokenMaker), ('table', TableTokenMaker)):
+        count, elapsed = measure(lexer_class, source, repeat)
+        results[name] = elapsed
+        print(f'{name:>8}: {count} tokens in {elapsed:.3f}s ({count / elapsed:,.0f} tokens/sec)')
+
+    print(f'speedup: {results["classic"] / results["table"]:.1f}x')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Run time of generated-looking code with and without the optimizer passes.
+
+Run from the directory that holds the `interpreter` package (like test.py):
+
+    python -m benchmarks.optimizer
+"""
+import sys
+import time
+
+from interpreter.init import execute, optimizer, parse
+
+BODY = (
+    "[RECKON 0 THEN HOLLER(\"debug\") ELSE i * (60 * 60 * 24) + 1000 / 8, "
+    "RECKON 1 THEN \"row \" * 2 ELSE NULL, "
+    "AIN'T AIN'T (i > 3 * 4), "
+    "(rate * rate + 1) * i, (i * 2 + 1) * (i * 2 + 1)]"
+)
+
+# Small helpers called from a loop, which inline_calls runs at their call sites
+CALLS = (
+    "[FIXIN' square(n) -> n * n, FIXIN' clamp(n, top) -> RECKON n > top THEN top ELSE n, "
+    "TROT i = 1 T' {size} THEN clamp(square(i), 1000) + (FIXIN'(a) -> a * rate)(i)]"
+)
+
+# Arithmetic on names infer_types proves are numbers, which runs on plain Python numbers
+NUMERIC = (
+    "[FIXIN' series(n) -> [THANG total = 0, THANG k = 3, "
+    "TROT i = 1 T' n THEN THANG total = total + i * i - i / 2 + (k * i < 7 * i), total], series({size})]"
+)
+
+def measure(source, optimize, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        _, issue = execute('<bench>', source, optimize=optimize)
+        elapsed = time.perf_counter() - started
+        if issue: raise Exception(issue.display_error())
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    source = f"[THANG rate = 3, TROT i = 1 T' {size} THEN {BODY}]"
+
+    plain = measure(source, False, repeat)
+    optimizer.clear()
+    optimized = measure(source, True, repeat)
+
+    print(f'    plain: {plain * 1000:8.1f} ms')
+    print(f'optimized: {optimized * 1000:8.1f} ms ({plain / optimized:.1f}x)')
+    for name, counts in optimizer.stats()['passes'].items():
+        print(f'  {name}: {counts["rewrites"]} rewrites in {counts["seconds"] * 1000:.2f} ms')
+
+    source = f"[THANG rate = 3, {CALLS.format(size=size)}]"
+    plain = measure(source, False, repeat)
+    optimizer.clear()
+    inlined = measure(source, True, repeat)
+    print(f'    calls: {plain * 1000:8.1f} ms')
+    print(f'  inlined: {inlined * 1000:8.1f} ms ({plain / inlined:.1f}x)')
+    print(optimizer.inlining_report())
+
+    source = NUMERIC.format(size=size)
+    plain = measure(source, False, repeat)
+    unboxed = measure(source, True, repeat)
+    print(f'    boxed: {plain * 1000:8.1f} ms')
+    print(f'  unboxed: {unboxed * 1000:8.1f} ms ({plain / unboxed:.1f}x)')
+    print(optimizer.specialization_report(optimizer.optimize(parse('<bench>', source)[0])))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""Nodes/sec of the classic and Pratt parsers on nested and flat expressions.
+
+Run from the directory that holds the `interpreter` package (like test.py):
+
+    python -m benchmarks.parser_throughput
+"""
+import sys
+import time
+
+from interpreter.table_lexer import TableTokenMaker
+from interpreter.parser import CodeParser
+from interpreter.pratt_parser import PrattParser
+from interpreter.nodes import iter_child_nodes
+
+def nested_source(depth):
+    return '(1 + ' * depth + '1' + ')' * depth
+
+def flat_source(length):
+    return ' + '.join(f'x * {i} - {i} / 2' for i in range(length))
+
+def list_source(length):
+    return '[' + ', '.join(f'RECKON x == {i} THEN f({i}) ELSE [{i}, "s"]' for i in range(length)) + ']'
+
+def count_nodes(node):
+    count = 0
+    stack = [node]
+    while stack:
+        count += 1
+        stack.extend(iter_child_nodes(stack.pop()))
+    return count
+
+def measure(parser_class, tokens, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = parser_class(tokens).parse()
+        elapsed = time.perf_counter() - started
+        if result.error: raise Exception(result.error.display_error())
+        best = elapsed if best is None else min(best, elapsed)
+    return count_nodes(result.node), best
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    # CodeParser recurses through about ten rules per level of nesting
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), size * 20))
+
+    for name, source in (('nested', nested_source(size)),
+                         ('flat', flat_source(size * 10)),
+                         ('list', list_source(size * 2))):
+        tokens, issue = TableTokenMaker('<bench>', source).generate_tokens()
+        if issue: raise Exception(issue.display_error())
+
+        results = {}
+        for parser_name, parser_class in (('classic', CodeParser), ('pratt', PrattParser)):
+            count, elapsed = measure(parser_class, tokens, repeat)
+            results[parser_name] = elapsed
+            print(f'{name:>7} {parser_name:>8}: {count} nodes in {elapsed:.3f}s ({count / elapsed:,.0f} nodes/sec)')
+        print(f'{name:>7}  speedup: {results["classic"] / results["pratt"]:.1f}x')
+
+if __name__ == '__main__':
+    main()
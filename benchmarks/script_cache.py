@@ -0,0 +1,57 @@
+"""Cold parse vs .ssc cache load time of a large script.
+
+Run from the directory that holds the `interpreter` package (like test.py):
+
+    python -m benchmarks.script_cache
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from interpreter import script_cache
+from interpreter.init import parse_file
+
+SNIPPET = (
+    "RECKON total >= 1000 AN' AIN'T done THEN HOLLER(\"big number\") "
+    "MIGHTCOULD total != 0 THEN SHOVE(items, [total * 3.5 - (i / 2), \"ok\"]) ELSE NULL, # helper\n"
+)
+
+def build_source(size):
+    return '[' + SNIPPET * (size // len(SNIPPET) + 1) + 'NULL]'
+
+def measure(path, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        _, issue = parse_file(path)
+        elapsed = time.perf_counter() - started
+        if issue: raise Exception(issue.display_error())
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 1024 * 1024
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'library.ss')
+    with open(path, 'w') as f:
+        f.write(build_source(size))
+
+    try:
+        script_cache.enabled = False
+        cold = measure(path, repeat)
+        script_cache.enabled = True
+        parse_file(path)
+        warm = measure(path, repeat)
+    finally:
+        shutil.rmtree(directory)
+
+    print(f'input: {size >> 10} KB')
+    print(f' parse: {cold * 1000:8.1f} ms')
+    print(f'cached: {warm * 1000:8.1f} ms')
+    print(f'speedup: {cold / warm:.1f}x')
+
+if __name__ == '__main__':
+    main()
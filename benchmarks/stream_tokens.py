@@ -0,0 +1,53 @@
+"""Time-to-first-token and peak memory of streamed vs whole-file lexing.
+
+Run from the directory that holds the `interpreter` package (like test.py):
+
+    python -m benchmarks.stream_tokens
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from interpreter.table_lexer import TableTokenMaker, StreamTokenMaker
+from .lexer_throughput import build_source
+
+def lex_whole(path):
+    with open(path) as f:
+        tokens, _ = TableTokenMaker(path, f.read()).generate_tokens()
+    yield from tokens
+
+def lex_stream(path):
+    with open(path) as f:
+        yield from StreamTokenMaker(path, f).stream_tokens()
+
+def measure(lex, path):
+    started = time.perf_counter()
+    first = None
+    count = 0
+    for _ in lex(path):
+        if first is None: first = time.perf_counter() - started
+        count += 1
+
+    tracemalloc.start()
+    for _ in lex(path): pass
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return first, count, peak
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1 << 20, 4 << 20]
+    for size in sizes:
+        with tempfile.NamedTemporaryFile('w', suffix='.ss', delete=False) as f:
+            f.write(build_source(size))
+        try:
+            for name, lex in (('whole', lex_whole), ('stream', lex_stream)):
+                first, count, peak = measure(lex, f.name)
+                print(f'{size >> 10:>6} KB {name:>6}: first token after {first * 1000:8.2f} ms, '
+                      f'{count} tokens, peak {peak / (1 << 20):7.2f} MB')
+        finally:
+            os.unlink(f.name)
+
+if __name__ == '__main__':
+    main()
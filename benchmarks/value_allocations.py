@@ -0,0 +1,74 @@
+"""Runtime values each engine makes per loop iteration or call.
+
+Values are immutable and shared, so reading a name, storing one or
+returning from a call makes no value, and small ints and booleans are
+made once. This counts the values that are still made.
+
+Run from the directory that holds the `interpreter` package (like test.py):
+
+    python -m benchmarks.value_allocations
+"""
+import sys
+from collections import Counter
+
+from interpreter.init import ENGINES, execute, setup_global_symbols
+from interpreter.context import ExecutionContext
+from interpreter.values import BaseType
+
+# Each program is setup lines followed by the measured line, and how many iterations or calls that makes
+PROGRAMS = {
+    'loop': (["THANG x = 3", "TROT i = 1 T' {n} THEN i * 2 + x - 1 / 2"], lambda n: n),
+    'reads': (["THANG x = 3", "THANG y = 4", "TROT i = 1 T' {n} THEN [x, y, i]"], lambda n: n),
+    'while': (["THANG n = 0", "THANG total = 0",
+               "WHILES n < {n} THEN THANG n = n + 1, THANG total = total + n"], lambda n: n),
+    'calls': (["FIXIN' add(a, b) -> a + b", "TROT i = 1 T' {n} THEN add(i, 1)"], lambda n: n),
+}
+
+made = Counter()
+
+def value_types(base=BaseType):
+    for value_type in base.__subclasses__():
+        yield value_type
+        yield from value_types(value_type)
+
+def counting(value_type):
+    init = value_type.__init__
+
+    def counting_init(self, *args):
+        if type(self) is value_type: made[value_type.__name__] += 1
+        init(self, *args)
+    return counting_init
+
+def count(lines, engine):
+    context = ExecutionContext('<bench>')
+    context.symbol_storage = setup_global_symbols()
+    for line in lines[:-1]:
+        _, issue = execute('<bench>', line, context, engine=engine)
+        if issue: raise Exception(issue.display_error())
+
+    made.clear()
+    originals = {value_type: value_type.__dict__['__init__'] for value_type in value_types()}
+    for value_type in originals:
+        value_type.__init__ = counting(value_type)
+    try:
+        _, issue = execute('<bench>', lines[-1], context, engine=engine)
+    finally:
+        for value_type, init in originals.items():
+            value_type.__init__ = init
+    if issue: raise Exception(issue.display_error())
+    return Counter(made)
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+
+    for name, (template, iterations) in PROGRAMS.items():
+        lines = [line.format(n=size) for line in template]
+        print(name)
+        for engine in ENGINES:
+            counts = count(lines, engine)
+            per_iteration = sum(counts.values()) / iterations(size)
+            kinds = ', '.join(f'{kind} {number / iterations(size):.2f}' for kind, number in counts.most_common())
+            print(f'  {engine:>8}: {per_iteration:5.2f} values/iteration ({kinds or "none"})')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+"""Memory held by a Collection of numbers built with TROT, per element.
+
+Run from the directory that holds the `interpreter` package (like test.py):
+
+    python -m benchmarks.value_memory [elements] [engine]
+"""
+import gc
+import sys
+import time
+import tracemalloc
+
+from interpreter.init import execute, setup_global_symbols
+from interpreter.context import ExecutionContext
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000_000
+    engine = sys.argv[2] if len(sys.argv) > 2 else 'closure'
+    context = ExecutionContext('<bench>')
+    context.symbol_storage = setup_global_symbols()
+
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    # Times 3 makes every element a value of its own, past the shared small ints
+    _, issue = execute('<bench>', f"THANG numbers = TROT i = 1 T' {count} THEN i * 3", context, engine=engine)
+    elapsed = time.perf_counter() - started
+    if issue: raise Exception(issue.display_error())
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    elements = context.symbol_storage.get('numbers').elements
+    print(f'{count} elements with {engine} in {elapsed:.1f} s (traced)')
+    print(f'collection: {size / (1 << 20):8.1f} MB ({size / count:5.1f} bytes/element, '
+          f'kept in {"a list of values" if type(elements) is list else f"array({elements.typecode!r})"})')
+
+if __name__ == '__main__':
+    main()
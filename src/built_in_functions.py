@@ -1,10 +1,15 @@
-from .values import BaseType, NumericValue, TextValue, Collection
+import operator
+from itertools import repeat
+
+from .values import BaseFunction, NumericValue, TextValue, Collection, collection_of
 from .runtime_result import RuntimeResult
 from .errors import RuntimeIssue
 from .context import ExecutionContext
 from .symbol_table import SymbolStorage
 
-class PredefinedFunction(BaseType):
+class PredefinedFunction(BaseFunction):
+    __slots__ = ('name',)
+
     def __init__(self, name):
         super().__init__()
         self.name = name
@@ -31,10 +36,7 @@ class PredefinedFunction(BaseType):
         exec_context.symbol_storage = SymbolStorage(self.context.symbol_storage)
         
         for i in range(len(args)):
-            arg_name = method.arg_names[i]
-            arg_value = args[i]
-            arg_value.set_context(exec_context)
-            exec_context.symbol_storage.add(arg_name, arg_value)
+            exec_context.symbol_storage.add(method.arg_names[i], args[i])
         
         method_result = method(exec_context)
         if method_result.error:
@@ -83,7 +85,7 @@ class PredefinedFunction(BaseType):
                 exec_context
             ))
             
-        collection.elements.append(value)
+        collection.append(value)
         return RuntimeResult().success(NumericValue.zero)
     run_SHOVE.arg_names = ['collection', 'value']
     
@@ -106,7 +108,7 @@ class PredefinedFunction(BaseType):
             ))
             
         try:
-            value = collection.elements.pop(index.value)
+            value = collection.pop(index.value)
             return RuntimeResult().success(value)
         except IndexError:
             return RuntimeResult().failure(RuntimeIssue(
@@ -134,6 +136,65 @@ class PredefinedFunction(BaseType):
                 exec_context
             ))
             
-        new_collection = Collection(collectionA.elements + collectionB.elements)
+        if collectionA.typecode() is not None and collectionA.typecode() == collectionB.typecode():
+            new_collection = Collection(collectionA.elements + collectionB.elements)
+        else:
+            new_collection = Collection(collectionA.values() + collectionB.values())
         return RuntimeResult().success(new_collection)
-    run_STACKON.arg_names = ["collectionA", "collectionB"]
\ No newline at end of file
+    run_STACKON.arg_names = ["collectionA", "collectionB"]
+    
+    def broadcast(self, exec_context, operation):
+        """Applies operation to the plain numbers of a collection and a number or a collection
+        of as many numbers, element by element, in one pass over arrays where packed"""
+        collection = exec_context.symbol_storage.get("collection")
+        other = exec_context.symbol_storage.get("other")
+        
+        numbers = collection.numbers() if isinstance(collection, Collection) else None
+        if numbers is None:
+            return RuntimeResult().failure(RuntimeIssue(
+                self.start_pos, self.end_pos,
+                "First argument must be a collection of numbers",
+                exec_context
+            ))
+            
+        if isinstance(other, NumericValue):
+            others = repeat(other.value)
+        else:
+            others = other.numbers() if isinstance(other, Collection) else None
+            if others is None:
+                return RuntimeResult().failure(RuntimeIssue(
+                    self.start_pos, self.end_pos,
+                    "Second argument must be a number or a collection of numbers",
+                    exec_context
+                ))
+            if len(others) != len(numbers):
+                return RuntimeResult().failure(RuntimeIssue(
+                    self.start_pos, self.end_pos,
+                    f"Collections must be the same length, not {len(numbers)} and {len(others)}",
+                    exec_context
+                ))
+            
+        try:
+            return RuntimeResult().success(collection_of(list(map(operation, numbers, others))))
+        except ZeroDivisionError:
+            return RuntimeResult().failure(RuntimeIssue(
+                self.start_pos, self.end_pos,
+                "Division by zero",
+                exec_context
+            ))
+    
+    def run_PILEON(self, exec_context):
+        return self.broadcast(exec_context, operator.add)
+    run_PILEON.arg_names = ['collection', 'other']
+    
+    def run_WHITTLE(self, exec_context):
+        return self.broadcast(exec_context, operator.sub)
+    run_WHITTLE.arg_names = ['collection', 'other']
+    
+    def run_BEEFUP(self, exec_context):
+        return self.broadcast(exec_context, operator.mul)
+    run_BEEFUP.arg_names = ['collection', 'other']
+    
+    def run_DIVVY(self, exec_context):
+        return self.broadcast(exec_context, operator.truediv)
+    run_DIVVY.arg_names = ['collection', 'other']
\ No newline at end of file
@@ -0,0 +1,578 @@
+from .runtime_result import RuntimeResult, TailCall
+from .values import NumericValue, TextValue, Collection, number
+from .values import BaseFunction, CustomFunction
+from .errors import RuntimeIssue
+from .nodes import ConditionalNode, FunctionCallNode, InlinedCallNode, VariableAccessNode
+from .nodes import BinaryOperationNode, UnaryOperationNode, cached_form, cache_form
+from .closure_compiler import ClosureCompiler
+from .operation_cache import unary_spans
+from .constants import *
+
+# Numbered roughly by how often they run, since the VM tests them in this order
+OPNAMES = (
+    'LOAD_NAME', 'LOAD_NUMBER', 'BINARY', 'UNBOXED', 'FOR_ITER', 'FOR_NEXT', 'FOR_DROP', 'STORE_NAME',
+    'POP_JUMP_IF_FALSE', 'JUMP', 'WHILE_APPEND', 'POP_TOP', 'LOAD_TEXT', 'PREPARE_CALL', 'CALL',
+    'NEGATE', 'NOT', 'BUILD_COLLECTION', 'PUSH_NONE', 'PUSH_ONE',
+    'FOR_SETUP', 'FOR_END', 'WHILE_SETUP', 'WHILE_END', 'MAKE_FUNCTION', 'RETURN',
+    'LOAD_CACHED', 'JUMP_IF_NOT_NONE', 'REMEMBER', 'RESET_HOISTED', 'LOAD_SLOT', 'STORE_SLOT',
+    'TAIL_CALL', 'INLINE_CALL', 'INLINE_RETURN', 'LOAD_CALLEE',
+)
+(LOAD_NAME, LOAD_NUMBER, BINARY, UNBOXED, FOR_ITER, FOR_NEXT, FOR_DROP, STORE_NAME,
+ POP_JUMP_IF_FALSE, JUMP, WHILE_APPEND, POP_TOP, LOAD_TEXT, PREPARE_CALL, CALL,
+ NEGATE, NOT, BUILD_COLLECTION, PUSH_NONE, PUSH_ONE,
+ FOR_SETUP, FOR_END, WHILE_SETUP, WHILE_END, MAKE_FUNCTION, RETURN,
+ LOAD_CACHED, JUMP_IF_NOT_NONE, REMEMBER, RESET_HOISTED, LOAD_SLOT, STORE_SLOT,
+ TAIL_CALL, INLINE_CALL, INLINE_RETURN, LOAD_CALLEE) = range(len(OPNAMES))
+
+class CodeObject:
+    """Compiled form of one syntax tree.
+
+    code is a flat list of opcode/argument pairs. Arguments index the
+    constant and name pools or are jump targets into code. spans holds the
+    (start, end) position of the node each instruction came from, one entry
+    per instruction, for the errors and calls it makes.
+    """
+    def __init__(self):
+        self.code = []
+        self.constants = []
+        self.names = []
+        self.spans = []
+        self.constant_indexes = {}
+        self.name_indexes = {}
+
+    def emit(self, opcode, arg=0, node=None):
+        self.code.append(opcode)
+        self.code.append(arg)
+        self.spans.append(None if node is None else (node.start_pos, node.end_pos))
+        return len(self.code) - 2
+
+    def patch(self, index, target):
+        self.code[index + 1] = target
+
+    def constant(self, value):
+        # 1, 1.0 and True are equal keys, so the type is part of the key
+        key = (type(value), value)
+        index = self.constant_indexes.get(key)
+        if index is None:
+            index = self.constant_indexes[key] = len(self.constants)
+            self.constants.append(value)
+        return index
+
+    def name(self, name):
+        index = self.name_indexes.get(name)
+        if index is None:
+            index = self.name_indexes[name] = len(self.names)
+            self.names.append(name)
+        return index
+
+    def disassemble(self):
+        lines = []
+        for pc in range(0, len(self.code), 2):
+            opcode, arg = self.code[pc], self.code[pc + 1]
+            line = f'{pc:5} {OPNAMES[opcode]:<18} {arg}'
+            if opcode in (LOAD_NUMBER, LOAD_TEXT, MAKE_FUNCTION, LOAD_CACHED, REMEMBER, RESET_HOISTED, LOAD_SLOT):
+                line += f' ({self.constants[arg]!r})'
+            elif opcode == LOAD_NAME:
+                line += f' ({self.constants[arg].name})'
+            elif opcode == LOAD_CALLEE:
+                line += f' ({self.constants[arg][1]})'
+            elif opcode == INLINE_CALL:
+                site, count, end, _ = self.constants[arg]
+                line += f' ({site.name}, {count} args, else {end})'
+            elif opcode == UNBOXED:
+                line += f' (else {self.constants[arg][1]})'
+            elif opcode == STORE_NAME:
+                line += f' ({self.names[arg]})'
+            elif opcode == BINARY:
+                line += f' ({self.constants[arg].method_name})'
+            lines.append(line)
+        return '\n'.join(lines)
+
+class BytecodeCompiler:
+    def compile(self, node):
+        code = CodeObject()
+        self.emit_node(node, code)
+        code.emit(RETURN)
+        return code
+
+    def compile_body(self, node):
+        """compile() for the body of a function, whose calls in tail position become TAIL_CALL"""
+        code = CodeObject()
+        self.emit_tail(node, code)
+        code.emit(RETURN)
+        return code
+
+    def emit_tail(self, node, code):
+        if type(node) is ConditionalNode:
+            self.compile_ConditionalNode(node, code, self.emit_tail)
+        elif type(node) is FunctionCallNode:
+            self.compile_FunctionCallNode(node, code, TAIL_CALL)
+        elif type(node) is InlinedCallNode:
+            self.compile_InlinedCallNode(node, code, tail=True)
+        else:
+            self.emit_node(node, code)
+
+    def emit_node(self, node, code):
+        method_name = f'compile_{type(node).__name__}'
+        method = getattr(self, method_name, self.no_method_found)
+        method(node, code)
+
+    def no_method_found(self, node, code):
+        raise Exception(f'No handler for {type(node).__name__}')
+
+    def compile_NumericLiteralNode(self, node, code):
+        # The pool holds the values themselves, which every run shares
+        code.emit(LOAD_NUMBER, self.value_constant(number, node.token.value, code))
+
+    def compile_TextLiteralNode(self, node, code):
+        code.emit(LOAD_TEXT, self.value_constant(TextValue, node.token.value, code))
+
+    def value_constant(self, make_value, value, code):
+        # Keyed by the plain value, since values compare by identity
+        key = (type(value), value, make_value)
+        index = code.constant_indexes.get(key)
+        if index is None:
+            index = code.constant_indexes[key] = len(code.constants)
+            code.constants.append(make_value(value))
+        return index
+
+    def compile_CollectionNode(self, node, code):
+        for item_node in node.items:
+            self.emit_node(item_node, code)
+            if node.discard: code.emit(POP_TOP)
+        if node.discard:
+            code.emit(PUSH_NONE)
+        else:
+            code.emit(BUILD_COLLECTION, len(node.items))
+
+    def compile_VariableAccessNode(self, node, code):
+        if node.slot is None:
+            code.emit(LOAD_NAME, code.constant(node.name_cache()), node)
+        else:
+            # The name is still needed when the slot is empty
+            code.emit(LOAD_SLOT, code.constant((node.slot, node.token.value)), node)
+
+    def emit_callee(self, node, code):
+        # A function read from a name is copied by PREPARE_CALL or INLINE_CALL rather than by the read
+        if type(node) is VariableAccessNode:
+            code.emit(LOAD_CALLEE, code.constant((node.slot, node.token.value, node.name_cache())), node)
+        else:
+            self.emit_node(node, code)
+
+    def compile_VariableAssignmentNode(self, node, code):
+        self.emit_node(node.value_node, code)
+        if node.slot is None:
+            code.emit(STORE_NAME, code.name(node.token.value))
+        else:
+            code.emit(STORE_SLOT, node.slot)
+
+    def compile_BinaryOperationNode(self, node, code, boxed=False):
+        if node.numeric and not boxed:
+            return self.emit_unboxed(node, code, self.compile_BinaryOperationNode)
+        emit = self.emit_boxed if boxed else self.emit_node
+        emit(node.left_node, code)
+        emit(node.right_node, code)
+        code.emit(BINARY, code.constant(node.operation_cache()))
+
+    def compile_UnaryOperationNode(self, node, code, boxed=False):
+        if node.numeric and not boxed:
+            return self.emit_unboxed(node, code, self.compile_UnaryOperationNode)
+        (self.emit_boxed if boxed else self.emit_node)(node.node, code)
+        # The argument is where the operand is, for an error
+        if node.op_token.type == TT_MINUS:
+            code.emit(NEGATE, code.constant(unary_spans(node)))
+        elif node.op_token.matches(TT_KEYWORD, 'AIN\'T'):
+            code.emit(NOT, code.constant(unary_spans(node)))
+
+    def emit_unboxed(self, node, code, compile_boxed):
+        # A tree Optimizer.infer_types marked numeric runs as one closure over
+        # plain numbers. The code for values after it only runs when that
+        # divides by zero, to report the error where CodeRunner does
+        # (raw closure, where the result continues)
+        index = len(code.constants)
+        code.constants.append(None)
+        code.emit(UNBOXED, index)
+        compile_boxed(node, code, boxed=True)
+        code.constants[index] = (ClosureCompiler().compile_raw(node), len(code.code))
+
+    def emit_boxed(self, node, code):
+        """emit_node() inside the code for values of a numeric tree, which needs no UNBOXED of its own"""
+        if type(node) is BinaryOperationNode:
+            self.compile_BinaryOperationNode(node, code, boxed=True)
+        elif type(node) is UnaryOperationNode:
+            self.compile_UnaryOperationNode(node, code, boxed=True)
+        else:
+            self.emit_node(node, code)
+
+    def compile_ConditionalNode(self, node, code, emit_expr=None):
+        emit_expr = emit_expr or self.emit_node
+        end_jumps = []
+        for condition, expr in node.cases:
+            self.emit_node(condition, code)
+            next_case = code.emit(POP_JUMP_IF_FALSE)
+            emit_expr(expr, code)
+            end_jumps.append(code.emit(JUMP))
+            code.patch(next_case, len(code.code))
+
+        if node.default_case:
+            emit_expr(node.default_case, code)
+        else:
+            code.emit(PUSH_NONE)
+        for jump in end_jumps:
+            code.patch(jump, len(code.code))
+
+    def compile_LoopNode(self, node, code):
+        self.emit_node(node.start_value, code)
+        self.emit_node(node.end_value, code)
+        if node.step_value:
+            self.emit_node(node.step_value, code)
+        else:
+            code.emit(PUSH_ONE)
+        code.emit(FOR_SETUP, code.name(node.var_token.value), node)
+
+        loop_start = code.emit(FOR_ITER)
+        self.emit_node(node.body, code)
+        code.emit(FOR_DROP if node.discard else FOR_NEXT, loop_start)
+        code.patch(loop_start, len(code.code))
+        # A true argument leaves None instead of the Collection
+        code.emit(FOR_END, int(node.discard))
+
+    def compile_WhileLoopNode(self, node, code):
+        code.emit(WHILE_SETUP)
+        loop_start = len(code.code)
+        self.emit_node(node.condition, code)
+        exit_jump = code.emit(POP_JUMP_IF_FALSE)
+        self.emit_node(node.body, code)
+        code.emit(POP_TOP if node.discard else WHILE_APPEND)
+        code.emit(JUMP, loop_start)
+        code.patch(exit_jump, len(code.code))
+        code.emit(WHILE_END, int(node.discard))
+
+    def compile_FunctionDefinitionNode(self, node, code):
+        func_name = node.func_name_token.value if node.func_name_token else None
+        param_names = [param.value for param in node.param_tokens]
+        code.constants.append((func_name, node.body_node, param_names, node.layout))
+        code.emit(MAKE_FUNCTION, len(code.constants) - 1, node)
+
+    def compile_HoistedLoopNode(self, node, code):
+        code.emit(RESET_HOISTED, code.constant(node))
+        self.emit_node(node.loop_node, code)
+
+    def compile_HoistedNode(self, node, code):
+        self.emit_cached(node, node, code)
+
+    def compile_SharedNode(self, node, code):
+        self.emit_node(node.node, code)
+        code.emit(REMEMBER, code.constant(node))
+
+    def compile_ReusedNode(self, node, code):
+        self.emit_cached(node.shared, node, code)
+
+    def emit_cached(self, cache, node, code):
+        # Pushes the value kept on cache if there is one, otherwise evaluates node
+        code.emit(LOAD_CACHED, code.constant(cache))
+        skip = code.emit(JUMP_IF_NOT_NONE)
+        self.emit_node(node.node, code)
+        if cache is node:
+            code.emit(REMEMBER, code.constant(node))
+        code.patch(skip, len(code.code))
+
+    def compile_FunctionCallNode(self, node, code, opcode=CALL):
+        self.emit_callee(node.func_node, code)
+        code.emit(PREPARE_CALL, int(type(node.func_node) is VariableAccessNode), node)
+        for arg_node in node.arg_nodes:
+            self.emit_node(arg_node, code)
+        code.emit(opcode, len(node.arg_nodes), node)
+
+    def compile_InlinedCallNode(self, node, code, tail=False):
+        if not node.anonymous:
+            self.emit_callee(node.call.func_node, code)
+        for arg_node in node.call.arg_nodes:
+            self.emit_node(arg_node, code)
+        # (site, argument count, where a guard miss continues, whether it may return a TailCall)
+        site = len(code.constants)
+        code.constants.append(None)
+        code.emit(INLINE_CALL, site, node)
+        self.emit_node(node.function.body_node, code)
+        code.emit(INLINE_RETURN)
+        code.constants[site] = (node, len(node.call.arg_nodes), len(code.code), tail)
+
+class VirtualMachine:
+    """Runs CodeObjects on a value stack with the same semantics as CodeRunner.
+
+    Errors and calls get the same positions and contexts the tree walker
+    gives them, so results, error messages and tracebacks are identical. Function bodies
+    are compiled when first called, and code is cached on its node.
+    """
+    compiler = BytecodeCompiler()
+
+    def compile(self, node, compiler=None):
+        code_object = getattr(node, 'compiled', None)
+        if type(code_object) is not CodeObject:
+            code_object = cached_form(node, CodeObject) or cache_form(node, (compiler or self.compiler.compile)(node))
+        return code_object
+
+    def evaluate(self, node, context):
+        return self.run(self.compile(node), context)
+
+    def call(self, func, args):
+        while True:
+            exec_context = func.create_context()
+            result = func.check_and_populate_args(func.param_names, args, exec_context)
+            if result.error: return result
+            result = self.run(self.compile(func.body_node, self.compiler.compile_body), exec_context)
+            if type(result.value) is not TailCall: return result
+            func, args = result.value.func, result.value.args
+
+    def run(self, code_object, context):
+        result = RuntimeResult()
+        code = code_object.code
+        constants = code_object.constants
+        names = code_object.names
+        spans = code_object.spans
+        storage = context.symbol_storage
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        pc = 0
+
+        while True:
+            opcode = code[pc]
+            arg = code[pc + 1]
+            pc += 2
+
+            if opcode == LOAD_NAME:
+                value = constants[arg].get(storage)
+                if not value:
+                    start_pos, end_pos = spans[(pc >> 1) - 1]
+                    return result.failure(RuntimeIssue(
+                        start_pos, end_pos,
+                        f"'{constants[arg].name}' ain't defined",
+                        context
+                    ))
+                # As in CodeRunner.process_VariableAccessNode
+                if isinstance(value, BaseFunction): value = value.copy().set_context(context)
+                push(value)
+
+            elif opcode == LOAD_NUMBER:
+                push(constants[arg])
+
+            elif opcode == BINARY:
+                right = pop()
+                outcome, issue = constants[arg].run(pop(), right)
+                if issue: return result.failure(issue.locate(constants[arg].spans, context))
+                push(outcome)
+
+            elif opcode == UNBOXED:
+                raw_run, end = constants[arg]
+                try:
+                    push(number(raw_run(context)))
+                    pc = end
+                except ZeroDivisionError:
+                    pass
+
+            elif opcode == FOR_ITER:
+                loop = stack[-1]
+                current = loop[0]
+                if (current <= loop[1]) if loop[3] else (current >= loop[1]):
+                    storage.add(loop[5], number(current))
+                else:
+                    pc = arg
+
+            elif opcode == FOR_NEXT:
+                value = pop()
+                loop = stack[-1]
+                loop[4].append(value)
+                loop[0] += loop[2]
+                pc = arg
+
+            elif opcode == FOR_DROP:
+                pop()
+                stack[-1][0] += stack[-1][2]
+                pc = arg
+
+            elif opcode == STORE_NAME:
+                storage.add(names[arg], stack[-1])
+
+            elif opcode == POP_JUMP_IF_FALSE:
+                if not pop().is_true(): pc = arg
+
+            elif opcode == JUMP:
+                pc = arg
+
+            elif opcode == WHILE_APPEND:
+                value = pop()
+                stack[-1].append(value)
+
+            elif opcode == POP_TOP:
+                pop()
+
+            elif opcode == LOAD_TEXT:
+                push(constants[arg])
+
+            elif opcode == PREPARE_CALL:
+                # arg is 1 for a function read from a name, which runs in this context
+                func = stack[-1].copy().set_position(*spans[(pc >> 1) - 1])
+                stack[-1] = func.set_context(context) if arg else func
+
+            elif opcode == CALL:
+                args = stack[len(stack) - arg:]
+                del stack[len(stack) - arg:]
+                func = pop()
+                if type(func) is CustomFunction:
+                    call_result = self.call(func, args)
+                else:
+                    call_result = func.execute(args)
+                if call_result.error: return result.failure(call_result.error)
+                value = call_result.value
+                if isinstance(value, BaseFunction): value = value.copy().set_context(context)
+                push(value)
+
+            elif opcode == NEGATE:
+                value, issue = pop().multiply(NumericValue(-1))
+                if issue: return result.failure(issue.locate(constants[arg], context))
+                push(value)
+
+            elif opcode == NOT:
+                value, issue = pop().logical_not()
+                if issue: return result.failure(issue.locate(constants[arg], context))
+                push(value)
+
+            elif opcode == BUILD_COLLECTION:
+                items = stack[len(stack) - arg:]
+                del stack[len(stack) - arg:]
+                push(Collection(items))
+
+            elif opcode == PUSH_NONE:
+                push(None)
+
+            elif opcode == PUSH_ONE:
+                push(NumericValue(1))
+
+            elif opcode == FOR_SETUP:
+                step_val = pop()
+                end_val = pop()
+                start_val = pop()
+                if step_val.value == 0:
+                    start_pos, end_pos = spans[(pc >> 1) - 1]
+                    return result.failure(RuntimeIssue(
+                        start_pos, end_pos,
+                        "Step value cannot be zero",
+                        context
+                    ))
+                current = start_val.value
+                ascending = step_val.value > 0
+                # [current, end, step, ascending, items, variable name]
+                push([current, end_val.value, step_val.value, ascending, [], names[arg]])
+
+            elif opcode == FOR_END:
+                if arg:
+                    stack[-1] = None
+                else:
+                    push(Collection(pop()[4]))
+
+            elif opcode == WHILE_SETUP:
+                push([])
+
+            elif opcode == WHILE_END:
+                items = pop()
+                push(None if arg else Collection(items))
+
+            elif opcode == MAKE_FUNCTION:
+                func_name, body_node, param_names, layout = constants[arg]
+                func_value = CustomFunction(func_name, body_node, param_names, layout)
+                func_value.set_context(context)
+                func_value.set_position(*spans[(pc >> 1) - 1])
+                if func_name is not None:
+                    storage.add(func_name, func_value)
+                push(func_value)
+
+            elif opcode == RETURN:
+                return result.success(pop())
+
+            elif opcode == LOAD_CACHED:
+                push(constants[arg].lookup(context))
+
+            elif opcode == JUMP_IF_NOT_NONE:
+                if stack[-1] is None:
+                    pop()
+                else:
+                    pc = arg
+
+            elif opcode == REMEMBER:
+                constants[arg].remember(context, stack[-1])
+
+            elif opcode == RESET_HOISTED:
+                constants[arg].reset()
+
+            elif opcode == LOAD_SLOT:
+                slot, name = constants[arg]
+                value = storage.slots[slot] or storage.get(name)
+                if not value:
+                    start_pos, end_pos = spans[(pc >> 1) - 1]
+                    return result.failure(RuntimeIssue(
+                        start_pos, end_pos,
+                        f"'{name}' ain't defined",
+                        context
+                    ))
+                if isinstance(value, BaseFunction): value = value.copy().set_context(context)
+                push(value)
+
+            elif opcode == STORE_SLOT:
+                storage.slots[arg] = stack[-1]
+
+            elif opcode == TAIL_CALL:
+                args = stack[len(stack) - arg:]
+                del stack[len(stack) - arg:]
+                func = pop()
+                if type(func) is CustomFunction:
+                    return result.success(TailCall(func, args))
+                call_result = func.execute(args)
+                if call_result.error: return result.failure(call_result.error)
+                push(call_result.value)
+
+            elif opcode == INLINE_CALL:
+                site, count, end, tail = constants[arg]
+                args = stack[len(stack) - count:]
+                del stack[len(stack) - count:]
+                if site.anonymous or site.matches(stack[-1]):
+                    if not site.anonymous: pop()
+                    # The caller's context waits under the body's values until INLINE_RETURN
+                    push(context)
+                    context = site.enter(context, args)
+                    storage = context.symbol_storage
+                else:
+                    site.misses += 1
+                    func = pop().copy().set_position(*spans[(pc >> 1) - 1]).set_context(context)
+                    if type(func) is CustomFunction:
+                        if tail: return result.success(TailCall(func, args))
+                        call_result = self.call(func, args)
+                    else:
+                        call_result = func.execute(args)
+                    if call_result.error: return result.failure(call_result.error)
+                    value = call_result.value
+                    if isinstance(value, BaseFunction): value = value.copy().set_context(context)
+                    push(value)
+                    pc = end
+
+            elif opcode == INLINE_RETURN:
+                value = pop()
+                context = pop()
+                storage = context.symbol_storage
+                if isinstance(value, BaseFunction): value = value.copy().set_context(context)
+                push(value)
+
+            elif opcode == LOAD_CALLEE:
+                slot, name, cache = constants[arg]
+                value = cache.get(storage) if slot is None else storage.slots[slot] or storage.get(name)
+                if not value:
+                    start_pos, end_pos = spans[(pc >> 1) - 1]
+                    return result.failure(RuntimeIssue(
+                        start_pos, end_pos,
+                        f"'{name}' ain't defined",
+                        context
+                    ))
+                push(value)
+
+            else:
+                raise Exception(f'Unknown opcode {opcode}')
@@ -0,0 +1,480 @@
+from types import FunctionType
+
+from .runtime_result import RuntimeResult, TailCall
+from .values import NumericValue, TextValue, Collection, number
+from .values import BaseFunction, CustomFunction
+from .errors import RuntimeIssue
+from .nodes import ConditionalNode, FunctionCallNode, InlinedCallNode
+from .nodes import NumericLiteralNode, VariableAccessNode, BinaryOperationNode, UnaryOperationNode
+from .nodes import cached_form, cache_form
+from .operation_cache import RAW_OPERATORS, raw_unary, unary_spans
+from .constants import *
+
+class ClosureCompiler:
+    """Turns each node into a Python closure once, then runs the closures.
+
+    A closure takes a context and returns (value, issue) like the value
+    operations do. Everything CodeRunner looks up on every visit, such as
+    the operator, names and positions, is bound when the closure is built,
+    and results, errors and tracebacks match CodeRunner's. Function and
+    loop bodies are compiled the first time they run, and the closure built
+    for a node is cached on it.
+    """
+    def evaluate(self, node, context):
+        result = RuntimeResult()
+        value, issue = self.compiled(node)(context)
+        if issue: return result.failure(issue)
+        return result.success(value)
+
+    def compiled(self, node, compiler=None):
+        run = getattr(node, 'compiled', None)
+        if type(run) is not FunctionType:
+            run = cached_form(node, FunctionType) or cache_form(node, (compiler or self.compile)(node))
+        return run
+
+    def compile(self, node):
+        method_name = f'compile_{type(node).__name__}'
+        method = getattr(self, method_name, self.no_method_found)
+        return method(node)
+
+    def no_method_found(self, node):
+        raise Exception(f'No handler for {type(node).__name__}')
+
+    def call(self, func, args):
+        while True:
+            exec_context = func.create_context()
+            check = func.check_and_populate_args(func.param_names, args, exec_context)
+            if check.error: return None, check.error
+            value, issue = self.compiled(func.body_node, self.compile_tail)(exec_context)
+            if type(value) is not TailCall: return value, issue
+            func, args = value.func, value.args
+
+    def compile_tail(self, node):
+        """compile() for the body of a function, whose calls in tail position return a TailCall"""
+        if type(node) is ConditionalNode:
+            return self.compile_ConditionalNode(node, self.compile_tail)
+        if type(node) is FunctionCallNode:
+            return self.compile_FunctionCallNode(node, tail=True)
+        if type(node) is InlinedCallNode:
+            return self.compile_InlinedCallNode(node, tail=True)
+        return self.compile(node)
+
+    def compile_NumericLiteralNode(self, node):
+        # Shared by every run, see BaseType
+        value = number(node.token.value)
+
+        def run(context):
+            return value, None
+        return run
+
+    def compile_TextLiteralNode(self, node):
+        value = TextValue(node.token.value)
+
+        def run(context):
+            return value, None
+        return run
+
+    def compile_CollectionNode(self, node):
+        item_runs = [self.compile(item_node) for item_node in node.items]
+
+        if node.discard:
+            def run(context):
+                for item_run in item_runs:
+                    _, issue = item_run(context)
+                    if issue: return None, issue
+                return None, None
+            return run
+
+        def run(context):
+            items = []
+            for item_run in item_runs:
+                value, issue = item_run(context)
+                if issue: return None, issue
+                items.append(value)
+            return Collection(items), None
+        return run
+
+    def compile_VariableAccessNode(self, node, callee=False):
+        # A callee is left for the call to copy, any other read is as in CodeRunner.process_VariableAccessNode
+        var_name = node.token.value
+        slot = node.slot
+        start_pos, end_pos = node.start_pos, node.end_pos
+
+        lookup = node.name_cache().get
+
+        def by_name(context):
+            value = lookup(context.symbol_storage)
+            if not value:
+                return None, RuntimeIssue(
+                    start_pos, end_pos,
+                    f"'{var_name}' ain't defined",
+                    context
+                )
+            if not callee and isinstance(value, BaseFunction): return value.copy().set_context(context), None
+            return value, None
+
+        if slot is None: return by_name
+
+        def run(context):
+            value = context.symbol_storage.slots[slot]
+            if value is None: return by_name(context)
+            if not callee and isinstance(value, BaseFunction): return value.copy().set_context(context), None
+            return value, None
+        return run
+
+    def compile_callee(self, node):
+        if type(node) is VariableAccessNode: return self.compile_VariableAccessNode(node, callee=True)
+        return self.compile(node)
+
+    def compile_VariableAssignmentNode(self, node):
+        var_name = node.token.value
+        slot = node.slot
+        value_run = self.compile(node.value_node)
+
+        if slot is None:
+            def run(context):
+                value, issue = value_run(context)
+                if issue: return None, issue
+                context.symbol_storage.add(var_name, value)
+                return value, None
+        else:
+            def run(context):
+                value, issue = value_run(context)
+                if issue: return None, issue
+                context.symbol_storage.slots[slot] = value
+                return value, None
+        return run
+
+    def compile_BinaryOperationNode(self, node, boxed=False):
+        if node.numeric and not boxed:
+            return self.compile_unboxed(node, self.compile_BinaryOperationNode)
+        left_run = self.compile(node.left_node)
+        right_run = self.compile(node.right_node)
+        op_token = node.op_token
+        start_pos, end_pos = node.start_pos, node.end_pos
+        cache = node.operation_cache()
+
+        if cache is None:
+            def run(context):
+                left, issue = left_run(context)
+                if issue: return None, issue
+                right, issue = right_run(context)
+                if issue: return None, issue
+                return None, RuntimeIssue(
+                    start_pos, end_pos,
+                    f"Unknown operator: {op_token}",
+                    context
+                )
+            return run
+
+        operate = cache.run
+
+        def run(context):
+            left, issue = left_run(context)
+            if issue: return None, issue
+            right, issue = right_run(context)
+            if issue: return None, issue
+            outcome, issue = operate(left, right)
+            if issue: return None, issue.locate(cache.spans, context)
+            return outcome, None
+        return run
+
+    def compile_UnaryOperationNode(self, node, boxed=False):
+        if node.numeric and not boxed:
+            return self.compile_unboxed(node, self.compile_UnaryOperationNode)
+        operand_run = self.compile(node.node)
+        spans = unary_spans(node)
+
+        if node.op_token.type == TT_MINUS:
+            def run(context):
+                value, issue = operand_run(context)
+                if issue: return None, issue
+                value, issue = value.multiply(NumericValue(-1))
+                if issue: return None, issue.locate(spans, context)
+                return value, None
+        elif node.op_token.matches(TT_KEYWORD, 'AIN\'T'):
+            def run(context):
+                value, issue = operand_run(context)
+                if issue: return None, issue
+                value, issue = value.logical_not()
+                if issue: return None, issue.locate(spans, context)
+                return value, None
+        else:
+            return operand_run
+        return run
+
+    def compile_unboxed(self, node, compile_boxed):
+        """Runs a tree Optimizer.infer_types marked numeric on plain numbers, making one value at the end"""
+        raw_run = self.compile_raw(node)
+        boxed_run = None
+
+        def run(context):
+            nonlocal boxed_run
+            try:
+                return number(raw_run(context)), None
+            except ZeroDivisionError:
+                # Run again on values, which reports it where CodeRunner does
+                if boxed_run is None: boxed_run = compile_boxed(node, boxed=True)
+                return boxed_run(context)
+        return run
+
+    def compile_raw(self, node):
+        """A closure returning the plain number a tree marked numeric evaluates to"""
+        node_type = type(node)
+        if node_type is NumericLiteralNode:
+            value = node.token.value
+            return lambda context: value
+
+        if node_type is VariableAccessNode:
+            if node.slot is None:
+                lookup = node.name_cache().get
+                return lambda context: lookup(context.symbol_storage).value
+            slot, var_name = node.slot, node.token.value
+
+            def run(context):
+                storage = context.symbol_storage
+                return (storage.slots[slot] or storage.get(var_name)).value
+            return run
+
+        if node_type is BinaryOperationNode:
+            operation = RAW_OPERATORS[node.operation_cache().method_name]
+            left_run, right_run = self.compile_raw(node.left_node), self.compile_raw(node.right_node)
+            if type(node.right_node) is NumericLiteralNode:
+                value = node.right_node.token.value
+                return lambda context: operation(left_run(context), value)
+            return lambda context: operation(left_run(context), right_run(context))
+
+        if node_type is UnaryOperationNode:
+            operation, operand_run = raw_unary(node.op_token), self.compile_raw(node.node)
+            return lambda context: operation(operand_run(context))
+
+        # A node keeping whole values, as in CodeRunner.evaluate_raw
+        value_run = self.compile(node)
+
+        def run(context):
+            value, issue = value_run(context)
+            if issue: raise ZeroDivisionError
+            return value.value
+        return run
+
+    def compile_ConditionalNode(self, node, compile_expr=None):
+        compile_expr = compile_expr or self.compile
+        case_runs = [(self.compile(condition), compile_expr(expr)) for condition, expr in node.cases]
+        default_run = compile_expr(node.default_case) if node.default_case else None
+
+        def run(context):
+            for condition_run, expr_run in case_runs:
+                condition_value, issue = condition_run(context)
+                if issue: return None, issue
+                if condition_value.is_true():
+                    return expr_run(context)
+            if default_run:
+                return default_run(context)
+            return None, None
+        return run
+
+    def compile_LoopNode(self, node):
+        start_run = self.compile(node.start_value)
+        end_run = self.compile(node.end_value)
+        step_run = self.compile(node.step_value) if node.step_value else None
+        var_name = node.var_token.value
+        body = node.body
+        discard = node.discard
+        start_pos, end_pos = node.start_pos, node.end_pos
+
+        def run(context):
+            start_val, issue = start_run(context)
+            if issue: return None, issue
+            end_val, issue = end_run(context)
+            if issue: return None, issue
+            if step_run:
+                step_val, issue = step_run(context)
+                if issue: return None, issue
+            else:
+                step_val = NumericValue(1)
+
+            if step_val.value == 0:
+                return None, RuntimeIssue(
+                    start_pos, end_pos,
+                    "Step value cannot be zero",
+                    context
+                )
+
+            current = start_val.value
+            step = step_val.value
+            ascending = step > 0
+            end = end_val.value
+            body_run = self.compiled(body)
+            add = context.symbol_storage.add
+
+            if discard:
+                while (current <= end) if ascending else (current >= end):
+                    add(var_name, number(current))
+                    _, issue = body_run(context)
+                    if issue: return None, issue
+                    current += step
+                return None, None
+
+            items = []
+            while (current <= end) if ascending else (current >= end):
+                add(var_name, number(current))
+                value, issue = body_run(context)
+                if issue: return None, issue
+                items.append(value)
+                current += step
+            return Collection(items), None
+        return run
+
+    def compile_WhileLoopNode(self, node):
+        condition_run = self.compile(node.condition)
+        body = node.body
+
+        if node.discard:
+            def run(context):
+                body_run = None
+                while True:
+                    condition, issue = condition_run(context)
+                    if issue: return None, issue
+                    if not condition.is_true(): return None, None
+                    if body_run is None: body_run = self.compiled(body)
+                    _, issue = body_run(context)
+                    if issue: return None, issue
+            return run
+
+        def run(context):
+            body_run = None
+            items = []
+
+            while True:
+                condition, issue = condition_run(context)
+                if issue: return None, issue
+                if not condition.is_true(): break
+                if body_run is None: body_run = self.compiled(body)
+                value, issue = body_run(context)
+                if issue: return None, issue
+                items.append(value)
+            return Collection(items), None
+        return run
+
+    def compile_HoistedLoopNode(self, node):
+        loop_run = self.compile(node.loop_node)
+        reset = node.reset
+
+        def run(context):
+            reset()
+            return loop_run(context)
+        return run
+
+    def compile_HoistedNode(self, node):
+        value_run = self.compile_SharedNode(node)
+        lookup = node.lookup
+
+        def run(context):
+            value = lookup(context)
+            if value is not None: return value, None
+            return value_run(context)
+        return run
+
+    def compile_SharedNode(self, node):
+        value_run = self.compile(node.node)
+        remember = node.remember
+
+        def run(context):
+            value, issue = value_run(context)
+            if issue: return None, issue
+            remember(context, value)
+            return value, None
+        return run
+
+    def compile_ReusedNode(self, node):
+        value_run = self.compile(node.node)
+        lookup = node.shared.lookup
+
+        def run(context):
+            value = lookup(context)
+            if value is None: return value_run(context)
+            return value, None
+        return run
+
+    def compile_FunctionDefinitionNode(self, node):
+        func_name = node.func_name_token.value if node.func_name_token else None
+        param_names = [param.value for param in node.param_tokens]
+        body_node = node.body_node
+        layout = node.layout
+        start_pos, end_pos = node.start_pos, node.end_pos
+
+        def run(context):
+            func_value = CustomFunction(func_name, body_node, param_names, layout)
+            func_value.set_context(context)
+            func_value.set_position(start_pos, end_pos)
+            if func_name is not None:
+                context.symbol_storage.add(func_name, func_value)
+            return func_value, None
+        return run
+
+    def compile_FunctionCallNode(self, node, tail=False):
+        func_run = self.compile_callee(node.func_node)
+        arg_runs = [self.compile(arg_node) for arg_node in node.arg_nodes]
+        start_pos, end_pos = node.start_pos, node.end_pos
+        named = type(node.func_node) is VariableAccessNode
+
+        def run(context):
+            func_to_call, issue = func_run(context)
+            if issue: return None, issue
+            func_to_call = func_to_call.copy().set_position(start_pos, end_pos)
+            if named: func_to_call.set_context(context)
+
+            args = []
+            for arg_run in arg_runs:
+                value, issue = arg_run(context)
+                if issue: return None, issue
+                args.append(value)
+
+            if type(func_to_call) is CustomFunction:
+                if tail: return TailCall(func_to_call, args), None
+                return_value, issue = self.call(func_to_call, args)
+                if issue: return None, issue
+            else:
+                call_result = func_to_call.execute(args)
+                if call_result.error: return None, call_result.error
+                return_value = call_result.value
+            if isinstance(return_value, BaseFunction): return return_value.copy().set_context(context), None
+            return return_value, None
+        return run
+
+    def compile_InlinedCallNode(self, node, tail=False):
+        call = node.call
+        func_run = None if node.anonymous else self.compile_callee(call.func_node)
+        arg_runs = [self.compile(arg_node) for arg_node in call.arg_nodes]
+        body_run = self.compile(node.function.body_node)
+        matches, enter = node.matches, node.enter
+        start_pos, end_pos = call.start_pos, call.end_pos
+
+        def run(context):
+            if func_run:
+                func_to_call, issue = func_run(context)
+                if issue: return None, issue
+
+            args = []
+            for arg_run in arg_runs:
+                value, issue = arg_run(context)
+                if issue: return None, issue
+                args.append(value)
+
+            if not func_run or matches(func_to_call):
+                return_value, issue = body_run(enter(context, args))
+                if issue: return None, issue
+            else:
+                node.misses += 1
+                func_to_call = func_to_call.copy().set_position(start_pos, end_pos).set_context(context)
+                if type(func_to_call) is CustomFunction:
+                    if tail: return TailCall(func_to_call, args), None
+                    return_value, issue = self.call(func_to_call, args)
+                    if issue: return None, issue
+                else:
+                    call_result = func_to_call.execute(args)
+                    if call_result.error: return None, call_result.error
+                    return_value = call_result.value
+            if isinstance(return_value, BaseFunction): return return_value.copy().set_context(context), None
+            return return_value, None
+        return run
@@ -1,6 +1,16 @@
 class ExecutionContext:
+    # Name of the engine in init.ENGINES, set on the context a run starts from
+    engine = None
+
     def __init__(self, name, parent=None, entry_pos=None):
         self.name = name
         self.parent = parent
         self.entry_pos = entry_pos
-        self.symbol_storage = None
\ No newline at end of file
+        self.symbol_storage = None
+
+    def running_engine(self):
+        """The engine of the run this context belongs to"""
+        context = self
+        while context.engine is None and context.parent is not None:
+            context = context.parent
+        return context.engine
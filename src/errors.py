@@ -1,14 +1,20 @@
-from .position import TextPosition
+from .position import source_for
 class Issue:
     def __init__(self, start_pos, end_pos, issue_type, details):
         self.start_pos = start_pos
         self.end_pos = end_pos
         self.issue_type = issue_type
         self.details = details
+        # An issue can outlive the tree it points into, so it keeps the maps it shows
+        self.sources = self.shown_sources()
+
+    def shown_sources(self):
+        return set() if self.start_pos is None else {source_for(self.start_pos)}
         
     def display_error(self):
         result = f'Cattywampus! {self.issue_type}: {self.details}\n'
-        result += f'File {self.start_pos.filename}, line {self.start_pos.line + 1}'
+        source = source_for(self.start_pos)
+        result += f'File {source.filename}, line {source.line(self.start_pos) + 1}'
         return result
 
 class BadCharacterError(Issue):
@@ -25,8 +31,18 @@ class SyntaxIssue(Issue):
 
 class RuntimeIssue(Issue):
     def __init__(self, start_pos, end_pos, details, context):
-        super().__init__(start_pos, end_pos, 'Runtime Problem', details)
         self.context = context
+        super().__init__(start_pos, end_pos, 'Runtime Problem', details)
+
+    def shown_sources(self):
+        sources = set()
+        pos = self.start_pos
+        ctx = self.context
+        while ctx and pos is not None:
+            sources.add(source_for(pos))
+            pos = ctx.entry_pos
+            ctx = ctx.parent
+        return sources
         
     def display_error(self):
         result = self.generate_traceback()
@@ -34,13 +50,34 @@ class RuntimeIssue(Issue):
         return result
         
     def generate_traceback(self):
-        result = ''
+        lines = []
         pos = self.start_pos
         ctx = self.context
         
         while ctx:
-            result = f'File {pos.filename}, line {pos.line + 1}, in {ctx.name}\n' + result
+            source = source_for(pos)
+            lines.append(f'File {source.filename}, line {source.line(pos) + 1}, in {ctx.name}\n')
             pos = ctx.entry_pos
             ctx = ctx.parent
             
-        return result
\ No newline at end of file
+        # Built innermost first, so joining costs one pass however deep the calls went
+        return ''.join(reversed(lines))
+
+class OperationIssue(RuntimeIssue):
+    """RuntimeIssue of an operation on values, which carry no position or context.
+
+    operands says whose spans it covers, first and last, with 0 for the value
+    the operation ran on and 1 for the other one. The engine that ran the
+    operation calls locate() with the spans of its operand nodes.
+    """
+    def __init__(self, details, first=0, last=1):
+        super().__init__(None, None, details, None)
+        self.operands = (first, last)
+
+    def locate(self, spans, context):
+        first, last = self.operands
+        self.start_pos = spans[first][0]
+        self.end_pos = spans[last][1]
+        self.context = context
+        self.sources = self.shown_sources()
+        return self
\ No newline at end of file
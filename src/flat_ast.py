@@ -0,0 +1,183 @@
+from array import array
+
+from .tokens import Token
+from .nodes import *
+from .position import source_for
+
+TOKEN, TOKENS, NODE, NODES, CASES, POSITION = range(6)
+
+NODE_LAYOUTS = {
+    NumericLiteralNode: (TOKEN,),
+    TextLiteralNode: (TOKEN,),
+    CollectionNode: (NODES, POSITION, POSITION),
+    VariableAccessNode: (TOKEN,),
+    VariableAssignmentNode: (TOKEN, NODE),
+    BinaryOperationNode: (NODE, TOKEN, NODE),
+    UnaryOperationNode: (TOKEN, NODE),
+    ConditionalNode: (CASES, NODE),
+    LoopNode: (TOKEN, NODE, NODE, NODE, NODE),
+    WhileLoopNode: (NODE, NODE),
+    FunctionDefinitionNode: (TOKEN, TOKENS, NODE),
+    FunctionCallNode: (NODE, NODES),
+}
+NODE_CLASSES = list(NODE_LAYOUTS)
+NODE_CODES = {node_class: code for code, node_class in enumerate(NODE_CLASSES)}
+MISSING = -1
+
+class FlatTree:
+    """Array-backed form of a syntax tree, for storing very large programs.
+
+    Nothing evaluates it: script_cache keeps it in .ssc files and the
+    engines run the node objects to_tree() builds back.
+
+    Nodes are numbered in post-order, so children come before their parent
+    and the root is last. kinds holds each node's class code and operands
+    holds its fields in layout order, starting at operand_starts[node]:
+    token and node indexes, counts before lists, and file offsets. Tokens
+    live in parallel columns whose types and values index into two pools.
+    """
+    def __init__(self, base=0):
+        self.base = base
+        self.kinds = array('B')
+        self.operand_starts = array('q')
+        self.operands = array('q')
+        self.token_types = array('B')
+        self.token_values = array('q')
+        self.token_starts = array('q')
+        self.token_ends = array('q')
+        self.type_pool = []
+        self.literal_pool = []
+
+    def __len__(self):
+        return len(self.kinds)
+
+    @classmethod
+    def from_tree(cls, syntax_tree):
+        tree = cls(source_for(syntax_tree.start_pos).base)
+        node_indexes = {}
+        token_indexes = {}
+        type_indexes = {}
+        literal_indexes = {}
+        stack = [(syntax_tree, False)]
+
+        def token_index(token):
+            if token is None: return MISSING
+            index = token_indexes.get(id(token))
+            if index is not None: return index
+
+            type_index = type_indexes.get(token.type)
+            if type_index is None:
+                type_index = type_indexes[token.type] = len(tree.type_pool)
+                tree.type_pool.append(token.type)
+            # Keyed by type as well, see CodeObject.constant
+            key = (type(token.value), token.value)
+            literal_index = literal_indexes.get(key)
+            if literal_index is None:
+                literal_index = literal_indexes[key] = len(tree.literal_pool)
+                tree.literal_pool.append(token.value)
+
+            index = token_indexes[id(token)] = len(tree.token_types)
+            tree.token_types.append(type_index)
+            tree.token_values.append(literal_index)
+            tree.token_starts.append(token.start_pos - tree.base)
+            tree.token_ends.append(token.end_pos - tree.base)
+            return index
+
+        def node_index(node):
+            return MISSING if node is None else node_indexes[id(node)]
+
+        while stack:
+            node, visited = stack.pop()
+            if node is None: continue
+            layout = NODE_LAYOUTS[type(node)]
+            values = [getattr(node, name) for name in node.fields]
+
+            if not visited:
+                stack.append((node, True))
+                children = []
+                for kind, value in zip(layout, values):
+                    if kind == NODE: children.append(value)
+                    elif kind == NODES: children.extend(value)
+                    elif kind == CASES:
+                        for case in value: children.extend(case)
+                stack.extend((child, False) for child in reversed(children))
+                continue
+
+            operands = tree.operands
+            node_indexes[id(node)] = len(tree.kinds)
+            tree.kinds.append(NODE_CODES[type(node)])
+            tree.operand_starts.append(len(operands))
+
+            for kind, value in zip(layout, values):
+                if kind == TOKEN:
+                    operands.append(token_index(value))
+                elif kind == NODE:
+                    operands.append(node_index(value))
+                elif kind == POSITION:
+                    operands.append(value - tree.base)
+                else:
+                    operands.append(len(value))
+                    if kind == TOKENS:
+                        operands.extend(map(token_index, value))
+                    elif kind == NODES:
+                        operands.extend(map(node_index, value))
+                    else:
+                        for case in value: operands.extend(map(node_index, case))
+
+        return tree
+
+    def to_tree(self, base=None):
+        """Build the node objects back, with positions relative to base"""
+        if base is None: base = self.base
+        literal_pool = self.literal_pool
+        type_pool = self.type_pool
+        tokens = list(map(
+            Token,
+            [type_pool[index] for index in self.token_types],
+            [literal_pool[index] for index in self.token_values],
+            [start + base for start in self.token_starts],
+            [end + base for end in self.token_ends]
+        ))
+        nodes = []
+        operands = iter(self.operands)
+
+        for code in self.kinds:
+            node_class = NODE_CLASSES[code]
+            fields = []
+
+            for kind in NODE_LAYOUTS[node_class]:
+                index = next(operands)
+                if kind == TOKEN:
+                    fields.append(None if index == MISSING else tokens[index])
+                elif kind == NODE:
+                    fields.append(None if index == MISSING else nodes[index])
+                elif kind == POSITION:
+                    fields.append(index + base)
+                elif kind == TOKENS:
+                    fields.append([tokens[next(operands)] for _ in range(index)])
+                elif kind == NODES:
+                    fields.append([nodes[next(operands)] for _ in range(index)])
+                else:
+                    fields.append([(nodes[next(operands)], nodes[next(operands)]) for _ in range(index)])
+
+            nodes.append(node_class(*fields))
+
+        return nodes[-1]
+
+    def state(self):
+        """Plain bytes, lists and ints that marshal can store"""
+        arrays = (self.kinds, self.operand_starts, self.operands, self.token_types,
+                  self.token_values, self.token_starts, self.token_ends)
+        return (self.base, [column.tobytes() for column in arrays], self.type_pool, self.literal_pool)
+
+    @classmethod
+    def from_state(cls, state):
+        base, columns, type_pool, literal_pool = state
+        tree = cls(base)
+        arrays = (tree.kinds, tree.operand_starts, tree.operands, tree.token_types,
+                  tree.token_values, tree.token_starts, tree.token_ends)
+        for column, data in zip(arrays, columns):
+            column.frombytes(data)
+        tree.type_pool = type_pool
+        tree.literal_pool = literal_pool
+        return tree
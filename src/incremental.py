@@ -0,0 +1,321 @@
+from bisect import bisect_left, bisect_right
+
+from .table_lexer import TableTokenMaker
+from .parser import CodeParser
+from .position import register_document, keep_source
+from .tokens import Token
+from .nodes import TokenNode, iter_child_nodes
+from .constants import *
+
+RELEX_WINDOW = 256
+
+def start_of(token):
+    return token.start_pos
+
+def index_of(tokens, token):
+    index = bisect_left(tokens, token.start_pos, key=start_of)
+    if index < len(tokens) and tokens[index] is token:
+        return index
+    return None
+
+class SpanParser(CodeParser):
+    """CodeParser that remembers the first and following token of every parsed expression"""
+    def __init__(self, tokens, spans):
+        self.spans = spans
+        super().__init__(tokens)
+
+    def parse_expression(self):
+        first_token = self.current_token
+        result = super().parse_expression()
+        if not result.error:
+            self.spans.setdefault(id(result.node), (result.node, first_token, self.current_token))
+        return result
+
+class IncrementalDocument:
+    """Keeps the tokens and syntax tree of an edited buffer up to date.
+
+    An edit re-lexes from the token before the change until the new tokens
+    line up with the old ones again, then re-parses only the innermost
+    expression that contains every changed token. Unchanged tokens and
+    nodes are reused. Positions map through the document's own
+    DocumentSourceMap, which stores the ones after the last edit counted
+    from the end of the text, so an edit recodes only what lies between it
+    and the one before rather than shifting everything after it. Every tree
+    the document makes keeps the map alive, so a tree can outlive it.
+    """
+    def __init__(self, filename, text=''):
+        self.filename = filename
+        self.source = register_document(filename)
+        self.relexed_tokens = 0
+        self.reparsed_tokens = 0
+        self.rebuild(text)
+
+    def rebuild(self, text):
+        self.set_text(text)
+        tokens, issue = TableTokenMaker(self.filename, text, self.source).generate_tokens()
+        self.relexed_tokens = len(tokens)
+        self.tokens = None if issue else tokens
+        self.issue = issue
+        self.tree = None
+        self.spans = {}
+        if not issue: self.reparse_all()
+        return self.tree, self.issue
+
+    def set_text(self, text):
+        self.text = text
+        self.source.reset(text)
+
+    def edit(self, offset, deleted, inserted):
+        text = self.text[:offset] + inserted + self.text[offset + deleted:]
+        if self.tokens is None:
+            return self.rebuild(text)
+
+        tokens = self.tokens
+        first, resync, middle, issue = self.relex(text, offset, deleted, inserted)
+        self.relexed_tokens = len(middle or ())
+
+        if issue:
+            self.set_text(text)
+            self.tokens = None
+            self.issue = issue
+            self.tree = None
+            self.spans = {}
+            return self.tree, self.issue
+
+        # The tokens kept after the change, and all that follows them, move with the end of the text
+        self.move_gap(self.source.offset(tokens[resync].start_pos) if resync < len(tokens) else len(self.text) + 1)
+        moved = self.tree is not None and self.move_tokens(first, resync, middle)
+        self.text = text
+        self.source.replace(offset, deleted, inserted)
+        self.reparsed_tokens = 0
+        if moved: return self.tree, self.issue
+
+        tokens[first:resync] = middle
+        if self.tree is None:
+            self.reparse_all()
+        else:
+            self.reparse(first, len(middle))
+        return self.tree, self.issue
+
+    def relex(self, text, offset, deleted, inserted):
+        tokens = self.tokens
+        source = self.source
+        base = source.base
+        delta = len(inserted) - deleted
+        start_offset, end_offset = self.start_offset, self.end_offset
+        # Old tokens are stored around the gap and new ones as they are, so both are compared by offset
+        first = bisect_left(tokens, offset, key=end_offset)
+        resume = base + offset + len(inserted)
+        scanner = TableTokenMaker(self.filename, text, source)
+        position = end_offset(tokens[first - 1]) if first else 0
+        window = RELEX_WINDOW
+        middle = []
+
+        while True:
+            final = position + window >= len(text)
+            chunk = text[position:] if final else text[position:position + window]
+            found, stop, issue = scanner.scan(chunk, position, final)
+            if issue: return first, None, None, issue
+
+            for index, token in enumerate(found):
+                if token.start_pos < resume: continue
+                old_start = token.start_pos - base - delta
+                resync = bisect_left(tokens, old_start, lo=first, key=start_offset)
+                if resync < len(tokens) and start_offset(tokens[resync]) == old_start:
+                    middle.extend(found[:index])
+                    return first, resync, middle, None
+
+            middle.extend(found)
+            if final:
+                if start_offset(tokens[-1]) + delta == position + stop:
+                    return first, len(tokens) - 1, middle, None
+                middle.append(Token(TT_EOF, start_pos=base + position + stop))
+                return first, len(tokens), middle, None
+
+            position += stop
+            window *= 2
+
+    def start_offset(self, item):
+        return self.source.offset(item.start_pos)
+
+    def end_offset(self, item):
+        return self.source.offset(item.end_pos)
+
+    def move_gap(self, gap):
+        """Move the gap of the document's map to offset gap, recoding the positions in between"""
+        source = self.source
+        low, high = sorted((source.gap, gap))
+        source.move_gap(gap)
+
+        tokens = self.tokens
+        start = bisect_left(tokens, low, key=self.end_offset)
+        end = bisect_right(tokens, high, key=self.start_offset)
+        for token in tokens[start:end]:
+            token.start_pos = source.recode(token.start_pos)
+            token.end_pos = source.recode(token.end_pos)
+
+        stack = [self.tree] if self.tree is not None else []
+        while stack:
+            node = stack.pop()
+            # Engines bake positions into what they compile, so it goes stale too
+            node.compiled = None
+            # Token nodes take their positions from tokens, recoded above
+            if not isinstance(node, TokenNode):
+                node.start_pos = source.recode(node.start_pos)
+                node.end_pos = source.recode(node.end_pos)
+            stack.extend(child for child, _, _, _ in self.child_slots(node, low, high))
+
+    def child_slots(self, node, low, high):
+        """iter_child_slots for the children of node that may hold offsets from low to high.
+
+        Children come in the order of their text, so nothing under one comes
+        after the start of the next, and long lists of them are bisected.
+        """
+        slots = []
+        for name in node.fields:
+            value = getattr(node, name)
+            if not isinstance(value, list):
+                if hasattr(value, 'fields'): slots.append((value, name, None, None))
+            elif value and hasattr(value[0], 'fields'):
+                start = max(bisect_left(value, low, key=self.start_offset) - 1, 0)
+                end = bisect_right(value, high, key=self.start_offset)
+                slots.extend((value[index], name, index, None) for index in range(start, end))
+            else:
+                for index, item in enumerate(value):
+                    if isinstance(item, tuple):
+                        for subindex, part in enumerate(item):
+                            if hasattr(part, 'fields'):
+                                slots.append((part, name, index, subindex))
+
+        for index, slot in enumerate(slots):
+            if self.start_offset(slot[0]) > high: break
+            if index + 1 < len(slots) and self.start_offset(slots[index + 1][0]) < low: continue
+            yield slot
+
+    def move_tokens(self, first, resync, middle):
+        """If the tokens from first to resync are those of middle but for their positions, as
+        after an edit of spaces or comments, move them and the nodes that copy their positions
+        to where middle's are, returning whether they were"""
+        tokens = self.tokens
+        if resync - first != len(middle): return False
+        new_positions = {}
+        for token, new in zip(tokens[first:resync], middle):
+            if token.type != new.type or token.value != new.value: return False
+            new_positions[token.start_pos] = new.start_pos
+            new_positions[token.end_pos] = new.end_pos
+        if not middle: return True
+
+        low, high = self.start_offset(tokens[first]), self.end_offset(tokens[resync - 1])
+        stack = [self.tree]
+        while stack:
+            node = stack.pop()
+            node.compiled = None
+            if not isinstance(node, TokenNode):
+                node.start_pos = new_positions.get(node.start_pos, node.start_pos)
+                node.end_pos = new_positions.get(node.end_pos, node.end_pos)
+            stack.extend(child for child, _, _, _ in self.child_slots(node, low, high))
+
+        for token, new in zip(tokens[first:resync], middle):
+            token.start_pos, token.end_pos = new.start_pos, new.end_pos
+        return True
+
+    def reparse_all(self):
+        spans = {}
+        result = SpanParser(self.tokens, spans).parse()
+        self.reparsed_tokens = len(self.tokens)
+        self.issue = result.error
+        self.tree = None if result.error else result.node
+        self.spans = {} if result.error else spans
+        if self.tree is not None: keep_source(self.tree, self.source)
+
+    def reparse(self, first, count):
+        tokens = self.tokens
+        if first + count >= len(tokens):
+            return self.reparse_all()
+
+        low = tokens[first - 1].end_pos if first else tokens[0].start_pos
+        high = tokens[first + count].start_pos
+        path = self.find_path(low, high)
+
+        for depth in range(len(path) - 1, -1, -1):
+            node = path[depth][0]
+            span = self.spans.get(id(node))
+            if span is None or span[0] is not node: continue
+
+            _, first_token, follow_token = span
+            start = index_of(tokens, first_token)
+            end = index_of(tokens, follow_token)
+            # The parser picks its next rule by looking at the current token, so the
+            # expression must start before the damage for the re-parse to be faithful
+            if start is None or end is None or start >= first or end < first + count: continue
+
+            spans = {}
+            # Read lazily, as the parser stops at follow_token
+            parser = SpanParser(map(tokens.__getitem__, range(start, len(tokens))), spans)
+            result = parser.parse_expression()
+            if result.error or parser.current_token is not follow_token: continue
+
+            self.splice(path, depth, result.node, spans)
+            self.reparsed_tokens = end - start
+            return
+
+        self.reparse_all()
+
+    def find_path(self, low, high):
+        offset = self.source.offset
+        low, high = offset(low), offset(high)
+        path = [(self.tree, None)]
+
+        while True:
+            hits = []
+            for child, name, index, subindex in self.child_slots(path[-1][0], low, high):
+                span = self.spans.get(id(child))
+                extent = span[2].start_pos if span is not None and span[0] is child else child.end_pos
+                if offset(child.start_pos) <= high and offset(extent) >= low:
+                    hits.append((child, (path[-1][0], name, index, subindex)))
+            if len(hits) != 1: return path
+            path.append(hits[0])
+
+    def splice(self, path, depth, new_node, spans):
+        old_node, holder = path[depth]
+        stack = [old_node]
+        while stack:
+            node = stack.pop()
+            span = self.spans.get(id(node))
+            if span is not None and span[0] is node:
+                del self.spans[id(node)]
+            stack.extend(iter_child_nodes(node))
+        self.spans.update(spans)
+
+        if holder is None:
+            self.tree = new_node
+            keep_source(new_node, self.source)
+            return
+
+        parent, name, index, subindex = holder
+        if index is None:
+            setattr(parent, name, new_node)
+        elif subindex is None:
+            getattr(parent, name)[index] = new_node
+        else:
+            items = getattr(parent, name)
+            case = list(items[index])
+            case[subindex] = new_node
+            items[index] = tuple(case)
+
+        # Collections built by the parser take their span from their first and
+        # last items, so positions copied from the replaced node follow it
+        offset = self.source.offset
+        old_span = (offset(old_node.start_pos), offset(old_node.end_pos))
+        new_span = (new_node.start_pos, new_node.end_pos)
+        for ancestor, _ in reversed(path[:depth]):
+            values = []
+            for name in ancestor.fields:
+                value = getattr(ancestor, name)
+                if name == 'start_pos' and offset(value) == old_span[0]: value = new_span[0]
+                elif name == 'end_pos' and offset(value) == old_span[1]: value = new_span[1]
+                values.append(value)
+            old_span = (offset(ancestor.start_pos), offset(ancestor.end_pos))
+            ancestor.__init__(*values)
+            ancestor.compiled = None
+            new_span = (ancestor.start_pos, ancestor.end_pos)
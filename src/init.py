@@ -1,11 +1,49 @@
+from threading import Lock
+
 from .lexer import TokenMaker
+from .table_lexer import TableTokenMaker, StreamTokenMaker
 from .parser import CodeParser
+from .pratt_parser import PrattParser
 from .interpreter import CodeRunner
+from .bytecode import VirtualMachine
+from .closure_compiler import ClosureCompiler
+from .transpiler import PythonTranspiler
+from .tiered import TieredRunner
 from .context import ExecutionContext
-from .symbol_table import SymbolStorage
+from .symbol_table import SymbolStorage, release_caches
 from .values import NumericValue
 from .built_in_functions import PredefinedFunction
 from .run_function import ScriptExecutor
+from .syntax_cache import SyntaxTreeCache
+from .optimizer import Optimizer
+from .nodes import mark_discarded, count_nodes
+from .position import keep_source
+from . import script_cache
+
+LEXERS = {
+    'classic': TokenMaker,
+    'table': TableTokenMaker,
+}
+
+PARSERS = {
+    'classic': CodeParser,
+    'pratt': PrattParser,
+}
+
+ENGINES = {
+    'tree': CodeRunner,
+    'vm': VirtualMachine,
+    'closure': ClosureCompiler,
+    'python': PythonTranspiler,
+    'tiered': TieredRunner,
+}
+
+syntax_cache = SyntaxTreeCache()
+optimizer = Optimizer()
+
+# What syntax_cache is charged per node: a parsed node holds about 230 bytes,
+# some 45 times the source text it came from
+NODE_BYTES = 256
 
 def setup_global_symbols():
     storage = SymbolStorage()
@@ -17,21 +55,123 @@ def setup_global_symbols():
     storage.add("SHOVE", PredefinedFunction("SHOVE"))
     storage.add("YANK", PredefinedFunction("YANK"))
     storage.add("STACKON", PredefinedFunction("STACKON"))
+    storage.add("PILEON", PredefinedFunction("PILEON"))
+    storage.add("WHITTLE", PredefinedFunction("WHITTLE"))
+    storage.add("BEEFUP", PredefinedFunction("BEEFUP"))
+    storage.add("DIVVY", PredefinedFunction("DIVVY"))
     storage.add("FIREUP", ScriptExecutor())
     
     return storage
 
-def execute(filename, source_code, context=None):
+def parse(filename, source_code, lexer='table', parser='pratt'):
+    tokenizer = LEXERS[lexer](filename, source_code)
+    tokens, issue = tokenizer.generate_tokens()
+    if issue: return None, issue
+    syntax_tree = PARSERS[parser](tokens).parse()
+    if syntax_tree.error: return None, syntax_tree.error
+    keep_source(syntax_tree.node, tokenizer.source)
+    return syntax_tree.node, None
+
+def prepare(result, optimize, discard):
+    if optimize and not result[1]: result = optimizer.optimize(result[0]), None
+    if discard and not result[1]: mark_discarded(result[0])
+    return result
+
+def tree_size(result):
+    """Estimated bytes a parse result holds, which is what syntax_cache is charged for it"""
+    if result[1]: return NODE_BYTES
+    return NODE_BYTES * count_nodes(result[0])
+
+def parse_cached(filename, source_code, lexer='table', parser='pratt', optimize=False, discard=False):
+    key = syntax_cache.key(filename, source_code, optimize, discard)
+    cached = syntax_cache.get(key)
+    if cached is not None: return cached
+    result = prepare(parse(filename, source_code, lexer, parser), optimize, discard)
+    syntax_cache.put(key, result, tree_size(result))
+    return result
+
+def parse_stream(filename, stream, parser='pratt', digest=None):
+    tokenizer = StreamTokenMaker(filename, stream, digest=digest)
+    tokens = tokenizer.stream_tokens()
+    syntax_tree = PARSERS[parser](tokens).parse()
+    # Finish lexing so a bad character later in the file wins over a syntax error, like in parse()
+    for _ in tokens: pass
+    if tokenizer.issue: return None, tokenizer.issue
+    if syntax_tree.error: return None, syntax_tree.error
+    keep_source(syntax_tree.node, tokenizer.source)
+    return syntax_tree.node, None
+
+def parse_file(filename, parser='pratt'):
+    with open(filename, 'r') as f:
+        return read_file(filename, f, script_cache.source_digest(f), parser)
+
+def read_file(filename, f, digest, parser):
+    syntax_tree = script_cache.load(filename, digest)
+    if syntax_tree is not None: return syntax_tree, None
+    f.seek(0)
+    syntax_tree, issue = parse_stream(filename, f, parser, digest)
+    if not issue: script_cache.store(filename, digest, syntax_tree)
+    return syntax_tree, issue
+
+def parse_file_cached(filename, parser='pratt', optimize=False, discard=False):
+    """parse_file() through syntax_cache, which keeps the optimized and marked tree"""
+    with open(filename, 'r') as f:
+        digest = script_cache.source_digest(f)
+        # The digest stands in for the text, so a hit reads the file once and parses nothing
+        key = syntax_cache.key(filename, '', digest, optimize, discard)
+        cached = syntax_cache.get(key)
+        if cached is not None: return cached
+        result = read_file(filename, f, digest, parser)
+    result = prepare(result, optimize, discard)
+    syntax_cache.put(key, result, tree_size(result))
+    return result
+
+# evaluate() calls under way on any thread, more than one when FIREUP runs a
+# script. Runs share the trees in the syntax cache and the caches on them, so
+# those are let go of only once none is running
+running = 0
+running_lock = Lock()
+
+def evaluate(syntax_tree, context=None, engine='tree'):
+    global running
     if context is None:
         symbols = setup_global_symbols()
         context = ExecutionContext('<main>')
         context.symbol_storage = symbols
-    tokenizer = TokenMaker(filename, source_code)
-    tokens, issue = tokenizer.generate_tokens()
+    runner = ENGINES[engine]()
+    # So that FIREUP runs its script on the same engine
+    context.engine = engine
+    with running_lock: running += 1
+    try:
+        final_result = runner.evaluate(syntax_tree, context)
+    finally:
+        with running_lock:
+            running -= 1
+            if not running: release_caches()
+    return final_result.value, final_result.error
+
+# With discard set the caller drops a Collection result, as the REPL does, so
+# loops and collections that would only end up in it give None instead
+def execute(filename, source_code, context=None, lexer='table', parser='pratt', cache=True, engine='tree',
+            optimize=True, discard=False):
+    if cache:
+        syntax_tree, issue = parse_cached(filename, source_code, lexer, parser, optimize, discard)
+    else:
+        syntax_tree, issue = prepare(parse(filename, source_code, lexer, parser), optimize, discard)
     if issue: return None, issue
-    parser = CodeParser(tokens)
-    syntax_tree = parser.parse()
-    if syntax_tree.error: return None, syntax_tree.error
-    runner = CodeRunner()
-    final_result = runner.evaluate(syntax_tree.node, context)
-    return final_result.value, final_result.error
\ No newline at end of file
+    return evaluate(syntax_tree, context, engine)
+
+def execute_stream(filename, stream, context=None, parser='pratt', engine='tree', optimize=True, discard=False):
+    syntax_tree, issue = parse_stream(filename, stream, parser)
+    if issue: return None, issue
+    if optimize: syntax_tree = optimizer.optimize(syntax_tree)
+    if discard: mark_discarded(syntax_tree)
+    return evaluate(syntax_tree, context, engine)
+
+def execute_file(filename, context=None, parser='pratt', cache=True, engine='tree', optimize=True, discard=False):
+    if cache:
+        syntax_tree, issue = parse_file_cached(filename, parser, optimize, discard)
+    else:
+        syntax_tree, issue = prepare(parse_file(filename, parser), optimize, discard)
+    if issue: return None, issue
+    return evaluate(syntax_tree, context, engine)
\ No newline at end of file
@@ -1,11 +1,28 @@
-from .runtime_result import RuntimeResult
-from .values import NumericValue, TextValue, Collection
-from .values import CustomFunction
+from .runtime_result import RuntimeResult, TailCall, IssueRaised
+from .values import NumericValue, TextValue, Collection, number
+from .values import BaseFunction, CustomFunction
 from .errors import RuntimeIssue
+from .nodes import ConditionalNode, FunctionCallNode, InlinedCallNode
+from .nodes import NumericLiteralNode, VariableAccessNode, BinaryOperationNode, UnaryOperationNode
+from .operation_cache import RAW_OPERATORS, unary_spans
 from .constants import *
 
 class CodeRunner:
+    """Evaluates a syntax tree by walking it.
+
+    Below evaluate() and call(), each process_* method returns the plain
+    value of its node and a failure raises IssueRaised, so the walk does
+    no bookkeeping for errors that do not happen. evaluate() and call()
+    return a RuntimeResult, like the other engines.
+    """
     def evaluate(self, node, context):
+        result = RuntimeResult()
+        try:
+            return result.success(self.visit(node, context))
+        except IssueRaised as raised:
+            return result.failure(raised.issue)
+
+    def visit(self, node, context):
         method_name = f'process_{type(node).__name__}'
         method = getattr(self, method_name, self.no_method_found)
         return method(node, context)
@@ -14,147 +31,133 @@ class CodeRunner:
         raise Exception(f'No handler for {type(node).__name__}')
     
     def process_NumericLiteralNode(self, node, context):
-        return RuntimeResult().success(
-            NumericValue(node.token.value)
-            .set_context(context)
-            .set_position(node.start_pos, node.end_pos)
-        )
+        return number(node.token.value)
         
     def process_TextLiteralNode(self, node, context):
-        return RuntimeResult().success(
-            TextValue(node.token.value)
-            .set_context(context)
-            .set_position(node.start_pos, node.end_pos)
-        )
+        return TextValue(node.token.value)
         
     def process_CollectionNode(self, node, context):
-        result = RuntimeResult()
-        items = []
+        items = [self.visit(item_node, context) for item_node in node.items]
         
-        for item_node in node.items:
-            items.append(result.record(self.evaluate(item_node, context)))
-            if result.error: return result
-            
-        return result.success(
-            Collection(items)
-            .set_context(context)
-            .set_position(node.start_pos, node.end_pos)
-        )
+        if node.discard: return None
+        return Collection(items)
         
     def process_VariableAccessNode(self, node, context):
-        result = RuntimeResult()
+        value = self.read_callee(node, context)
+        # A function read from a name runs in the context that read it, since scoping is dynamic
+        if isinstance(value, BaseFunction): return value.copy().set_context(context)
+        return value
+
+    def read_callee(self, node, context):
+        """Value of a VariableAccessNode, without the copy a read makes of a function"""
         var_name = node.token.value
-        value = context.symbol_storage.get(var_name)
+        if node.slot is None:
+            value = (node.cache or node.name_cache()).get(context.symbol_storage)
+        else:
+            value = context.symbol_storage.slots[node.slot] or context.symbol_storage.get(var_name)
         
         if not value:
-            return result.failure(RuntimeIssue(
+            raise IssueRaised(RuntimeIssue(
                 node.start_pos, node.end_pos,
                 f"'{var_name}' ain't defined",
                 context
             ))
-        return result.success(value.copy().set_position(node.start_pos, node.end_pos).set_context(context))
+        return value
         
     def process_VariableAssignmentNode(self, node, context):
-        result = RuntimeResult()
         var_name = node.token.value
-        value = result.record(self.evaluate(node.value_node, context))
-        if result.error: return result
-        context.symbol_storage.add(var_name, value.copy())
-        return result.success(value)
+        value = self.visit(node.value_node, context)
+        if node.slot is None:
+            context.symbol_storage.add(var_name, value)
+        else:
+            context.symbol_storage.slots[node.slot] = value
+        return value
         
     def process_BinaryOperationNode(self, node, context):
-        result = RuntimeResult()
-        left = result.record(self.evaluate(node.left_node, context))
-        if result.error: return result
-        
-        right = result.record(self.evaluate(node.right_node, context))
-        if result.error: return result
-
-        if node.op_token.type == TT_PLUS:
-            outcome, issue = left.add(right)
-        elif node.op_token.type == TT_MINUS:
-            outcome, issue = left.subtract(right)
-        elif node.op_token.type == TT_MUL:
-            outcome, issue = left.multiply(right)
-        elif node.op_token.type == TT_DIV:
-            outcome, issue = left.divide(right)
-        elif node.op_token.type == TT_EE:
-            outcome, issue = left.compare_equal(right)
-        elif node.op_token.type == TT_NE:
-            outcome, issue = left.compare_not_equal(right)
-        elif node.op_token.type == TT_LT:
-            outcome, issue = left.compare_less_than(right)
-        elif node.op_token.type == TT_GT:
-            outcome, issue = left.compare_greater_than(right)
-        elif node.op_token.type == TT_LTE:
-            outcome, issue = left.compare_less_or_equal(right)
-        elif node.op_token.type == TT_GTE:
-            outcome, issue = left.compare_greater_or_equal(right)
-        elif node.op_token.matches(TT_KEYWORD, 'AN\''):
-            outcome, issue = left.logical_and(right)
-        elif node.op_token.matches(TT_KEYWORD, 'OR'):
-            outcome, issue = left.logical_or(right)
-        else:
-            return result.failure(RuntimeIssue(
+        if node.numeric:
+            try:
+                return number(self.evaluate_raw(node, context))
+            except ZeroDivisionError:
+                # Evaluated again below, which reports it where it happened
+                pass
+        left = self.visit(node.left_node, context)
+        right = self.visit(node.right_node, context)
+
+        cache = node.operation_cache()
+        if cache is None:
+            raise IssueRaised(RuntimeIssue(
                 node.start_pos, node.end_pos,
                 f"Unknown operator: {node.op_token}",
                 context
             ))
+        outcome, issue = cache.run(left, right)
+            
+        if issue: raise IssueRaised(issue.locate(cache.spans, context))
+        return outcome
             
-        if issue:
-            return result.failure(issue)
-        else:
-            return result.success(outcome.set_position(node.start_pos, node.end_pos))            
     def process_UnaryOperationNode(self, node, context):
-        result = RuntimeResult()
-        number = result.record(self.evaluate(node.node, context))
-        if result.error: return result
+        if node.numeric:
+            try:
+                return number(self.evaluate_raw(node, context))
+            except ZeroDivisionError:
+                pass
+        operand = self.visit(node.node, context)
         
-        issue = None
+        value, issue = operand, None
         if node.op_token.type == TT_MINUS:
-            number, issue = number.multiply(NumericValue(-1))
+            value, issue = operand.multiply(NumericValue(-1))
         elif node.op_token.matches(TT_KEYWORD, 'AIN\'T'):
-            number, issue = number.logical_not()
+            value, issue = operand.logical_not()
             
-        if issue:
-            return result.failure(issue)
-        else:
-            return result.success(number.set_position(node.start_pos, node.end_pos))
+        if issue: raise IssueRaised(issue.locate(unary_spans(node), context))
+        return value
+
+    def evaluate_raw(self, node, context):
+        """The plain number a tree Optimizer.infer_types marked numeric evaluates to"""
+        node_type = type(node)
+        if node_type is NumericLiteralNode:
+            return node.token.value
+        if node_type is VariableAccessNode:
+            storage = context.symbol_storage
+            if node.slot is None: return (node.cache or node.name_cache()).get(storage).value
+            return (storage.slots[node.slot] or storage.get(node.token.value)).value
+        if node_type is BinaryOperationNode:
+            operation = RAW_OPERATORS[node.operation_cache().method_name]
+            return operation(self.evaluate_raw(node.left_node, context), self.evaluate_raw(node.right_node, context))
+        if node_type is UnaryOperationNode:
+            value = self.evaluate_raw(node.node, context)
+            if node.op_token.type == TT_MINUS: return value * -1
+            if node.op_token.matches(TT_KEYWORD, 'AIN\'T'): return int(value == 0)
+            return value
+
+        # A HoistedNode, SharedNode or ReusedNode, which keep whole values
+        try:
+            return self.visit(node, context).value
+        except IssueRaised:
+            # Dividing by zero is the only way a numeric tree can fail
+            raise ZeroDivisionError
             
     def process_ConditionalNode(self, node, context):
-        result = RuntimeResult()
+        expr = self.select_case(node, context)
+        if expr: return self.visit(expr, context)
+        return None
         
+    def select_case(self, node, context):
+        """Tests the conditions of a ConditionalNode, returning the node of the branch to run"""
         for condition, expr in node.cases:
-            condition_value = result.record(self.evaluate(condition, context))
-            if result.error: return result
-            
-            if condition_value.is_true():
-                expr_value = result.record(self.evaluate(expr, context))
-                if result.error: return result
-                return result.success(expr_value)
+            if self.visit(condition, context).is_true():
+                return expr
                 
-        if node.default_case:
-            default_value = result.record(self.evaluate(node.default_case, context))
-            if result.error: return result
-            return result.success(default_value)
-            
-        return result.success(None)
+        return node.default_case
         
     def process_LoopNode(self, node, context):
-        result = RuntimeResult()
         items = []
-        start_val = result.record(self.evaluate(node.start_value, context))
-        if result.error: return result
-        
-        end_val = result.record(self.evaluate(node.end_value, context))
-        if result.error: return result
-        
-        step_val = (result.record(self.evaluate(node.step_value, context)) 
-                if node.step_value else NumericValue(1))
-        if result.error: return result
+        start_val = self.visit(node.start_value, context)
+        end_val = self.visit(node.end_value, context)
+        step_val = self.visit(node.step_value, context) if node.step_value else NumericValue(1)
         
         if step_val.value == 0:
-            return result.failure(RuntimeIssue(
+            raise IssueRaised(RuntimeIssue(
                 node.start_pos, node.end_pos,
                 "Step value cannot be zero",
                 context
@@ -167,61 +170,142 @@ class CodeRunner:
         
         while should_continue():
             context.symbol_storage.add(node.var_token.value, NumericValue(current))
-            value = result.record(self.evaluate(node.body, context))
-            if result.error: return result
-            items.append(value)
+            value = self.evaluate_loop_body(node, context)
+            if not node.discard: items.append(value)
             current += step_val.value
-        return result.success(
-            Collection(items)
-            .set_context(context)
-            .set_position(node.start_pos, node.end_pos)
-        )
+            
+        if node.discard: return None
+        return Collection(items)
     
     def process_WhileLoopNode(self, node, context):
-        result = RuntimeResult()
         items = []
         
-        while True:
-            condition = result.record(self.evaluate(node.condition, context))
-            if result.error: return result
-            if not condition.is_true(): break
-            items.append(result.record(self.evaluate(node.body, context)))
-            if result.error: return result
-        return result.success(
-        Collection(items) if items else Collection([])
-        .set_context(context)
-        .set_position(node.start_pos, node.end_pos)
-        )   
+        while self.visit(node.condition, context).is_true():
+            value = self.evaluate_loop_body(node, context)
+            if not node.discard: items.append(value)
+            
+        if node.discard: return None
+        return Collection(items)
+
+    def evaluate_loop_body(self, node, context):
+        """Runs the body of a LoopNode or WhileLoopNode once, see TieredRunner"""
+        return self.visit(node.body, context)
+
+    def process_HoistedLoopNode(self, node, context):
+        node.reset()
+        return self.visit(node.loop_node, context)
+
+    def process_HoistedNode(self, node, context):
+        value = node.lookup(context)
+        if value is not None: return value
+        return self.process_SharedNode(node, context)
+
+    def process_SharedNode(self, node, context):
+        value = self.visit(node.node, context)
+        node.remember(context, value)
+        return value
+
+    def process_ReusedNode(self, node, context):
+        value = node.shared.lookup(context)
+        if value is None: return self.visit(node.node, context)
+        return value
 
     def process_FunctionDefinitionNode(self, node, context):
-        result = RuntimeResult()
         func_name = node.func_name_token.value if node.func_name_token else None
         param_names = [param.value for param in node.param_tokens]
         
-        func_value = CustomFunction(func_name, node.body_node, param_names)
+        func_value = CustomFunction(func_name, node.body_node, param_names, node.layout)
         func_value.set_context(context)
         func_value.set_position(node.start_pos, node.end_pos)
         
         if node.func_name_token:
             context.symbol_storage.add(func_name, func_value)
             
-        return result.success(func_value)
+        return func_value
         
     def process_FunctionCallNode(self, node, context):
-        result = RuntimeResult()
-        args = []
+        func_to_call, args = self.prepare_call(node, context)
+        value = self.call_function(func_to_call, args)
+        # Like a name, a call hands out a function in the caller's context
+        if isinstance(value, BaseFunction): return value.copy().set_context(context)
+        return value
         
-        func_to_call = result.record(self.evaluate(node.func_node, context))
-        if result.error: return result
+    def process_InlinedCallNode(self, node, context, tail=False):
+        call = node.call
         
-        func_to_call = func_to_call.copy().set_position(node.start_pos, node.end_pos)
-        
-        for arg_node in node.arg_nodes:
-            args.append(result.record(self.evaluate(arg_node, context)))
-            if result.error: return result
+        if not node.anonymous:
+            func_to_call = self.read_callee(call.func_node, context)
+        args = [self.visit(arg_node, context) for arg_node in call.arg_nodes]
             
-        return_value = result.record(func_to_call.execute(args))
-        if result.error: return result
+        if node.anonymous or node.matches(func_to_call):
+            value = self.visit(node.function.body_node, node.enter(context, args))
+        else:
+            node.misses += 1
+            func_to_call = func_to_call.copy().set_position(call.start_pos, call.end_pos).set_context(context)
+            if tail and type(func_to_call) is CustomFunction:
+                return TailCall(func_to_call, args)
+            value = self.call_function(func_to_call, args)
+        
+        if isinstance(value, BaseFunction): return value.copy().set_context(context)
+        return value
         
-        return_value = return_value.copy().set_position(node.start_pos, node.end_pos).set_context(context)
-        return result.success(return_value)
\ No newline at end of file
+    def prepare_call(self, node, context):
+        """Evaluates the function and arguments of a call, returning (function, args)"""
+        func_node = node.func_node
+        
+        # Values are shared, so the call places a copy of the function where its errors and frame
+        # point. One read from a name runs in this context, and any other keeps its own
+        if type(func_node) is VariableAccessNode:
+            func_to_call = self.read_callee(func_node, context).copy().set_context(context)
+        else:
+            func_to_call = self.visit(func_node, context).copy()
+        func_to_call.set_position(node.start_pos, node.end_pos)
+        
+        args = [self.visit(arg_node, context) for arg_node in node.arg_nodes]
+        return func_to_call, args
+        
+    def call(self, func, args):
+        """Runs a CustomFunction for CustomFunction.execute, returning a RuntimeResult"""
+        result = RuntimeResult()
+        try:
+            return result.success(self.run_function(func, args))
+        except IssueRaised as raised:
+            return result.failure(raised.issue)
+
+    def run_function(self, func, args):
+        """Runs a CustomFunction, making the calls its body ends in here instead of nesting them"""
+        while True:
+            exec_context = func.create_context()
+            check = func.check_and_populate_args(func.param_names, args, exec_context)
+            if check.error: raise IssueRaised(check.error)
+            
+            value = self.evaluate_function_body(func, exec_context)
+            if type(value) is not TailCall: return value
+            func, args = value.func, value.args
+            
+    def call_function(self, func, args):
+        """Runs any function value for a call site, once its arguments are evaluated"""
+        if type(func) is CustomFunction: return self.run_function(func, args)
+        result = func.execute(args)
+        if result.error: raise IssueRaised(result.error)
+        return result.value
+
+    def evaluate_function_body(self, func, context):
+        """Runs the body of a CustomFunction in the context run_function() made for it"""
+        return self.evaluate_tail(func.body_node, context)
+
+    def evaluate_tail(self, node, context):
+        """visit() for a node in tail position of a function body, see TailCall"""
+        while type(node) is ConditionalNode:
+            node = self.select_case(node, context)
+            if not node: return None
+            
+        if type(node) is InlinedCallNode:
+            return self.process_InlinedCallNode(node, context, tail=True)
+        if type(node) is not FunctionCallNode:
+            return self.visit(node, context)
+            
+        func_to_call, args = self.prepare_call(node, context)
+        if type(func_to_call) is CustomFunction:
+            return TailCall(func_to_call, args)
+        return self.call_function(func_to_call, args)
\ No newline at end of file
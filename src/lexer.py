@@ -1,16 +1,20 @@
 from .tokens import Token
 from .errors import BadCharacterError, MissingCharacterError
-from .position import TextPosition
+from .position import TextPosition, register_source
 from .constants import *
 
 class TokenMaker:
     def __init__(self, filename, text):
         self.filename = filename
         self.text = text
+        self.source = register_source(filename, text)
         self.position = TextPosition(-1, 0, -1, filename, text)
         self.current_char = None
         self.move_next()
 
+    def here(self):
+        return self.source.position(self.position.index)
+
     def move_next(self):
         self.position.advance(self.current_char)
         self.current_char = self.text[self.position.index] if self.position.index < len(self.text) else None
@@ -30,27 +34,27 @@ class TokenMaker:
             elif self.current_char == '"':
                 token_list.append(self.create_string())
             elif self.current_char == '+':
-                token_list.append(Token(TT_PLUS, start_pos=self.position))
+                token_list.append(Token(TT_PLUS, start_pos=self.here()))
                 self.move_next()
             elif self.current_char == '-':
                 token_list.append(self.create_minus_or_arrow())
             elif self.current_char == '*':
-                token_list.append(Token(TT_MUL, start_pos=self.position))
+                token_list.append(Token(TT_MUL, start_pos=self.here()))
                 self.move_next()
             elif self.current_char == '/':
-                token_list.append(Token(TT_DIV, start_pos=self.position))
+                token_list.append(Token(TT_DIV, start_pos=self.here()))
                 self.move_next()
             elif self.current_char == '(':
-                token_list.append(Token(TT_LPAREN, start_pos=self.position))
+                token_list.append(Token(TT_LPAREN, start_pos=self.here()))
                 self.move_next()
             elif self.current_char == ')':
-                token_list.append(Token(TT_RPAREN, start_pos=self.position))
+                token_list.append(Token(TT_RPAREN, start_pos=self.here()))
                 self.move_next()
             elif self.current_char == '[':
-                token_list.append(Token(TT_LSQUARE, start_pos=self.position))
+                token_list.append(Token(TT_LSQUARE, start_pos=self.here()))
                 self.move_next()
             elif self.current_char == ']':
-                token_list.append(Token(TT_RSQUARE, start_pos=self.position))
+                token_list.append(Token(TT_RSQUARE, start_pos=self.here()))
                 self.move_next()
             elif self.current_char == '!':
                 token, issue = self.create_not_equals()
@@ -63,20 +67,20 @@ class TokenMaker:
             elif self.current_char == '>':
                 token_list.append(self.create_greater_than())
             elif self.current_char == ',':
-                token_list.append(Token(TT_COMMA, start_pos=self.position))
+                token_list.append(Token(TT_COMMA, start_pos=self.here()))
                 self.move_next()
             else:
-                start_pos = self.position.copy()
+                start_pos = self.here()
                 char = self.current_char
                 self.move_next()
-                return [], BadCharacterError(start_pos, self.position, "'" + char + "'")
-        token_list.append(Token(TT_EOF, start_pos=self.position))
+                return [], BadCharacterError(start_pos, self.here(), "'" + char + "'")
+        token_list.append(Token(TT_EOF, start_pos=self.here()))
         return token_list, None
     
     def create_number(self):
         num_str = ''
         decimal_count = 0
-        start_pos = self.position.copy()
+        start_pos = self.here()
         
         while self.current_char is not None and self.current_char in DIGITS + '.':
             if self.current_char == '.':
@@ -88,13 +92,13 @@ class TokenMaker:
             self.move_next()
             
         if decimal_count == 0:
-            return Token(TT_INT, int(num_str), start_pos, self.position)
+            return Token(TT_INT, int(num_str), start_pos, self.here())
         else:
-            return Token(TT_FLOAT, float(num_str), start_pos, self.position)
+            return Token(TT_FLOAT, float(num_str), start_pos, self.here())
             
     def create_string(self):
         string_value = ''
-        start_pos = self.position.copy()
+        start_pos = self.here()
         escaping = False
         self.move_next()
         
@@ -115,24 +119,24 @@ class TokenMaker:
             escaping = False
             
         self.move_next()
-        return Token(TT_STRING, string_value, start_pos, self.position)
+        return Token(TT_STRING, string_value, start_pos, self.here())
         
     def create_identifier(self):
         name = ''
-        start_pos = self.position.copy()
+        start_pos = self.here()
 
         if self.current_char == 'T' and self.peek() == "'":
             name = "T'"
             self.move_next()
             self.move_next()
-            return Token(TT_KEYWORD, name, start_pos, self.position)
+            return Token(TT_KEYWORD, name, start_pos, self.here())
 
         while self.current_char is not None and self.current_char in LETTER_DIGITS + "_'":
             name += self.current_char
             self.move_next()
         
         token_type = TT_KEYWORD if name in KEYWORDS else TT_IDENTIFIER
-        return Token(token_type, name, start_pos, self.position)
+        return Token(token_type, name, start_pos, self.here())
 
     def peek(self):
         """Look at next character without consuming it"""
@@ -142,51 +146,51 @@ class TokenMaker:
             
     def create_minus_or_arrow(self):
         token_type = TT_MINUS
-        start_pos = self.position.copy()
+        start_pos = self.here()
         self.move_next()
         
         if self.current_char == '>':
             self.move_next()
             token_type = TT_ARROW
             
-        return Token(token_type, start_pos=start_pos, end_pos=self.position)
+        return Token(token_type, start_pos=start_pos, end_pos=self.here())
         
     def create_not_equals(self):
-        start_pos = self.position.copy()
+        start_pos = self.here()
         self.move_next()
         if self.current_char == '=':
             self.move_next()
-            return Token(TT_NE, start_pos=start_pos, end_pos=self.position), None
+            return Token(TT_NE, start_pos=start_pos, end_pos=self.here()), None
             
         self.move_next()
-        return None, MissingCharacterError(start_pos, self.position, "'=' after '!'")
+        return None, MissingCharacterError(start_pos, self.here(), "'=' after '!'")
         
     def create_equals(self):
         token_type = TT_EQ
-        start_pos = self.position.copy()
+        start_pos = self.here()
         self.move_next()
         if self.current_char == '=':
             self.move_next()
             token_type = TT_EE
-        return Token(token_type, start_pos=start_pos, end_pos=self.position)
+        return Token(token_type, start_pos=start_pos, end_pos=self.here())
         
     def create_less_than(self):
         token_type = TT_LT
-        start_pos = self.position.copy()
+        start_pos = self.here()
         self.move_next()
         if self.current_char == '=':
             self.move_next()
             token_type = TT_LTE
-        return Token(token_type, start_pos=start_pos, end_pos=self.position)
+        return Token(token_type, start_pos=start_pos, end_pos=self.here())
         
     def create_greater_than(self):
         token_type = TT_GT
-        start_pos = self.position.copy()
+        start_pos = self.here()
         self.move_next()
         if self.current_char == '=':
             self.move_next()
             token_type = TT_GTE
-        return Token(token_type, start_pos=start_pos, end_pos=self.position)
+        return Token(token_type, start_pos=start_pos, end_pos=self.here())
         
     def skip_comment(self):
         self.move_next()
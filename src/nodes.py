@@ -1,78 +1,187 @@
+from threading import Lock
+
 from .tokens import Token
-from .position import TextPosition
+from .constants import TT_KEYWORD
+from .values import NumericValue, TextValue, CustomFunction
+from .context import ExecutionContext
+from .symbol_table import NameCache, SymbolStorage, FrameStorage, holding
+from .operation_cache import OperationCache, BINARY_METHODS, BINARY_OPERATORS
+
+class Node:
+    """Base of every syntax tree node.
+
+    compiled is left unset until an execution engine caches what it built
+    from the node there; anything that changes a node in place resets it.
+    Each engine caches one type of form, and once a second engine compiles
+    the node, compiled holds CompiledForms instead, see cache_form.
+    Nodes can be weakly referenced, so a tree can keep its SourceMap alive,
+    see position.keep_source.
+    """
+    __slots__ = ('compiled', '__weakref__')
+    # Attributes set after construction that a rebuilt node keeps
+    annotations = ()
+
+# Held while cache_form changes a node, so engines compiling on other threads keep their forms
+forms_lock = Lock()
+
+class CompiledForms(dict):
+    """Node.compiled of a node several engines compiled, mapping each form's type to it"""
+    __slots__ = ()
+
+def cached_form(node, form_type):
+    """The form_type form cached on node among other engines' forms, or None.
+    Engines check compiled for their own form first, so one engine costs nothing more"""
+    forms = getattr(node, 'compiled', None)
+    return forms.get(form_type) if type(forms) is CompiledForms else None
+
+def cache_form(node, form):
+    """Caches form on node without dropping what other engines cached there"""
+    with forms_lock:
+        current = getattr(node, 'compiled', None)
+        if current is None or type(current) is type(form):
+            node.compiled = form
+        elif type(current) is CompiledForms:
+            current[type(form)] = form
+        else:
+            node.compiled = CompiledForms({type(current): current, type(form): form})
+    return form
+
+class TokenNode(Node):
+    """Node made of a single token, which also supplies its position"""
+    __slots__ = ('token',)
+    fields = ('token',)
 
-class NumericLiteralNode:
     def __init__(self, token):
         self.token = token
-        self.start_pos = self.token.start_pos
-        self.end_pos = self.token.end_pos
+
+    @property
+    def start_pos(self):
+        return self.token.start_pos
+
+    @property
+    def end_pos(self):
+        return self.token.end_pos
+
+class NumericLiteralNode(TokenNode):
+    __slots__ = ()
         
     def __repr__(self):
         return f'{self.token}'
 
-class TextLiteralNode:
-    def __init__(self, token):
-        self.token = token
-        self.start_pos = self.token.start_pos
-        self.end_pos = self.token.end_pos
+class TextLiteralNode(TokenNode):
+    __slots__ = ()
         
     def __repr__(self):
         return f'{self.token}'
 
-class CollectionNode:
+class CollectionNode(Node):
+    """discard is set when nothing reads the value, see mark_discarded"""
+    __slots__ = ('items', 'discard', 'start_pos', 'end_pos')
+    fields = ('items', 'start_pos', 'end_pos')
+    annotations = ('discard',)
+
     def __init__(self, items, start_pos, end_pos):
         self.items = items
+        self.discard = False
         self.start_pos = start_pos
         self.end_pos = end_pos
 
-class VariableAccessNode:
+class VariableAccessNode(TokenNode):
+    """slot is the name's index in the frame of the function around it, if it has one.
+    numeric is set when the name always holds a number there, see Optimizer.infer_types
+    """
+    __slots__ = ('slot', 'numeric', 'cache')
+    annotations = ('slot', 'numeric')
+
     def __init__(self, token):
         self.token = token
-        self.start_pos = self.token.start_pos
-        self.end_pos = self.token.end_pos
+        self.slot = None
+        self.numeric = False
+        self.cache = None
+
+    def name_cache(self):
+        if self.cache is None:
+            self.cache = NameCache(self.token.value)
+        return self.cache
+
+class VariableAssignmentNode(Node):
+    __slots__ = ('token', 'value_node', 'slot', 'start_pos', 'end_pos')
+    fields = ('token', 'value_node')
+    annotations = ('slot',)
 
-class VariableAssignmentNode:
     def __init__(self, token, value_node):
         self.token = token
         self.value_node = value_node
+        self.slot = None
         self.start_pos = self.token.start_pos
         self.end_pos = self.value_node.end_pos
 
-class BinaryOperationNode:
+class BinaryOperationNode(Node):
+    """numeric is set when every operand below is a number, see Optimizer.infer_types"""
+    __slots__ = ('left_node', 'op_token', 'right_node', 'numeric', 'cache', 'start_pos', 'end_pos')
+    fields = ('left_node', 'op_token', 'right_node')
+    annotations = ('numeric',)
+
     def __init__(self, left_node, op_token, right_node):
         self.left_node = left_node
         self.op_token = op_token
         self.right_node = right_node
+        self.numeric = False
+        self.cache = None
         self.start_pos = self.left_node.start_pos
         self.end_pos = self.right_node.end_pos
+
+    def operation_cache(self):
+        """The site's OperationCache, or None for an operator no value implements"""
+        if self.cache is None:
+            op_token = self.op_token
+            key = op_token.value if op_token.type == TT_KEYWORD else op_token.type
+            if key not in BINARY_OPERATORS: return None
+            self.cache = OperationCache(BINARY_METHODS[BINARY_OPERATORS[key]], self.left_node, self.right_node)
+        return self.cache
         
     def __repr__(self):
         return f'({self.left_node},{self.op_token},{self.right_node})'
 
-class UnaryOperationNode:
+class UnaryOperationNode(Node):
+    """numeric is set as on BinaryOperationNode"""
+    __slots__ = ('op_token', 'node', 'numeric', 'start_pos', 'end_pos')
+    fields = ('op_token', 'node')
+    annotations = ('numeric',)
+
     def __init__(self, op_token, node):
         self.op_token = op_token
         self.node = node
+        self.numeric = False
         self.start_pos = self.op_token.start_pos
         self.end_pos = node.end_pos
         
     def __repr__(self):
         return f'({self.op_token}, {self.node})'
 
-class ConditionalNode:
+class ConditionalNode(Node):
+    __slots__ = ('cases', 'default_case', 'start_pos', 'end_pos')
+    fields = ('cases', 'default_case')
+
     def __init__(self, cases, default_case):
         self.cases = cases
         self.default_case = default_case
         self.start_pos = self.cases[0][0].start_pos
         self.end_pos = (self.default_case or self.cases[-1][0]).end_pos
 
-class LoopNode:
+class LoopNode(Node):
+    """discard is set when nothing reads the value, see mark_discarded"""
+    __slots__ = ('var_token', 'start_value', 'end_value', 'step_value', 'body', 'discard', 'start_pos', 'end_pos')
+    fields = ('var_token', 'start_value', 'end_value', 'step_value', 'body')
+    annotations = ('discard',)
+
     def __init__(self, var_token, start_value, end_value, step_value, body):
         self.var_token = var_token
         self.start_value = start_value
         self.end_value = end_value
         self.step_value = step_value
         self.body = body
+        self.discard = False
         self.start_pos = self.var_token.start_pos
         self.end_pos = self.body.end_pos
     def __repr__(self):
@@ -80,18 +189,30 @@ class LoopNode:
         return f"(Loop: {self.var_token.value} from {self.start_value} to {self.end_value}{step_str} do {self.body})"
 
 
-class WhileLoopNode:
+class WhileLoopNode(Node):
+    """discard is set when nothing reads the value, see mark_discarded"""
+    __slots__ = ('condition', 'body', 'discard', 'start_pos', 'end_pos')
+    fields = ('condition', 'body')
+    annotations = ('discard',)
+
     def __init__(self, condition, body):
         self.condition = condition
         self.body = body
+        self.discard = False
         self.start_pos = self.condition.start_pos
         self.end_pos = self.body.end_pos
 
-class FunctionDefinitionNode:
+class FunctionDefinitionNode(Node):
+    """layout maps the names a call keeps in FrameStorage slots, see Optimizer.resolve_slots"""
+    __slots__ = ('func_name_token', 'param_tokens', 'body_node', 'layout', 'start_pos', 'end_pos')
+    fields = ('func_name_token', 'param_tokens', 'body_node')
+    annotations = ('layout',)
+
     def __init__(self, func_name_token, param_tokens, body_node):
         self.func_name_token = func_name_token
         self.param_tokens = param_tokens
         self.body_node = body_node
+        self.layout = None
         
         if self.func_name_token:
             self.start_pos = self.func_name_token.start_pos
@@ -102,7 +223,10 @@ class FunctionDefinitionNode:
             
         self.end_pos = self.body_node.end_pos
 
-class FunctionCallNode:
+class FunctionCallNode(Node):
+    __slots__ = ('func_node', 'arg_nodes', 'start_pos', 'end_pos')
+    fields = ('func_node', 'arg_nodes')
+
     def __init__(self, func_node, arg_nodes):
         self.func_node = func_node
         self.arg_nodes = arg_nodes
@@ -111,4 +235,186 @@ class FunctionCallNode:
         if self.arg_nodes:
             self.end_pos = self.arg_nodes[-1].end_pos
         else:
-            self.end_pos = self.func_node.end_pos
\ No newline at end of file
+            self.end_pos = self.func_node.end_pos
+
+class CachedValueNode(Node):
+    """Operator tree over literals and names whose value is kept for its context, see remember"""
+    __slots__ = ('node', 'names', 'cached', 'start_pos', 'end_pos')
+    fields = ('node',)
+
+    def __init__(self, node):
+        self.node = node
+        self.names = tuple(sorted(read_names(node)))
+        self.cached = None
+        self.start_pos = node.start_pos
+        self.end_pos = node.end_pos
+
+    def lookup(self, context):
+        cached = self.cached
+        if cached is not None and cached[0] is context:
+            return cached[1]
+        return None
+
+    def remember(self, context, value):
+        self.cached = None
+        # Operators on numbers and text have no side effects, while a Collection can change
+        if type(value) not in (NumericValue, TextValue): return
+        get = context.symbol_storage.get
+        for name in self.names:
+            if type(get(name)) not in (NumericValue, TextValue): return
+        holding.add(self)
+        self.cached = (context, value)
+
+    def release(self):
+        # The run has ended, so the context can go
+        self.cached = None
+
+class HoistedNode(CachedValueNode):
+    """Loop-invariant tree, evaluated on its first use in each run of its loop"""
+    __slots__ = ()
+
+class SharedNode(CachedValueNode):
+    """First of several identical trees in one expression, always evaluated"""
+    __slots__ = ()
+
+class ReusedNode(Node):
+    """Later copy of shared's tree, which takes shared's value when it was kept"""
+    __slots__ = ('node', 'shared', 'start_pos', 'end_pos')
+    fields = ('node',)
+
+    def __init__(self, node, shared):
+        self.node = node
+        self.shared = shared
+        self.start_pos = node.start_pos
+        self.end_pos = node.end_pos
+
+class HoistedLoopNode(Node):
+    """Loop holding HoistedNodes, which are forgotten each time the loop starts"""
+    __slots__ = ('loop_node', 'hoisted', 'start_pos', 'end_pos')
+    fields = ('loop_node',)
+
+    def __init__(self, loop_node):
+        self.loop_node = loop_node
+        self.hoisted = tuple(find_hoisted(loop_node))
+        self.start_pos = loop_node.start_pos
+        self.end_pos = loop_node.end_pos
+
+    def reset(self):
+        for node in self.hoisted:
+            node.cached = None
+
+class InlinedCallNode(Node):
+    """Call of a small function whose body runs right at the call site, see Optimizer.inline_calls"""
+    __slots__ = ('call', 'function', 'template', 'hits', 'misses')
+    fields = ('call',)
+    annotations = ('function',)
+
+    def __init__(self, call):
+        self.call = call
+        # The callee's FunctionDefinitionNode, which a named call only runs while its name holds it
+        self.function = None
+        self.template = None
+        # Calls that ran the body here and that were made as usual, for Optimizer.inlining_report
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def start_pos(self):
+        return self.call.start_pos
+
+    @property
+    def end_pos(self):
+        return self.call.end_pos
+
+    @property
+    def anonymous(self):
+        return self.function.func_name_token is None
+
+    @property
+    def name(self):
+        return '<anonymous>' if self.anonymous else self.function.func_name_token.value
+
+    def matches(self, func):
+        return type(func) is CustomFunction and func.body_node is self.function.body_node
+
+    def enter(self, context, args):
+        """The context the body runs in, as create_context and check_and_populate_args make it"""
+        if self.template is None:
+            self.template = (self.name, [param.value for param in self.function.param_tokens], self.function.layout)
+        name, param_names, layout = self.template
+
+        new_context = ExecutionContext(name, context, self.call.start_pos)
+        if layout:
+            storage = new_context.symbol_storage = FrameStorage(context.symbol_storage, layout)
+        else:
+            storage = new_context.symbol_storage = SymbolStorage(context.symbol_storage)
+        for param_name, arg in zip(param_names, args):
+            storage.add(param_name, arg)
+        self.hits += 1
+        return new_context
+
+def mark_discarded(node):
+    """Set discard on the loops and collections whose value is lost along with node's.
+
+    That is node itself, the bodies of loops marked here, the items of
+    collections and the branches of conditionals. Engines still run what
+    such a node holds, then give None instead of building a Collection,
+    so a loop run for its side effects keeps no value per iteration.
+    """
+    if isinstance(node, (LoopNode, WhileLoopNode)):
+        node.discard = True
+        mark_discarded(node.body)
+    elif isinstance(node, CollectionNode):
+        node.discard = True
+        for item in node.items:
+            mark_discarded(item)
+    elif isinstance(node, ConditionalNode):
+        for _, expr in node.cases:
+            mark_discarded(expr)
+        if node.default_case: mark_discarded(node.default_case)
+    elif isinstance(node, HoistedLoopNode):
+        mark_discarded(node.loop_node)
+
+def read_names(node):
+    if isinstance(node, VariableAccessNode):
+        return {node.token.value}
+    names = set()
+    for child in iter_child_nodes(node):
+        names |= read_names(child)
+    return names
+
+def find_hoisted(node):
+    # Nested loops forget theirs again on every run, which only costs a recomputation
+    for child in iter_child_nodes(node):
+        if isinstance(child, HoistedNode):
+            yield child
+        elif not isinstance(child, FunctionDefinitionNode):
+            yield from find_hoisted(child)
+
+def iter_child_slots(node):
+    """Yield (child, field, index, subindex) for every child node of node"""
+    for name in node.fields:
+        value = getattr(node, name)
+        if isinstance(value, list):
+            for index, item in enumerate(value):
+                if isinstance(item, tuple):
+                    for subindex, part in enumerate(item):
+                        if hasattr(part, 'fields'):
+                            yield part, name, index, subindex
+                elif hasattr(item, 'fields'):
+                    yield item, name, index, None
+        elif hasattr(value, 'fields'):
+            yield value, name, None, None
+
+def iter_child_nodes(node):
+    for child, _, _, _ in iter_child_slots(node):
+        yield child
+
+def count_nodes(node):
+    """Number of nodes in the tree under node, node included"""
+    count = 0
+    stack = [node]
+    while stack:
+        count += 1
+        stack.extend(iter_child_nodes(stack.pop()))
+    return count
\ No newline at end of file
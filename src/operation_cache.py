@@ -0,0 +1,151 @@
+import operator
+import weakref
+from threading import Lock
+
+from .values import NumericValue, TextValue, number
+from .constants import *
+
+# Operand type pairs one site keeps fast paths for before it stops specializing
+MAX_CACHED_TYPES = 4
+
+# The value method behind each operator, in the order CodeRunner used to test them
+BINARY_METHODS = (
+    'add', 'subtract', 'multiply', 'divide', 'compare_equal', 'compare_not_equal',
+    'compare_less_than', 'compare_greater_than', 'compare_less_or_equal',
+    'compare_greater_or_equal', 'logical_and', 'logical_or',
+)
+BINARY_OPERATORS = {
+    TT_PLUS: 0, TT_MINUS: 1, TT_MUL: 2, TT_DIV: 3, TT_EE: 4, TT_NE: 5,
+    TT_LT: 6, TT_GT: 7, TT_LTE: 8, TT_GTE: 9, "AN'": 10, 'OR': 11,
+}
+
+# What each method computes when both operands are numbers, on their plain values
+RAW_OPERATORS = {
+    'add': operator.add,
+    'subtract': operator.sub,
+    'multiply': operator.mul,
+    # Raises ZeroDivisionError where NumericValue.divide reports "Division by zero"
+    'divide': operator.truediv,
+    'compare_equal': lambda left, right: int(left == right),
+    'compare_not_equal': lambda left, right: int(left != right),
+    'compare_less_than': lambda left, right: int(left < right),
+    'compare_greater_than': lambda left, right: int(left > right),
+    'compare_less_or_equal': lambda left, right: int(left <= right),
+    'compare_greater_or_equal': lambda left, right: int(left >= right),
+    'logical_and': lambda left, right: int(left and right),
+    'logical_or': lambda left, right: int(left or right),
+}
+
+def raw_unary(op_token):
+    """What a UnaryOperationNode computes on the plain value of a number"""
+    if op_token.type == TT_MINUS: return lambda value: value * -1
+    if op_token.matches(TT_KEYWORD, 'AIN\'T'): return lambda value: int(value == 0)
+    return lambda value: value
+
+def unary_spans(node):
+    """The operand spans OperationIssue.locate() takes for a UnaryOperationNode"""
+    # Negating multiplies by a -1 that is nowhere in the source
+    return ((node.node.start_pos, node.node.end_pos), (None, None))
+
+def divide_numbers(left, right):
+    # Division by zero takes the generic path, which reports it
+    if right.value == 0: return left.divide(right)
+    return NumericValue(left.value / right.value), None
+
+TRUE, FALSE = NumericValue.true, NumericValue.false
+
+# Fast paths by (method, left type, right type), each returning what left.method(right) would
+SPECIALIZED = {
+    ('add', NumericValue, NumericValue): lambda left, right: (number(left.value + right.value), None),
+    ('subtract', NumericValue, NumericValue): lambda left, right: (number(left.value - right.value), None),
+    ('multiply', NumericValue, NumericValue): lambda left, right: (number(left.value * right.value), None),
+    ('divide', NumericValue, NumericValue): divide_numbers,
+    ('compare_equal', NumericValue, NumericValue): lambda left, right: (TRUE if left.value == right.value else FALSE, None),
+    ('compare_not_equal', NumericValue, NumericValue): lambda left, right: (TRUE if left.value != right.value else FALSE, None),
+    ('compare_less_than', NumericValue, NumericValue): lambda left, right: (TRUE if left.value < right.value else FALSE, None),
+    ('compare_greater_than', NumericValue, NumericValue): lambda left, right: (TRUE if left.value > right.value else FALSE, None),
+    ('compare_less_or_equal', NumericValue, NumericValue): lambda left, right: (TRUE if left.value <= right.value else FALSE, None),
+    ('compare_greater_or_equal', NumericValue, NumericValue): lambda left, right: (TRUE if left.value >= right.value else FALSE, None),
+    ('logical_and', NumericValue, NumericValue): lambda left, right: (number(int(left.value and right.value)), None),
+    ('logical_or', NumericValue, NumericValue): lambda left, right: (number(int(left.value or right.value)), None),
+    ('add', TextValue, TextValue): lambda left, right: (TextValue(left.value + right.value), None),
+    ('multiply', TextValue, NumericValue): lambda left, right: (TextValue(left.value * right.value), None),
+}
+
+# Every OperationCache still in use, for operation_stats()
+caches = weakref.WeakSet()
+# Held while a site takes its monomorphic case, which run() reads without it
+monomorphic_lock = Lock()
+
+class OperationCache:
+    """Fast paths one binary operator site has needed, keyed by its operand types.
+
+    The first pair of operand types a site sees is its monomorphic case,
+    checked with two identity tests before anything else. Later pairs go
+    in entries, up to MAX_CACHED_TYPES in all; a site that fills them is
+    megamorphic, and pairs it has not seen call the operand's method as
+    CodeRunner always did. A pair without an entry in SPECIALIZED still
+    gets the method of the left type, which skips looking it up on the
+    value. hits counts operations that found a fast path, misses the rest,
+    and spans gives where the site's operands are, for OperationIssue.locate().
+    """
+    __slots__ = ('method_name', 'left_node', 'right_node', 'left_type', 'right_type', 'fast', 'entries', 'hits', 'misses', '__weakref__')
+
+    def __init__(self, method_name, left_node, right_node):
+        self.method_name = method_name
+        self.left_node = left_node
+        self.right_node = right_node
+        self.left_type = self.right_type = self.fast = None
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        caches.add(self)
+
+    def run(self, left, right):
+        if type(left) is self.left_type and type(right) is self.right_type:
+            self.hits += 1
+            return self.fast(left, right)
+        return self.lookup(left, right)
+
+    def lookup(self, left, right):
+        types = (type(left), type(right))
+        fast = self.entries.get(types)
+        if fast is not None:
+            self.hits += 1
+            return fast(left, right)
+
+        self.misses += 1
+        if len(self.entries) >= MAX_CACHED_TYPES:
+            return getattr(left, self.method_name)(right)
+        fast = SPECIALIZED.get((self.method_name,) + types) or getattr(types[0], self.method_name)
+        self.entries[types] = fast
+        if self.fast is None:
+            with monomorphic_lock:
+                # fast goes first, as run() only calls it once both types match
+                if self.fast is None:
+                    self.fast = fast
+                    self.left_type, self.right_type = types
+        return fast(left, right)
+
+    @property
+    def spans(self):
+        # Read from the nodes when an operation fails, as an edit to an
+        # IncrementalDocument can move them after the cache is made
+        left_node, right_node = self.left_node, self.right_node
+        return ((left_node.start_pos, left_node.end_pos), (right_node.start_pos, right_node.end_pos))
+
+    @property
+    def state(self):
+        if not self.entries: return 'unused'
+        if len(self.entries) == 1: return 'monomorphic'
+        return 'polymorphic' if len(self.entries) < MAX_CACHED_TYPES else 'megamorphic'
+
+def operation_stats():
+    """Counts of operator sites by state, and of the operations they ran"""
+    stats = {'sites': 0, 'unused': 0, 'monomorphic': 0, 'polymorphic': 0, 'megamorphic': 0, 'hits': 0, 'misses': 0}
+    for cache in list(caches):
+        stats['sites'] += 1
+        stats[cache.state] += 1
+        stats['hits'] += cache.hits
+        stats['misses'] += cache.misses
+    return stats
@@ -0,0 +1,527 @@
+import weakref
+from threading import Lock
+from time import perf_counter
+
+from .tokens import Token
+from .values import NumericValue, TextValue
+from .operation_cache import BINARY_METHODS, BINARY_OPERATORS
+from .nodes import *
+from .position import source_for, kept_sources, keep_source
+from .constants import *
+
+# Folding "ab" * 1000000 would only move a huge allocation from run time to every parse
+MAX_FOLDED_TEXT = 4096
+# Every inlined call site gets its own copy of the body in compiled code
+MAX_INLINED_NODES = 24
+
+def literal_value(node):
+    if isinstance(node, NumericLiteralNode): return NumericValue(node.token.value)
+    if isinstance(node, TextLiteralNode): return TextValue(node.token.value)
+    return None
+
+def literal_node(value, start_pos, end_pos):
+    if isinstance(value, TextValue):
+        return TextLiteralNode(Token(TT_STRING, value.value, start_pos, end_pos))
+    token_type = TT_FLOAT if isinstance(value.value, float) else TT_INT
+    return NumericLiteralNode(Token(token_type, value.value, start_pos, end_pos))
+
+def is_not(node):
+    return isinstance(node, UnaryOperationNode) and node.op_token.matches(TT_KEYWORD, 'AIN\'T')
+
+def is_comparison(node):
+    return isinstance(node, BinaryOperationNode) and node.op_token.type in (TT_EE, TT_NE, TT_LT, TT_GT, TT_LTE, TT_GTE)
+
+def is_pure_tree(node):
+    """True for operators over literals and names, which can only fail or produce a value"""
+    if isinstance(node, (NumericLiteralNode, TextLiteralNode, VariableAccessNode)):
+        return True
+    if isinstance(node, BinaryOperationNode):
+        op_token = node.op_token
+        key = op_token.value if op_token.type == TT_KEYWORD else op_token.type
+        return key in BINARY_OPERATORS and is_pure_tree(node.left_node) and is_pure_tree(node.right_node)
+    if isinstance(node, UnaryOperationNode):
+        return is_pure_tree(node.node)
+    return False
+
+def is_operator(node):
+    return isinstance(node, (BinaryOperationNode, UnaryOperationNode))
+
+def tree_key(node):
+    if isinstance(node, NumericLiteralNode):
+        return ('number', type(node.token.value), node.token.value)
+    if isinstance(node, TextLiteralNode):
+        return ('text', node.token.value)
+    if isinstance(node, VariableAccessNode):
+        return ('name', node.token.value)
+    if isinstance(node, BinaryOperationNode):
+        op_token = node.op_token
+        key = op_token.value if op_token.type == TT_KEYWORD else op_token.type
+        return (key, tree_key(node.left_node), tree_key(node.right_node))
+    return ('unary', node.op_token.type, node.op_token.value, tree_key(node.node))
+
+def frame_names(node, names):
+    """Append the names node assigns in the frame it runs in, in source order"""
+    if isinstance(node, VariableAssignmentNode):
+        names.append(node.token.value)
+    elif isinstance(node, LoopNode):
+        names.append(node.var_token.value)
+    elif isinstance(node, FunctionDefinitionNode):
+        if node.func_name_token: names.append(node.func_name_token.value)
+        return
+    for child in iter_child_nodes(node):
+        frame_names(child, names)
+
+def loop_effects(node, assigned):
+    """Add the names node may assign to assigned, and return whether it calls anything"""
+    calls = False
+    if isinstance(node, VariableAssignmentNode):
+        assigned.add(node.token.value)
+    elif isinstance(node, LoopNode):
+        assigned.add(node.var_token.value)
+    elif isinstance(node, FunctionDefinitionNode):
+        # The body only runs when called, and then in a context of its own
+        if node.func_name_token: assigned.add(node.func_name_token.value)
+        return False
+    elif isinstance(node, FunctionCallNode):
+        calls = True
+    for child in iter_child_nodes(node):
+        calls = loop_effects(child, assigned) or calls
+    return calls
+
+def tree_size(node):
+    return 1 + sum(tree_size(child) for child in iter_child_nodes(node))
+
+def is_leaf_function(node):
+    """True for a function whose body calls and defines nothing, which also rules out recursion"""
+    def calls_nothing(child):
+        if isinstance(child, (FunctionCallNode, FunctionDefinitionNode, InlinedCallNode)): return False
+        return all(calls_nothing(grandchild) for grandchild in iter_child_nodes(child))
+    return calls_nothing(node.body_node) and tree_size(node.body_node) <= MAX_INLINED_NODES
+
+def named_functions(node, found):
+    """Map each name a FIXIN' in node defines to every definition of it"""
+    if isinstance(node, FunctionDefinitionNode) and node.func_name_token:
+        found.setdefault(node.func_name_token.value, []).append(node)
+    for child in iter_child_nodes(node):
+        named_functions(child, found)
+    return found
+
+class Optimizer:
+    """Rewrites syntax trees into cheaper ones that behave identically.
+
+    Each pass returns a new tree, sharing every subtree it did not change, so trees held elsewhere (the syntax cache,
+    an IncrementalDocument) are never modified. Rebuilt nodes keep the span
+    of the node they replace, since values and errors take their positions
+    from it. Anything that would fail at run time is left alone, so errors
+    still happen where and when they did.
+    """
+    def __init__(self):
+        self.lock = Lock()
+        self.passes = (
+            ('fold_constants', self.rewriting(self.fold_constants)),
+            ('prune_branches', self.rewriting(self.prune_branches)),
+            ('simplify_nots', self.rewriting(self.simplify_nots)),
+            ('resolve_slots', self.resolve_slots),
+            # Before the passes that wrap trees in HoistedNodes and SharedNodes,
+            # which then keep the annotations it sets
+            ('infer_types', self.infer_types),
+            ('hoist_invariants', self.rewriting(self.hoist_invariants)),
+            # After the passes that rebuild trees of operators, since ReusedNodes
+            # point at their SharedNode and cannot be rebuilt
+            ('share_subexpressions', self.share_subexpressions),
+            # Last, since inlined calls recognize their function by its body node
+            ('inline_calls', self.inline_calls),
+        )
+        self.clear()
+
+    def clear(self):
+        self.runs = 0
+        self.rewrites = {name: 0 for name, _ in self.passes}
+        self.seconds = {name: 0.0 for name, _ in self.passes}
+        self.inlined = []
+
+    def stats(self):
+        return {
+            'runs': self.runs,
+            'passes': {
+                name: {'rewrites': self.rewrites[name], 'seconds': self.seconds[name]}
+                for name, _ in self.passes
+            },
+        }
+
+    def inlining_report(self):
+        """One line per inlined call site still in use, with how often it skipped a call"""
+        self.inlined = [site for site in self.inlined if site() is not None]
+        lines = []
+        hits = 0
+        for site in self.inlined:
+            site = site()
+            source = source_for(site.start_pos)
+            lines.append(
+                f'{source.filename}, line {source.line(site.start_pos) + 1}: {site.name} '
+                f'({tree_size(site.function.body_node)} nodes), {site.hits} calls inlined, '
+                f'{site.misses} guard misses'
+            )
+            hits += site.hits
+        lines.append(f'{hits} calls inlined at {len(self.inlined)} sites')
+        return '\n'.join(lines)
+
+    def specialization_report(self, syntax_tree):
+        """One line per tree of syntax_tree that runs on plain numbers, see infer_types"""
+        lines = []
+        nodes = 0
+
+        def regions(node, inside=False):
+            numeric = is_operator(node) and node.numeric
+            if numeric and not inside: yield node
+            for child in iter_child_nodes(node):
+                yield from regions(child, numeric)
+
+        for region in regions(syntax_tree):
+            source = source_for(region.start_pos)
+            size = tree_size(region)
+            names = ', '.join(sorted(read_names(region))) or 'no names'
+            lines.append(f'{source.filename}, line {source.line(region.start_pos) + 1}: {size} nodes, reading {names}')
+            nodes += size
+        lines.append(f'{nodes} nodes in {len(lines)} numeric trees')
+        return '\n'.join(lines)
+
+    def optimize(self, syntax_tree):
+        # One tree at a time, since the counts are per pass and say which pass is running
+        with self.lock:
+            return self.run_passes(syntax_tree)
+
+    def run_passes(self, syntax_tree):
+        self.runs += 1
+        source = kept_sources.get(syntax_tree)
+        for name, run in self.passes:
+            started = perf_counter()
+            self.current_pass = name
+            syntax_tree = run(syntax_tree)
+            self.seconds[name] += perf_counter() - started
+        # A pass can replace the root, which then keeps the map the old one kept
+        if source is not None: keep_source(syntax_tree, source)
+        return syntax_tree
+
+    def rewriting(self, rewrite):
+        """A pass that applies rewrite to every node, bottom-up"""
+        return lambda syntax_tree: self.transform(syntax_tree, rewrite)
+
+    def transform(self, node, rewrite):
+        return rewrite(self.map_children(node, lambda child: self.transform(child, rewrite)))
+
+    def map_children(self, node, function):
+        values = []
+        changed = False
+        for name in node.fields:
+            value = getattr(node, name)
+            new_value = self.map_value(value, function)
+            changed = changed or new_value is not value
+            values.append(new_value)
+
+        return self.copied(node, values) if changed else node
+
+    def copied(self, node, values):
+        """A node like node, with values for its fields"""
+        new_node = type(node)(*values)
+        if not isinstance(node, TokenNode):
+            new_node.start_pos = node.start_pos
+            new_node.end_pos = node.end_pos
+        for name in node.annotations:
+            setattr(new_node, name, getattr(node, name))
+        return new_node
+
+    def map_value(self, value, function):
+        if isinstance(value, (list, tuple)):
+            items = [self.map_value(item, function) for item in value]
+            if all(new is old for new, old in zip(items, value)): return value
+            return items if isinstance(value, list) else tuple(items)
+        if hasattr(value, 'fields'):
+            return function(value)
+        return value
+
+    def rewrote(self, node):
+        self.rewrites[self.current_pass] += 1
+        return node
+
+    def fold_constants(self, node):
+        if isinstance(node, BinaryOperationNode):
+            op_token = node.op_token
+            key = op_token.value if op_token.type == TT_KEYWORD else op_token.type
+            left, right = literal_value(node.left_node), literal_value(node.right_node)
+            if left is None or right is None or key not in BINARY_OPERATORS: return node
+            method_name = BINARY_METHODS[BINARY_OPERATORS[key]]
+            if (method_name == 'multiply' and isinstance(left, TextValue) and
+                    isinstance(right.value, int) and len(left.value) * right.value > MAX_FOLDED_TEXT):
+                return node
+            return self.fold(node, lambda: getattr(left, method_name)(right))
+
+        if isinstance(node, UnaryOperationNode):
+            operand = literal_value(node.node)
+            if operand is None: return node
+            if node.op_token.type == TT_MINUS:
+                return self.fold(node, lambda: operand.multiply(NumericValue(-1)))
+            if node.op_token.matches(TT_KEYWORD, 'AIN\'T'):
+                return self.fold(node, operand.logical_not)
+            return self.fold(node, lambda: (operand, None))
+        return node
+
+    def fold(self, node, operation):
+        try:
+            outcome, issue = operation()
+        except Exception:
+            # Python errors such as "ab" * 1.5 must still surface when the code runs
+            return node
+        if issue or not isinstance(outcome, (NumericValue, TextValue)): return node
+        if isinstance(outcome, TextValue) and len(outcome.value) > MAX_FOLDED_TEXT: return node
+        return self.rewrote(literal_node(outcome, node.start_pos, node.end_pos))
+
+    def prune_branches(self, node):
+        if isinstance(node, ConditionalNode):
+            cases = []
+            default_case = node.default_case
+            for condition, expr in node.cases:
+                value = literal_value(condition)
+                if value is None:
+                    cases.append((condition, expr))
+                elif value.is_true():
+                    # Taken whenever it is reached, so nothing after it can run
+                    default_case = expr
+                    break
+
+            if len(cases) == len(node.cases) and default_case is node.default_case: return node
+            if not cases:
+                if default_case is None:
+                    # Every case is false, but the result must still be None
+                    return node if len(node.cases) == 1 else self.rewrote(self.rebuilt(node, ConditionalNode(node.cases[:1], None)))
+                return self.rewrote(default_case)
+            return self.rewrote(self.rebuilt(node, ConditionalNode(cases, default_case)))
+
+        if isinstance(node, WhileLoopNode):
+            value = literal_value(node.condition)
+            if value is not None and not value.is_true():
+                return self.rewrote(CollectionNode([], node.start_pos, node.end_pos))
+        return node
+
+    def simplify_nots(self, node):
+        # AIN'T AIN'T x is x when x is already 0 or 1, but the value still takes
+        # the outer span, which is exactly what a unary plus does
+        if is_not(node) and is_not(node.node) and (is_comparison(node.node.node) or is_not(node.node.node)):
+            plus = UnaryOperationNode(Token(TT_PLUS, None, node.start_pos), node.node.node)
+            return self.rewrote(self.rebuilt(node, plus))
+        return node
+
+    def rebuilt(self, node, new_node):
+        new_node.start_pos = node.start_pos
+        new_node.end_pos = node.end_pos
+        return new_node
+
+    def resolve_slots(self, node):
+        # Scoping is dynamic, so only a function's own names can be placed:
+        # anything else may live in whichever caller's frame comes first
+        if not isinstance(node, FunctionDefinitionNode):
+            return self.map_children(node, self.resolve_slots)
+
+        names = [param.value for param in node.param_tokens]
+        frame_names(node.body_node, names)
+        if not names: return self.map_children(node, self.resolve_slots)
+        layout = {}
+        for name in names:
+            layout.setdefault(name, len(layout))
+
+        def place(child):
+            if isinstance(child, FunctionDefinitionNode):
+                return self.resolve_slots(child)
+            child = self.map_children(child, place)
+            if isinstance(child, (VariableAccessNode, VariableAssignmentNode)) and child.token.value in layout:
+                if isinstance(child, VariableAccessNode):
+                    child = VariableAccessNode(child.token)
+                else:
+                    child = VariableAssignmentNode(child.token, child.value_node)
+                child.slot = layout[child.token.value]
+                self.rewrote(child)
+            return child
+
+        function = self.rebuilt(node, FunctionDefinitionNode(node.func_name_token, node.param_tokens, place(node.body_node)))
+        function.layout = layout
+        return function
+
+    def infer_types(self, tree):
+        # Forward data flow in evaluation order, tracking the names certain to
+        # hold a number. Function bodies start knowing nothing, as they run in
+        # whichever frame calls them, and calls forget everything, as they can
+        # assign the caller's names. Parameters are never known: any value can be passed
+        numeric = {}
+
+        def is_number(node):
+            return isinstance(node, NumericLiteralNode) or numeric.get(node, False)
+
+        def visit(node, known):
+            """Whether node's value is a number, and the names known after it"""
+            if isinstance(node, NumericLiteralNode): return True, known
+            if isinstance(node, TextLiteralNode): return False, known
+            if isinstance(node, VariableAccessNode):
+                numeric[node] = node.token.value in known
+                return numeric[node], known
+            if isinstance(node, VariableAssignmentNode):
+                value, known = visit(node.value_node, known)
+                name = node.token.value
+                return value, (known | {name}) if value else (known - {name})
+            if isinstance(node, BinaryOperationNode):
+                left, known = visit(node.left_node, known)
+                right, known = visit(node.right_node, known)
+                op_token = node.op_token
+                key = op_token.value if op_token.type == TT_KEYWORD else op_token.type
+                numeric[node] = key in BINARY_OPERATORS and is_number(node.left_node) and is_number(node.right_node)
+                return left and right and key in BINARY_OPERATORS, known
+            if isinstance(node, UnaryOperationNode):
+                value, known = visit(node.node, known)
+                numeric[node] = is_number(node.node)
+                return value, known
+            if isinstance(node, CollectionNode):
+                for item in node.items:
+                    _, known = visit(item, known)
+                return False, known
+            if isinstance(node, ConditionalNode):
+                values, branches = [], []
+                for condition, expr in node.cases:
+                    _, known = visit(condition, known)
+                    value, after = visit(expr, known)
+                    values.append(value)
+                    branches.append(after)
+                value, after = visit(node.default_case, known) if node.default_case else (False, known)
+                return all(values) and value, frozenset.intersection(after, *branches)
+            if isinstance(node, LoopNode):
+                for part in (node.start_value, node.end_value, node.step_value):
+                    if part: _, known = visit(part, known)
+                # Repeat until the names known on entering the body stop shrinking
+                counter = frozenset([node.var_token.value])
+                entry = known | counter
+                while True:
+                    _, after = visit(node.body, entry)
+                    if (known & after) | counter == entry: return False, known & after
+                    entry = (known & after) | counter
+            if isinstance(node, WhileLoopNode):
+                entry = known
+                while True:
+                    _, checked = visit(node.condition, entry)
+                    _, after = visit(node.body, checked)
+                    if known & after == entry: return False, checked
+                    entry = known & after
+            if isinstance(node, FunctionDefinitionNode):
+                visit(node.body_node, frozenset())
+                if node.func_name_token: known = known - {node.func_name_token.value}
+                return False, known
+            if isinstance(node, FunctionCallNode):
+                _, known = visit(node.func_node, known)
+                for arg_node in node.arg_nodes:
+                    _, known = visit(arg_node, known)
+                return False, frozenset()
+            # Anything else is analyzed on its own terms and trusted with nothing
+            for child in iter_child_nodes(node):
+                visit(child, frozenset())
+            return False, frozenset()
+
+        visit(tree, frozenset())
+
+        def annotate(node):
+            new_node = self.map_children(node, annotate)
+            if not numeric.get(node): return new_node
+            new_node = self.copied(node, [getattr(new_node, name) for name in node.fields])
+            new_node.numeric = True
+            return self.rewrote(new_node)
+
+        return annotate(tree)
+
+    def hoist_invariants(self, node):
+        if not isinstance(node, (LoopNode, WhileLoopNode)): return node
+        # Def/use: a name no assignment in the loop touches keeps its value for
+        # the whole run, unless a call (FIREUP runs code in the caller's
+        # context) or a built-in like SHOVE gets a chance to change things
+        assigned = set()
+        if isinstance(node, LoopNode):
+            assigned.add(node.var_token.value)
+            repeated = (node.body,)
+        else:
+            repeated = (node.condition, node.body)
+        if any([loop_effects(part, assigned) for part in repeated]): return node
+
+        def hoist(child):
+            if isinstance(child, (HoistedNode, FunctionDefinitionNode)): return child
+            if is_operator(child) and is_pure_tree(child):
+                if read_names(child) and not read_names(child) & assigned:
+                    return self.rewrote(HoistedNode(child))
+            return self.map_children(child, hoist)
+
+        if isinstance(node, LoopNode):
+            body = hoist(node.body)
+            if body is node.body: return node
+            loop_node = self.rebuilt(node, LoopNode(node.var_token, node.start_value, node.end_value, node.step_value, body))
+        else:
+            condition, body = hoist(node.condition), hoist(node.body)
+            if condition is node.condition and body is node.body: return node
+            loop_node = self.rebuilt(node, WhileLoopNode(condition, body))
+        return HoistedLoopNode(loop_node)
+
+    def share_subexpressions(self, node):
+        if isinstance(node, HoistedNode): return node
+        if is_operator(node) and is_pure_tree(node): return self.share(node)
+        return self.map_children(node, self.share_subexpressions)
+
+    def share(self, tree):
+        # Identical trees never overlap, so the first one in source order is
+        # also the first evaluated, and the others can wait for its value
+        first = {}
+        repeats = set()
+
+        def plan(node):
+            if not is_operator(node): return
+            key = tree_key(node)
+            if key in first:
+                repeats.add(key)
+                return
+            first[key] = node
+            for child in iter_child_nodes(node):
+                plan(child)
+
+        plan(tree)
+        if not repeats: return tree
+        shared = {}
+
+        def rebuild(node):
+            if not is_operator(node): return node
+            key = tree_key(node)
+            if key not in repeats: return self.map_children(node, rebuild)
+            if first[key] is not node:
+                return self.rewrote(ReusedNode(node, shared[key]))
+            shared[key] = SharedNode(self.map_children(node, rebuild))
+            return shared[key]
+
+        return rebuild(tree)
+
+    def inline_calls(self, node):
+        # Definitions from other runs, such as earlier REPL lines, are not
+        # known here, and a name defined twice could mean either body
+        functions = {
+            name: definitions[0] for name, definitions in named_functions(node, {}).items()
+            if len(definitions) == 1 and is_leaf_function(definitions[0])
+        }
+
+        def inline(node):
+            if not isinstance(node, FunctionCallNode): return node
+            func_node = node.func_node
+            if isinstance(func_node, VariableAccessNode):
+                function = functions.get(func_node.token.value)
+            elif isinstance(func_node, FunctionDefinitionNode) and not func_node.func_name_token:
+                function = func_node if is_leaf_function(func_node) else None
+            else:
+                function = None
+            # A wrong number of arguments fails the way only a real call does
+            if function is None or len(node.arg_nodes) != len(function.param_tokens): return node
+
+            site = InlinedCallNode(node)
+            site.function = function
+            self.inlined.append(weakref.ref(site))
+            return self.rewrote(site)
+
+        return self.transform(node, inline)
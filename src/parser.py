@@ -29,17 +29,16 @@ class ParseResult:
 
 class CodeParser:
     def __init__(self, tokens):
-        self.tokens = tokens
-        self.token_index = -1
+        self.tokens = iter(tokens)
         self.current_token = None
         self.advance()
         self.start_pos = None
         self.end_pos = None
         
     def advance(self):
-        self.token_index += 1
-        if self.token_index < len(self.tokens):
-            self.current_token = self.tokens[self.token_index]
+        token = next(self.tokens, None)
+        if token is not None:
+            self.current_token = token
         return self.current_token
         
     def parse(self):
@@ -213,7 +212,7 @@ class CodeParser:
     def parse_list(self):
         result = ParseResult()
         elements = []
-        start_pos = self.current_token.start_pos.copy()
+        start_pos = self.current_token.start_pos
         
         if self.current_token.type != TT_LSQUARE:
             return result.failure(SyntaxIssue(
@@ -253,7 +252,7 @@ class CodeParser:
         return result.success(CollectionNode(
             elements,
             start_pos,
-            self.current_token.end_pos.copy()
+            self.current_token.end_pos
         ))
         
     def parse_conditional(self):
@@ -1,3 +1,14 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from threading import RLock
+from weakref import WeakKeyDictionary, WeakValueDictionary, finalize
+
+SOURCE_SHIFT = 32
+# Offsets a DocumentSourceMap stores from TAIL_START on count back from TAIL_END,
+# which leaves room for the end of an EOF token, one past the text
+TAIL_START = 1 << (SOURCE_SHIFT - 1)
+TAIL_END = (1 << SOURCE_SHIFT) - 2
+
 class TextPosition:
     def __init__(self, index, line, column, filename, filetext):
         self.index = index
@@ -5,16 +16,192 @@ class TextPosition:
         self.column = column
         self.filename = filename
         self.filetext = filetext
-        
+
     def advance(self, current_char=None):
         self.index += 1
         self.column += 1
-        
+
         if current_char == '\n':
             self.line += 1
             self.column = 0
-            
+
         return self
-        
+
     def copy(self):
-        return TextPosition(self.index, self.line, self.column, self.filename, self.filetext)
\ No newline at end of file
+        return TextPosition(self.index, self.line, self.column, self.filename, self.filetext)
+
+def add_line_starts(line_starts, text, offset):
+    index = text.find('\n')
+    while index != -1:
+        line_starts.append(offset + index + 1)
+        index = text.find('\n', index + 1)
+
+class SourceMap:
+    """Maps the integer positions of one file back to lines and columns.
+
+    The map of a stream gains its lines as the stream is read, and is
+    complete once it has been lexed as far as any lexing of its text goes.
+    """
+    def __init__(self, file_id, filename, line_starts, complete=True):
+        self.file_id = file_id
+        self.base = file_id << SOURCE_SHIFT
+        self.filename = filename
+        self.line_starts = line_starts
+        self.complete = complete
+
+    def add_lines(self, text, offset):
+        add_line_starts(self.line_starts, text, offset)
+
+    def position(self, index):
+        return self.base + index
+
+    def offset(self, position):
+        return position - self.base
+
+    def line(self, position):
+        return bisect_right(self.line_starts, position - self.base) - 1
+
+    def column(self, position):
+        index = position - self.base
+        return index - self.line_starts[bisect_right(self.line_starts, index) - 1]
+
+class DocumentSourceMap(SourceMap):
+    """SourceMap of an edited buffer, whose positions after the gap count from its end.
+
+    Positions store an offset before gap as it is, and a later one as
+    TAIL_END less its distance from the end of the text, so an edit before
+    the gap leaves every position after it as it was. Rather than where
+    lines start, the map keeps where newlines are, stored the same way, as
+    a newline moves with an edit just before it and a line start does not.
+    See IncrementalDocument.
+    """
+    def __init__(self, file_id, filename, line_starts, complete=True):
+        super().__init__(file_id, filename, line_starts, complete)
+        self.newlines = array('q')
+        self.length = 0
+        self.gap = 1
+
+    def code(self, index):
+        if index < self.gap: return index
+        return TAIL_END - (self.length - index)
+
+    def decode(self, stored):
+        if stored < TAIL_START: return stored
+        return self.length - (TAIL_END - stored)
+
+    def position(self, index):
+        return self.base + self.code(index)
+
+    def offset(self, position):
+        return self.decode(position - self.base)
+
+    def recode(self, position):
+        """position stored the way the current gap says"""
+        return self.position(self.offset(position))
+
+    def line(self, position):
+        return bisect_left(self.newlines, self.code(self.offset(position)))
+
+    def column(self, position):
+        line = self.line(position)
+        if not line: return self.offset(position)
+        return self.offset(position) - self.decode(self.newlines[line - 1]) - 1
+
+    def reset(self, text):
+        """Start over with text, every offset of which is stored as it is"""
+        self.length = len(text)
+        self.gap = self.length + 1
+        self.newlines = array('q')
+        # Where each line after the first starts, less one
+        add_line_starts(self.newlines, text, -1)
+
+    def move_gap(self, gap):
+        """Recode the newlines between the old gap and gap, whose other
+        positions the caller recodes itself"""
+        newlines = self.newlines
+        low, high = sorted((self.gap, gap))
+        start = bisect_left(newlines, low, key=self.decode)
+        end = bisect_right(newlines, high, key=self.decode)
+        self.gap = gap
+        newlines[start:end] = array('q', [self.code(self.decode(stored)) for stored in newlines[start:end]])
+
+    def replace(self, offset, deleted, inserted):
+        """Account for an edit that ends before the gap, moving the gap along with the text after it"""
+        newlines = self.newlines
+        delta = len(inserted) - deleted
+        start = bisect_left(newlines, offset)
+        end = bisect_left(newlines, self.gap)
+        moved = [index + delta for index in newlines[start:end] if index >= offset + deleted]
+        added = array('q')
+        add_line_starts(added, inserted, offset - 1)
+        self.length += delta
+        self.gap += delta
+        newlines[start:end] = array('q', [self.code(index) for index in [*added, *moved]])
+
+# Maps by file id, for as long as something keeps them: each map is kept by what
+# holds positions into it, see keep_source. An id is handed out again only once its map is gone.
+source_maps = WeakValueDictionary()
+free_file_ids = []
+next_file_id = 0
+# Maps by filename and line starts, shared by texts lexed while one is still kept
+interned_sources = WeakValueDictionary()
+# Maps of streams by filename and digest of their text, see register_stream
+stream_sources = WeakValueDictionary()
+# Maps of streams and documents kept alive by the syntax trees made from them
+kept_sources = WeakKeyDictionary()
+# Held while handing out a file id or adding to the tables above, for threads lexing at once
+sources_lock = RLock()
+
+def new_source(filename, line_starts, complete=True, source_type=SourceMap):
+    global next_file_id
+    with sources_lock:
+        if free_file_ids:
+            file_id = free_file_ids.pop()
+        else:
+            file_id = next_file_id
+            next_file_id += 1
+        source = source_type(file_id, filename, line_starts, complete)
+        source_maps[file_id] = source
+    finalize(source, free_file_ids.append, file_id)
+    return source
+
+def keep_source(syntax_tree, source):
+    """Keeps source alive as long as syntax_tree is.
+
+    A map goes away once nothing refers to it, so whoever makes a tree from
+    one keeps it this way. CustomFunctions and Issues keep the maps of
+    their own positions themselves.
+    """
+    kept_sources[syntax_tree] = source
+
+def register_source(filename, text):
+    line_starts = array('q', [0])
+    add_line_starts(line_starts, text, 0)
+    return register_lines(filename, line_starts)
+
+def register_lines(filename, line_starts):
+    key = (filename, line_starts.tobytes())
+    with sources_lock:
+        source = interned_sources.get(key)
+        if source is None:
+            source = interned_sources[key] = new_source(filename, line_starts)
+    return source
+
+def register_stream(filename, digest=None):
+    """A map the lines of a stream are added to as it is read. With the digest of
+    the text, a stream of it that was read before and is still kept gives its
+    complete map instead. Nothing keeps the map but the caller, see keep_source"""
+    if digest is None: return new_source(filename, array('q', [0]), complete=False)
+    key = (filename, digest)
+    with sources_lock:
+        source = stream_sources.get(key)
+        if source is None or not source.complete:
+            source = stream_sources[key] = new_source(filename, array('q', [0]), complete=False)
+    return source
+
+def register_document(filename):
+    """A map for an IncrementalDocument, kept like a stream's"""
+    return new_source(filename, array('q', [0]), source_type=DocumentSourceMap)
+
+def source_for(position):
+    return source_maps[position >> SOURCE_SHIFT]
@@ -0,0 +1,271 @@
+from .nodes import *
+from .errors import SyntaxIssue
+from .parser import ParseResult
+from .constants import *
+
+LOGICAL, COMPARISON, ARITHMETIC, TERM = range(1, 5)
+
+OPERATOR_LEVELS = {
+    TT_EE: COMPARISON,
+    TT_NE: COMPARISON,
+    TT_LT: COMPARISON,
+    TT_GT: COMPARISON,
+    TT_LTE: COMPARISON,
+    TT_GTE: COMPARISON,
+    TT_PLUS: ARITHMETIC,
+    TT_MINUS: ARITHMETIC,
+    TT_MUL: TERM,
+    TT_DIV: TERM,
+}
+
+LOGICAL_OPERATORS = ('AN\'', 'OR')
+
+EXPECTED_EXPRESSION = "Expected 'THANG','RECKON','TROT','WHILES','FIXIN'', number, text, name, '+', '-' '(' '[' or 'AIN\'T'"
+EXPECTED_COMPARISON = "Expected number, text, name, '+', '-', '(', '[' or 'AIN\'T'"
+EXPECTED_ATOM = "Expected number, text, name, '+', '-', '(', 'RECKON', 'TROT','WHILES','FIXIN''"
+EXPECTED_END = "Expected number, text, name, '+', '-', '(', '[', 'RECKON', 'TROT', 'WHILES', 'FIXIN''"
+
+class ParseError(Exception):
+    def __init__(self, issue):
+        super().__init__(issue.details)
+        self.issue = issue
+
+class PrattParser:
+    """Drop-in CodeParser replacement that climbs operator precedence in one loop.
+
+    Rules return nodes directly and raise ParseError on bad input. parse()
+    turns that back into a ParseResult holding the same SyntaxIssue that
+    CodeParser reports.
+    """
+    def __init__(self, tokens):
+        self.tokens = iter(tokens)
+        self.current_token = None
+        self.advance()
+
+    def advance(self):
+        token = next(self.tokens, None)
+        if token is not None:
+            self.current_token = token
+        return self.current_token
+
+    def fail(self, details):
+        token = self.current_token
+        raise ParseError(SyntaxIssue(token.start_pos, token.end_pos, details))
+
+    def expect(self, token_type, details):
+        if self.current_token.type != token_type: self.fail(details)
+        self.advance()
+
+    def expect_keyword(self, value, details):
+        if not self.current_token.matches(TT_KEYWORD, value): self.fail(details)
+        self.advance()
+
+    def parse(self):
+        result = ParseResult()
+        try:
+            node = self.parse_expression()
+        except ParseError as error:
+            return result.failure(error.issue)
+
+        if self.current_token.type != TT_EOF:
+            return result.failure(SyntaxIssue(
+                self.current_token.start_pos, self.current_token.end_pos, EXPECTED_END
+            ))
+        return result.success(node)
+
+    def parse_expression(self):
+        if self.current_token.matches(TT_KEYWORD, 'THANG'):
+            self.advance()
+            name_token = self.current_token
+            self.expect(TT_IDENTIFIER, "Expected name")
+            self.expect(TT_EQ, "Expected '='")
+            return VariableAssignmentNode(name_token, self.parse_expression())
+
+        # CodeParser replaces the error of a rule that consumed no tokens with its own message
+        start_token = self.current_token
+        try:
+            return self.parse_operation(LOGICAL)
+        except ParseError:
+            if self.current_token is not start_token: raise
+        self.fail(EXPECTED_EXPRESSION)
+
+    def parse_operation(self, level):
+        left = self.parse_comparison() if level <= COMPARISON else self.parse_factor()
+
+        while True:
+            op_token = self.current_token
+            if op_token.type == TT_KEYWORD:
+                op_level = LOGICAL if op_token.value in LOGICAL_OPERATORS else None
+            else:
+                op_level = OPERATOR_LEVELS.get(op_token.type)
+            if op_level is None or op_level < level:
+                return left
+
+            self.advance()
+            right = self.parse_factor() if op_level == TERM else self.parse_operation(op_level + 1)
+            left = BinaryOperationNode(left, op_token, right)
+
+    def parse_comparison(self):
+        token = self.current_token
+        if token.matches(TT_KEYWORD, 'AIN\'T'):
+            self.advance()
+            return UnaryOperationNode(token, self.parse_operation(COMPARISON))
+
+        try:
+            return self.parse_factor()
+        except ParseError:
+            if self.current_token is not token: raise
+        self.fail(EXPECTED_COMPARISON)
+
+    def parse_factor(self):
+        token = self.current_token
+        if token.type in (TT_PLUS, TT_MINUS):
+            self.advance()
+            return UnaryOperationNode(token, self.parse_factor())
+
+        atom = self.parse_atom()
+        if self.current_token.type != TT_LPAREN:
+            return atom
+
+        self.advance()
+        return FunctionCallNode(atom, self.parse_items(TT_RPAREN, "Expected ',' or ')'"))
+
+    def parse_items(self, closing_type, details):
+        items = []
+        if self.current_token.type == closing_type:
+            self.advance()
+            return items
+
+        items.append(self.parse_expression())
+        while self.current_token.type == TT_COMMA:
+            self.advance()
+            items.append(self.parse_expression())
+
+        self.expect(closing_type, details)
+        return items
+
+    def parse_atom(self):
+        token = self.current_token
+        token_type = token.type
+
+        if token_type in (TT_INT, TT_FLOAT):
+            self.advance()
+            return NumericLiteralNode(token)
+
+        elif token_type == TT_STRING:
+            self.advance()
+            return TextLiteralNode(token)
+
+        elif token_type == TT_IDENTIFIER:
+            self.advance()
+            return VariableAccessNode(token)
+
+        elif token_type == TT_LPAREN:
+            self.advance()
+            expr = self.parse_expression()
+            self.expect(TT_RPAREN, "Expected ')'")
+            return expr
+
+        elif token_type == TT_LSQUARE:
+            self.advance()
+            elements = self.parse_items(TT_RSQUARE, "Expected ',' or ']'")
+            return CollectionNode(elements, token.start_pos, self.current_token.end_pos)
+
+        elif token_type == TT_KEYWORD:
+            if token.value == 'RECKON':
+                return self.parse_conditional()
+            elif token.value == 'TROT':
+                return self.parse_loop()
+            elif token.value == 'WHILES':
+                return self.parse_while_loop()
+            elif token.value == 'FIXIN\'':
+                return self.parse_function_definition()
+
+        self.fail(EXPECTED_ATOM)
+
+    def parse_conditional(self):
+        cases = []
+        default_case = None
+        keyword = 'RECKON'
+
+        while self.current_token.matches(TT_KEYWORD, keyword):
+            self.advance()
+            condition = self.parse_expression()
+            self.expect_keyword('THEN', "Expected 'THEN'")
+            cases.append((condition, self.parse_expression()))
+            keyword = 'MIGHTCOULD'
+
+        if self.current_token.matches(TT_KEYWORD, 'ELSE'):
+            self.advance()
+            default_case = self.parse_expression()
+
+        return ConditionalNode(cases, default_case)
+
+    def parse_loop(self):
+        self.advance()
+        var_token = self.current_token
+        self.expect(TT_IDENTIFIER, "Expected variable name")
+        self.expect(TT_EQ, "Expected '='")
+        start_value = self.parse_expression()
+        self.expect_keyword('T\'', "Expected 'T''")
+        end_value = self.parse_expression()
+
+        step_value = None
+        if self.current_token.matches(TT_KEYWORD, 'BY_A_PEICE'):
+            self.advance()
+            step_value = self.parse_expression()
+
+        self.expect_keyword('THEN', "Expected 'THEN'")
+        body = self.parse_expression()
+        return LoopNode(var_token, start_value, end_value, step_value, body)
+
+    def parse_while_loop(self):
+        self.advance()
+        condition = self.parse_expression()
+        self.expect_keyword('THEN', "Expected 'THEN'")
+
+        body_nodes = []
+        while (self.current_token.type != TT_EOF and
+            not self.current_token.matches(TT_KEYWORD, 'WHILES') and
+            not self.current_token.matches(TT_KEYWORD, 'RECKON') and
+            not self.current_token.matches(TT_KEYWORD, 'TROT')):
+            body_nodes.append(self.parse_expression())
+            if self.current_token.type == TT_COMMA:
+                self.advance()
+
+        if len(body_nodes) > 1:
+            body = CollectionNode(body_nodes, body_nodes[0].start_pos, body_nodes[-1].end_pos)
+        else:
+            body = body_nodes[0] if body_nodes else None
+
+        return WhileLoopNode(condition, body)
+
+    def parse_function_definition(self):
+        self.advance()
+        func_name_token = None
+
+        if self.current_token.type == TT_IDENTIFIER:
+            func_name_token = self.current_token
+            self.advance()
+            if self.current_token.type != TT_LPAREN: self.fail("Expected '('")
+        elif self.current_token.type != TT_LPAREN:
+            self.fail("Expected name or '('")
+
+        self.advance()
+        param_names = []
+
+        if self.current_token.type == TT_IDENTIFIER:
+            param_names.append(self.current_token)
+            self.advance()
+
+            while self.current_token.type == TT_COMMA:
+                self.advance()
+                param_names.append(self.current_token)
+                self.expect(TT_IDENTIFIER, "Expected name")
+
+            self.expect(TT_RPAREN, "Expected ',' or ')'")
+        else:
+            self.expect(TT_RPAREN, "Expected name or ')'")
+
+        self.expect(TT_ARROW, "Expected '->'")
+        return FunctionDefinitionNode(func_name_token, param_names, self.parse_expression())
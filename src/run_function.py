@@ -1,24 +1,10 @@
 from .runtime_result import RuntimeResult
 from .errors import RuntimeIssue
-from .values import TextValue, NumericValue
+from .values import BaseFunction, TextValue, NumericValue
 
-class ScriptExecutor:
-    def __init__(self):
-        self.start_pos = None
-        self.end_pos = None
-        self.context = None
-        
-    def set_position(self, start_pos=None, end_pos=None):
-        self.start_pos = start_pos
-        self.end_pos = end_pos
-        return self
-        
-    def set_context(self, context=None):
-        self.context = context
-        return self
-        
+class ScriptExecutor(BaseFunction):
     def execute(self, args):
-        from .init import execute
+        from .init import parse_file_cached, evaluate
         
         result = RuntimeResult()
         if not hasattr(self, 'context') or not self.context:
@@ -37,16 +23,17 @@ class ScriptExecutor:
             
         filename = args[0].value
         try:
-            with open(filename, "r") as f:
-                script = f.read()
-        except Exception as e:
+            # The script's value is never used
+            syntax_tree, error = parse_file_cached(filename, optimize=True, discard=True)
+        except (OSError, UnicodeDecodeError) as e:
             return result.failure(RuntimeIssue(
                 self.start_pos, self.end_pos,
                 f"Failed to load script '{filename}': {str(e)}",
                 self.context
             ))
             
-        _, error = execute(filename, script, self.context)
+        if not error:
+            _, error = evaluate(syntax_tree, self.context, self.context.running_engine() or 'tree')
         if error:
             return result.failure(RuntimeIssue(
                 self.start_pos, self.end_pos,
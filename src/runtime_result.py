@@ -15,4 +15,23 @@ class RuntimeResult:
         
     def failure(self, error):
         self.error = error
-        return self
\ No newline at end of file
+        return self
+
+class IssueRaised(Exception):
+    """A RuntimeIssue on its way up through CodeRunner, in place of a failed RuntimeResult.
+
+    The tree walker returns plain values and raises this when evaluation
+    fails, so nodes that succeed make no RuntimeResult and check nothing.
+    CodeRunner.evaluate() and call() turn it back into a RuntimeResult.
+    """
+    def __init__(self, issue):
+        super().__init__(issue.details)
+        self.issue = issue
+
+class TailCall:
+    """A call in tail position of a function body, returned for the engine's call loop to make"""
+    __slots__ = ('func', 'args')
+
+    def __init__(self, func, args):
+        self.func = func
+        self.args = args
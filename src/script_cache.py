@@ -0,0 +1,82 @@
+import gc
+import marshal
+import os
+import threading
+from array import array
+from hashlib import blake2b
+
+from .flat_ast import FlatTree
+from .position import register_lines, source_for, keep_source
+
+# Bump whenever nodes or tokens change shape so stale .ssc files are ignored
+CACHE_VERSION = 2
+MAGIC = b'SSC' + CACHE_VERSION.to_bytes(2, 'little')
+CACHE_DIR_NAME = '__sscache__'
+READ_SIZE = 1 << 16
+
+enabled = True
+# When set, every .ssc file goes here instead of next to its script
+cache_root = None
+
+def source_digest(stream):
+    digest = blake2b(digest_size=16)
+    chunk = stream.read(READ_SIZE)
+    while chunk:
+        digest.update(chunk.encode('utf-8', 'surrogatepass'))
+        chunk = stream.read(READ_SIZE)
+    return digest.digest()
+
+def cache_path(filename):
+    path = os.path.abspath(filename)
+    if cache_root is not None:
+        name = blake2b(path.encode('utf-8', 'surrogatepass'), digest_size=16).hexdigest()
+        return os.path.join(cache_root, name + '.ssc')
+    directory, name = os.path.split(path)
+    return os.path.join(directory, CACHE_DIR_NAME, os.path.splitext(name)[0] + '.ssc')
+
+def load(filename, digest):
+    """Return the cached syntax tree of filename, or None if there is no valid cache"""
+    if not enabled: return None
+    try:
+        with open(cache_path(filename), 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC or f.read(len(digest)) != digest:
+                return None
+            line_data, state = marshal.loads(f.read())
+        line_starts = array('q')
+        line_starts.frombytes(line_data)
+        flat_tree = FlatTree.from_state(state)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+
+    source = register_lines(filename, line_starts)
+    # The tree has no reference cycles, so collecting while it is rebuilt only costs time
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        syntax_tree = flat_tree.to_tree(source.base)
+    except Exception:
+        # Columns that do not fit together make a damaged file, which is re-parsed like a stale one
+        return None
+    finally:
+        if collecting: gc.enable()
+    keep_source(syntax_tree, source)
+    return syntax_tree
+
+def store(filename, digest, syntax_tree):
+    if not enabled: return
+    path = cache_path(filename)
+    source = source_for(syntax_tree.start_pos)
+    temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+
+    try:
+        payload = marshal.dumps((source.line_starts.tobytes(), FlatTree.from_tree(syntax_tree).state()))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(temp_path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(digest)
+            f.write(payload)
+        os.replace(temp_path, path)
+    except OSError:
+        # A missing cache only costs a re-parse, like an unwritable __pycache__
+        try: os.unlink(temp_path)
+        except OSError: pass
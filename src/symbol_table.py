@@ -1,13 +1,121 @@
+from itertools import count
+from threading import Lock
+from weakref import WeakValueDictionary
+
+# One Epoch per name, set to a new number whenever a table gains that name, see
+# NameCache. Only caches read them, so a name's goes once no cache holds it.
+# next() on a count is atomic, so no two threads set the same number
+name_epochs = WeakValueDictionary()
+epochs = count(1)
+# Held while making an Epoch, so threads never make two for one name
+epochs_lock = Lock()
+
+# Caches holding on to parts of the run in progress, which let go of them in
+# release_caches() once it ends, so trees kept in the syntax cache keep no run alive
+holding = set()
+
+def release_caches():
+    for cache in holding: cache.release()
+    holding.clear()
+
+class Epoch:
+    """Counter of one name, see name_epochs"""
+    __slots__ = ('value', '__weakref__')
+
+    def __init__(self):
+        self.value = 0
+
+def epoch_of(name):
+    epoch = name_epochs.get(name)
+    if epoch is None:
+        with epochs_lock:
+            epoch = name_epochs.get(name)
+            if epoch is None:
+                epoch = name_epochs[name] = Epoch()
+    return epoch
+
 class SymbolStorage:
+    # Names kept outside symbols, which only FrameStorage has
+    layout = {}
+
     def __init__(self, parent=None):
         self.symbols = {}
         self.parent = parent
         
     def get(self, name):
-        value = self.symbols.get(name, None)
-        if value is None and self.parent:
-            return self.parent.get(name)
-        return value
+        # A loop rather than recursion, since call chains can be as deep as tail recursion goes
+        table = self
+        while table is not None:
+            index = table.layout.get(name)
+            value = table.symbols.get(name) if index is None else table.slots[index]
+            if value is not None: return value
+            table = table.parent
+        return None
         
     def add(self, name, value):
-        self.symbols[name] = value
\ No newline at end of file
+        if name not in self.symbols:
+            epoch = name_epochs.get(name)
+            if epoch is not None: epoch.value = next(epochs)
+        self.symbols[name] = value
+
+class FrameStorage(SymbolStorage):
+    """Storage of a function call that keeps the function's own names in a list.
+
+    layout maps every parameter and every name the body assigns to an index
+    in slots, so accesses the optimizer resolved to a slot skip the dicts.
+    Lookups by name still see them, as callers' frames do under dynamic
+    scoping, and any other name, such as one a FIREUP'd script assigns,
+    lives in symbols as usual.
+    """
+    def __init__(self, parent, layout):
+        super().__init__(parent)
+        self.layout = layout
+        self.slots = [None] * len(layout)
+
+    def add(self, name, value):
+        index = self.layout.get(name)
+        if index is None:
+            super().add(name, value)
+        else:
+            self.slots[index] = value
+
+class NameCache:
+    """Where one access site last found its name, like CPython's LOAD_GLOBAL cache"""
+    __slots__ = ('name', 'epoch', 'walk')
+
+    def __init__(self, name):
+        self.name = name
+        self.epoch = epoch_of(name)
+        self.walk = None
+
+    def get(self, storage):
+        name = self.name
+        seen = self.epoch.value
+        # (storage, table, epoch): the table holds the name for lookups from storage until a
+        # table gains it. Replaced whole, so other threads never see half of one
+        walk = self.walk
+        valid = walk is not None and walk[2] == seen
+        table = storage
+        while table is not None:
+            # Reaching the storage of the cached walk means the rest of the walk is known
+            if valid and table is walk[0]:
+                value = walk[1].symbols[name]
+                # A None binding is looked past, see SymbolStorage.get
+                if value is None: return storage.get(name)
+                if table is not storage: self.walk = (storage, walk[1], seen)
+                return value
+            # Stores to a slot bump no epoch
+            if name in table.layout: return storage.get(name)
+            symbols = table.symbols
+            value = symbols.get(name)
+            if value is not None:
+                if walk is None: holding.add(self)
+                self.walk = (storage, table, seen)
+                return value
+            # Nor does rebinding a None binding looked past
+            if name in symbols: return storage.get(name)
+            table = table.parent
+        return None
+
+    def release(self):
+        self.walk = None
@@ -0,0 +1,73 @@
+from collections import OrderedDict
+from hashlib import blake2b
+from threading import Lock
+
+class SyntaxTreeCache:
+    """LRU cache of parse results keyed by a digest of the file name and source.
+
+    Each entry is charged the size put() is given, an estimate of the memory
+    it holds (see init.tree_size), so max_bytes bounds what the cache keeps
+    alive. Code the engines later cache on a tree is not counted. Threads
+    share one cache, which takes its lock for each call.
+    """
+    def __init__(self, max_entries=512, max_bytes=16 << 20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.lock = Lock()
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(filename, source_code, *options):
+        digest = blake2b(digest_size=16)
+        digest.update(filename.encode('utf-8', 'surrogatepass'))
+        digest.update(b'\0')
+        digest.update(source_code.encode('utf-8', 'surrogatepass'))
+        for option in options:
+            digest.update(b'\0' + repr(option).encode('utf-8', 'surrogatepass'))
+        return digest.digest()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, result, size):
+        if size > self.max_bytes or self.max_entries <= 0: return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None: self.size -= old[1]
+
+            self.entries[key] = (result, size)
+            self.size += size
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'bytes': self.size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
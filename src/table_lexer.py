@@ -0,0 +1,162 @@
+import re
+
+from .tokens import Token
+from .errors import BadCharacterError, MissingCharacterError
+from .position import register_source, register_stream
+from .constants import *
+
+TOKEN_PATTERN = re.compile(r'''
+    (?P<SPACE>[ \t]+)
+  | (?P<TICK>T')
+  | (?P<NAME>[A-Za-z][A-Za-z0-9_']*)
+  | (?P<NUMBER>[0-9]+(?:\.[0-9]*)?)
+  | (?P<OPERATOR>->|==|!=|<=|>=|[-+*/()\[\]=<>,])
+  | (?P<STRING>"[^"]*"?)
+  | (?P<COMMENT>\#[^\n]*\n?)
+  | (?P<BANG>!)
+  | (?P<BAD>.)
+''', re.VERBOSE | re.DOTALL)
+
+OPERATOR_TYPES = {
+    '+': TT_PLUS,
+    '-': TT_MINUS,
+    '*': TT_MUL,
+    '/': TT_DIV,
+    '(': TT_LPAREN,
+    ')': TT_RPAREN,
+    '[': TT_LSQUARE,
+    ']': TT_RSQUARE,
+    '=': TT_EQ,
+    '==': TT_EE,
+    '!=': TT_NE,
+    '<': TT_LT,
+    '>': TT_GT,
+    '<=': TT_LTE,
+    '>=': TT_GTE,
+    ',': TT_COMMA,
+    '->': TT_ARROW,
+}
+
+KEYWORD_SET = frozenset(KEYWORDS)
+
+CHUNK_SIZE = 1 << 14
+
+class TableTokenMaker:
+    """Drop-in TokenMaker replacement that matches whole tokens with one compiled pattern"""
+    def __init__(self, filename, text, source=None):
+        self.filename = filename
+        self.text = text
+        self.source = source or register_source(filename, text)
+
+    def generate_tokens(self):
+        token_list, stop, issue = self.scan(self.text, 0, True)
+        if issue: return [], issue
+        token_list.append(Token(TT_EOF, start_pos=self.source.base + stop))
+        return token_list, None
+
+    def scan(self, text, offset, final):
+        """Tokenize text starting at offset in the file.
+
+        Returns the tokens, the index where scanning stopped and any issue.
+        Unless final is set, a token touching the end of text may continue in
+        the next chunk, so scanning stops before it.
+        """
+        base = self.source.base + offset
+        token_list = []
+        append = token_list.append
+        stop = len(text)
+
+        for match in TOKEN_PATTERN.finditer(text):
+            kind = match.lastgroup
+            start, end = match.span()
+
+            if end == stop and not final:
+                return token_list, start, None
+            elif kind == 'SPACE':
+                continue
+            elif kind == 'NAME':
+                value = match.group()
+                token_type = TT_KEYWORD if value in KEYWORD_SET else TT_IDENTIFIER
+            elif kind == 'OPERATOR':
+                token_type = OPERATOR_TYPES[match.group()]
+                value = None
+            elif kind == 'NUMBER':
+                num_str = match.group()
+                if '.' in num_str:
+                    token_type, value = TT_FLOAT, float(num_str)
+                else:
+                    token_type, value = TT_INT, int(num_str)
+            elif kind == 'STRING':
+                raw = match.group()
+                if len(raw) > 1 and raw[-1] == '"':
+                    raw = raw[1:-1]
+                else:
+                    raw = raw[1:]
+                    end += 1
+                    stop = end
+                token_type, value = TT_STRING, raw.replace('\\', '')
+            elif kind == 'COMMENT':
+                if text[end - 1] != '\n':
+                    stop = end + 1
+                continue
+            elif kind == 'TICK':
+                token_type, value = TT_KEYWORD, "T'"
+            elif kind == 'BANG':
+                return token_list, start, MissingCharacterError(
+                    base + start, base + start + 2, "'=' after '!'"
+                )
+            else:
+                return token_list, start, BadCharacterError(
+                    base + start, base + end, "'" + match.group() + "'"
+                )
+
+            append(Token(token_type, value, base + start, base + end))
+
+        return token_list, stop, None
+
+class StreamTokenMaker(TableTokenMaker):
+    """Lazily tokenizes a text file object, reading it in chunks.
+
+    Given digest, a hash of the text, it shares the map of an earlier
+    stream of the same text, and leaves that map's lines as they are.
+    """
+    def __init__(self, filename, stream, chunk_size=CHUNK_SIZE, digest=None):
+        self.filename = filename
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.source = register_stream(filename, digest)
+        self.issue = None
+
+    def generate_tokens(self):
+        token_list = list(self.stream_tokens())
+        if self.issue: return [], self.issue
+        return token_list, None
+
+    def stream_tokens(self):
+        buffer = ''
+        offset = 0
+        final = False
+        source = self.source
+        reading = not source.complete
+
+        while not final:
+            chunk = self.stream.read(self.chunk_size)
+            final = not chunk
+            if reading: source.add_lines(chunk, offset + len(buffer))
+            buffer += chunk
+
+            token_list, stop, issue = self.scan(buffer, offset, final)
+            yield from token_list
+
+            if issue:
+                # The same text stops at the same place, so no position goes past these lines
+                source.complete = True
+                self.issue = issue
+                yield Token(TT_EOF, start_pos=issue.start_pos)
+                return
+
+            buffer = buffer[stop:]
+            offset += stop
+
+        source.complete = True
+        yield Token(TT_EOF, start_pos=source.base + offset)
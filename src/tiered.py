@@ -0,0 +1,122 @@
+import sys
+
+from .runtime_result import IssueRaised
+from .values import NumericValue, CustomFunction
+from .interpreter import CodeRunner
+from .transpiler import TranspiledCode, is_numeric_tree
+from .nodes import VariableAccessNode, FunctionDefinitionNode, LoopNode, iter_child_nodes
+from .nodes import cached_form, cache_form
+from .position import source_for
+
+# Runs on the tree walker after which a loop or function body is compiled
+TIER_UP_THRESHOLD = 1000
+# Failed guards after which compiled code is dropped and the body counted again
+MAX_GUARD_FAILURES = 8
+
+def speculated_names(node, names, fused=False):
+    """Add the names node's fused arithmetic bets are numbers, which infer_types did not prove"""
+    if isinstance(node, VariableAccessNode):
+        if fused and not node.numeric: names.add(node.token.value)
+    elif not isinstance(node, FunctionDefinitionNode):
+        # Other functions run in contexts of their own, and get counted on their own
+        fused = fused or is_numeric_tree(node)
+        for child in iter_child_nodes(node):
+            speculated_names(child, names, fused)
+    return names
+
+def describe(node, owner):
+    """Where the body node of owner, a loop node or CustomFunction, is, for the debug output"""
+    if type(owner) is CustomFunction:
+        label = f"FIXIN' {owner.name}"
+    else:
+        label = 'TROT body' if type(owner) is LoopNode else 'WHILES body'
+    source = source_for(node.start_pos)
+    return f'{source.filename}, line {source.line(node.start_pos) + 1}: {label}'
+
+class HotSpot:
+    """What TieredRunner keeps in the compiled slot of a body: its runs, and
+    once there were enough of them, the TieredCode compiled from it"""
+    __slots__ = ('runs', 'code')
+
+    def __init__(self):
+        self.runs = 0
+        self.code = None
+
+class TieredCode(TranspiledCode):
+    """A body TieredRunner compiled, with the guards it may run under.
+
+    The code is only valid for storage of the type it was compiled under,
+    and guards lists the names whose values were numbers then and that its
+    fused arithmetic expects to stay numbers; anything else would make it
+    deoptimize on every run.
+    """
+    def __init__(self, node, body, storage):
+        super().__init__(node, body)
+        self.storage_type = type(storage)
+        self.guards = tuple(sorted(
+            name for name in speculated_names(node, set()) if type(storage.get(name)) is NumericValue
+        ))
+        self.failures = 0
+
+    def broken_guard(self, storage):
+        """The reason the code cannot run on storage, or None"""
+        if type(storage) is not self.storage_type:
+            return f'storage is now {type(storage).__name__}'
+        for name in self.guards:
+            if type(storage.get(name)) is not NumericValue:
+                return f"'{name}' is no longer a number"
+        return None
+
+class TieredRunner(CodeRunner):
+    """CodeRunner that compiles the loop and function bodies that run often.
+
+    Every body starts on the tree walker, which costs nothing up front, with
+    a HotSpot counting its runs. After threshold runs, the body is translated
+    to Python like PythonTranspiler does, and later runs use that TieredCode
+    unless one of its guards fails. Compiled code calls functions the way
+    PythonTranspiler does, so what a hot body calls is compiled when called.
+    Set debug to print each tier change to stderr.
+    """
+    threshold = TIER_UP_THRESHOLD
+    debug = False
+
+    def evaluate_loop_body(self, node, context):
+        code = self.hot_code(node.body, context, node)
+        if code is None: return self.visit(node.body, context)
+        value, issue = code.run(context)
+        if issue: raise IssueRaised(issue)
+        return value
+
+    def evaluate_function_body(self, func, context):
+        code = self.hot_code(func.body_node, context, func, body=True)
+        if code is None: return self.evaluate_tail(func.body_node, context)
+        value, issue = code.run(context)
+        if issue: raise IssueRaised(issue)
+        return value
+
+    def hot_code(self, node, context, owner, body=False):
+        """The compiled code to run node, the body of owner, with in context, or None to walk it"""
+        spot = getattr(node, 'compiled', None)
+        if type(spot) is not HotSpot:
+            spot = cached_form(node, HotSpot) or cache_form(node, HotSpot())
+        code = spot.code
+        if code is None:
+            spot.runs += 1
+            if spot.runs < self.threshold: return None
+            code = spot.code = TieredCode(node, body, context.symbol_storage)
+            self.log(node, owner, f'compiled after {self.threshold} runs, guarding {", ".join(code.guards) or "nothing"}')
+
+        reason = code.broken_guard(context.symbol_storage)
+        if reason is None: return code
+        code.failures += 1
+        if code.failures < MAX_GUARD_FAILURES:
+            self.log(node, owner, f'guard failed ({reason}), running on the tree walker')
+        else:
+            self.log(node, owner, f'guard failed ({reason}) {code.failures} times, dropping compiled code')
+            spot.runs = 0
+            spot.code = None
+        return None
+
+    def log(self, node, owner, message):
+        if self.debug:
+            print(f'[tier] {describe(node, owner)}: {message}', file=sys.stderr)
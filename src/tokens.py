@@ -1,17 +1,14 @@
-from .position import TextPosition
-
 class Token:
+    __slots__ = ('type', 'value', 'start_pos', 'end_pos')
+
     def __init__(self, type_, value=None, start_pos=None, end_pos=None):
         self.type = type_
         self.value = value
-        
-        if start_pos:
-            self.start_pos = start_pos.copy()
-            self.end_pos = start_pos.copy()
-            self.end_pos.advance()
-            
-        if end_pos:
-            self.end_pos = end_pos.copy()
+        self.start_pos = start_pos
+        self.end_pos = end_pos
+
+        if start_pos is not None and end_pos is None:
+            self.end_pos = start_pos + 1
             
     def matches(self, type_, value):
         return self.type == type_ and self.value == value
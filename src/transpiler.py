@@ -0,0 +1,523 @@
+from .runtime_result import RuntimeResult, TailCall
+from .values import NumericValue, TextValue, Collection, number
+from .values import BaseFunction, CustomFunction
+from .errors import RuntimeIssue
+from .operation_cache import BINARY_METHODS, BINARY_OPERATORS, unary_spans
+from .closure_compiler import ClosureCompiler
+from .syntax_cache import SyntaxTreeCache
+from .nodes import *
+from .constants import *
+
+# Raw Python forms of the NumericValue operations, used when every operand is a number
+RAW_OPERATIONS = {
+    'add': '{} + {}',
+    'subtract': '{} - {}',
+    'multiply': '{} * {}',
+    'divide': '{} / {}',
+    'compare_equal': '1 if {} == {} else 0',
+    'compare_not_equal': '1 if {} != {} else 0',
+    'compare_less_than': '1 if {} < {} else 0',
+    'compare_greater_than': '1 if {} > {} else 0',
+    'compare_less_or_equal': '1 if {} <= {} else 0',
+    'compare_greater_or_equal': '1 if {} >= {} else 0',
+    'logical_and': 'int({} and {})',
+    'logical_or': 'int({} or {})',
+}
+
+# Generated code objects keyed by a digest of their Python source
+code_cache = SyntaxTreeCache(max_entries=256)
+
+class Deoptimize(Exception):
+    pass
+
+def new_function(template, context, start_pos, end_pos):
+    func_name, body_node, param_names, layout = template
+    func_value = CustomFunction(func_name, body_node, param_names, layout)
+    func_value.set_context(context)
+    func_value.set_position(start_pos, end_pos)
+    return func_value
+
+def loop_steps(current, end, step, ascending):
+    while (current <= end) if ascending else (current >= end):
+        yield current
+        current += step
+
+def call(func, args):
+    if type(func) is not CustomFunction:
+        call_result = func.execute(args)
+        if call_result.error: return None, call_result.error
+        return call_result.value, None
+
+    while True:
+        exec_context = func.create_context()
+        check = func.check_and_populate_args(func.param_names, args, exec_context)
+        if check.error: return None, check.error
+        value, issue = compiled(func.body_node, body=True).run(exec_context)
+        if type(value) is not TailCall: return value, issue
+        func, args = value.func, value.args
+
+def compiled(node, body=False):
+    code = getattr(node, 'compiled', None)
+    if type(code) is not TranspiledCode:
+        code = cached_form(node, TranspiledCode) or cache_form(node, TranspiledCode(node, body))
+    return code
+
+RUNTIME = {
+    'NumericValue': NumericValue,
+    'Collection': Collection,
+    'RuntimeIssue': RuntimeIssue,
+    'Deoptimize': Deoptimize,
+    'number': number,
+    'new_function': new_function,
+    'loop_steps': loop_steps,
+    'call': call,
+    'BaseFunction': BaseFunction,
+    'CustomFunction': CustomFunction,
+    'TailCall': TailCall,
+}
+
+def is_numeric_leaf(node):
+    return isinstance(node, (NumericLiteralNode, VariableAccessNode))
+
+def is_numeric_tree(node):
+    """True for operators over literals and names only, which are safe to run twice"""
+    if isinstance(node, BinaryOperationNode):
+        op_token = node.op_token
+        key = op_token.value if op_token.type == TT_KEYWORD else op_token.type
+        return (key in BINARY_OPERATORS and
+                (is_numeric_leaf(node.left_node) or is_numeric_tree(node.left_node)) and
+                (is_numeric_leaf(node.right_node) or is_numeric_tree(node.right_node)))
+    if isinstance(node, UnaryOperationNode):
+        return is_numeric_leaf(node.node) or is_numeric_tree(node.node)
+    if isinstance(node, (HoistedNode, SharedNode, ReusedNode)):
+        return is_numeric_tree(node.node)
+    return False
+
+class UnitGenerator:
+    """Writes the Python source of one compiled unit: a program or a function body.
+
+    The unit is a function of the context that returns (value, issue) like
+    the value operations, and reports errors with the same positions and
+    contexts CodeRunner gives them. Operator trees over numbers and names
+    run on plain Python numbers inside a try block. Anything unexpected,
+    such as a name that is not a number or a division by zero, drops into
+    the except block, which evaluates the same tree with full values and so
+    produces exactly CodeRunner's error.
+    """
+    def __init__(self):
+        self.lines = []
+        self.indent = 1
+        self.temps = 0
+        self.constants = []
+        self.fusing = True
+        self.raw_values = {}
+        self.uses_slots = False
+
+    def source(self, node, body=False):
+        result = self.emit_tail(node) if body else self.emit(node)
+        header = [
+            'def unit(context):',
+            '    storage = context.symbol_storage',
+            '    symbols = storage.symbols',
+            '    get = storage.get',
+            '    add = storage.add',
+        ]
+        if self.uses_slots:
+            # Only function bodies have resolved names, and they run on a FrameStorage
+            header.append('    slots = storage.slots')
+        return '\n'.join(header + self.lines + [f'    return {result}, None']) + '\n'
+
+    def line(self, text):
+        self.lines.append('    ' * self.indent + text)
+
+    def temp(self, prefix='t'):
+        self.temps += 1
+        return f'{prefix}{self.temps}'
+
+    def constant(self, value):
+        self.constants.append(value)
+        return len(self.constants) - 1
+
+    def fail(self, node, details):
+        self.line(f'return None, RuntimeIssue({node.start_pos}, {node.end_pos}, {details!r}, context)')
+
+    def check(self):
+        self.line('if issue: return None, issue')
+
+    def emit(self, node):
+        if self.fusing and is_numeric_tree(node):
+            return self.emit_fused(node)
+        method_name = f'emit_{type(node).__name__}'
+        method = getattr(self, method_name, self.no_method_found)
+        return method(node)
+
+    def no_method_found(self, node):
+        raise Exception(f'No handler for {type(node).__name__}')
+
+    def emit_tail(self, node):
+        # A function body, whose calls in tail position return a TailCall
+        if type(node) is ConditionalNode:
+            return self.emit_ConditionalNode(node, self.emit_tail)
+        if type(node) is FunctionCallNode:
+            return self.emit_FunctionCallNode(node, tail=True)
+        if type(node) is InlinedCallNode:
+            return self.emit_InlinedCallNode(node, tail=True)
+        return self.emit(node)
+
+    def emit_fused(self, node, condition=False):
+        target = self.temp('c' if condition else 't')
+        # Raw values of SharedNodes, only set inside this try block
+        self.raw_values = {}
+        self.line('try:')
+        self.indent += 1
+        raw = self.emit_raw(node)
+        if condition:
+            self.line(f'{target} = {raw} != 0')
+        else:
+            self.line(f'{target} = number({raw})')
+        self.indent -= 1
+        self.line('except Exception:')
+        self.indent += 1
+        self.fusing = False
+        value = self.emit(node)
+        self.fusing = True
+        self.line(f'{target} = {value}.is_true()' if condition else f'{target} = {value}')
+        self.indent -= 1
+        return target
+
+    def emit_raw(self, node):
+        if isinstance(node, NumericLiteralNode):
+            return repr(node.token.value)
+
+        if isinstance(node, SharedNode):
+            self.raw_values[node] = self.emit_raw(node.node)
+            # A ReusedNode outside this block must not find an older value
+            self.line(f'K[{self.constant(node)}].cached = None')
+            return self.raw_values[node]
+        if isinstance(node, ReusedNode):
+            return self.raw_values.get(node.shared) or self.emit_raw(node.node)
+
+        target = self.temp('r')
+        if isinstance(node, HoistedNode):
+            self.line(f'{target} = K[{self.constant(node)}].cached')
+            self.line(f'if {target} is None or {target}[0] is not context or type({target}[1]) is not NumericValue:')
+            self.line('    raise Deoptimize')
+            self.line(f'{target} = {target}[1].value')
+        elif isinstance(node, VariableAccessNode):
+            var_name = node.token.value
+            self.line(f'{target} = {self.slot_lookup(node)}')
+            self.line(f'if {target} is None: {target} = {self.name_lookup(node)}')
+            if not node.numeric:
+                # Only names Optimizer.infer_types proved hold numbers skip the check
+                self.line(f'if type({target}) is not NumericValue: raise Deoptimize')
+            self.line(f'{target} = {target}.value')
+        elif isinstance(node, BinaryOperationNode):
+            left = self.emit_raw(node.left_node)
+            right = self.emit_raw(node.right_node)
+            op_token = node.op_token
+            key = op_token.value if op_token.type == TT_KEYWORD else op_token.type
+            operation = RAW_OPERATIONS[BINARY_METHODS[BINARY_OPERATORS[key]]]
+            self.line(f'{target} = ' + operation.format(left, right))
+        else:
+            operand = self.emit_raw(node.node)
+            if node.op_token.type == TT_MINUS:
+                self.line(f'{target} = {operand} * -1')
+            elif node.op_token.matches(TT_KEYWORD, 'AIN\'T'):
+                self.line(f'{target} = 1 if {operand} == 0 else 0')
+            else:
+                return operand
+        return target
+
+    def emit_condition(self, node):
+        if self.fusing and is_numeric_tree(node):
+            return self.emit_fused(node, condition=True)
+        return f'{self.emit(node)}.is_true()'
+
+    def emit_NumericLiteralNode(self, node):
+        # Shared by every run, see BaseType
+        target = self.temp()
+        self.line(f'{target} = K[{self.constant(number(node.token.value))}]')
+        return target
+
+    def emit_TextLiteralNode(self, node):
+        target = self.temp()
+        self.line(f'{target} = K[{self.constant(TextValue(node.token.value))}]')
+        return target
+
+    def emit_CollectionNode(self, node):
+        items = [self.emit(item_node) for item_node in node.items]
+        if node.discard: return 'None'
+        target = self.temp()
+        self.line(f'{target} = Collection([{", ".join(items)}])')
+        return target
+
+    def slot_lookup(self, node):
+        # Either way the result is None when the name has to be looked up by name_lookup()
+        if node.slot is None:
+            return f'symbols.get({node.token.value!r})'
+        self.uses_slots = True
+        return f'slots[{node.slot}]'
+
+    def name_lookup(self, node):
+        if node.slot is None:
+            return f'K[{self.constant(node.name_cache())}].get(storage)'
+        return f'get({node.token.value!r})'
+
+    def emit_VariableAccessNode(self, node, callee=False):
+        # A callee is left for the call to copy, any other read is as in CodeRunner.process_VariableAccessNode
+        var_name = node.token.value
+        target = self.temp()
+        if node.slot is None:
+            self.line(f'{target} = {self.name_lookup(node)}')
+        else:
+            self.line(f'{target} = {self.slot_lookup(node)} or {self.name_lookup(node)}')
+        self.line(f'if not {target}:')
+        self.indent += 1
+        self.fail(node, f"'{var_name}' ain't defined")
+        self.indent -= 1
+        if not callee: self.in_context(target)
+        return target
+
+    def emit_callee(self, node):
+        if type(node) is VariableAccessNode: return self.emit_VariableAccessNode(node, callee=True)
+        return self.emit(node)
+
+    def in_context(self, target):
+        self.line(f'if isinstance({target}, BaseFunction): {target} = {target}.copy().set_context(context)')
+
+    def emit_VariableAssignmentNode(self, node):
+        value = self.emit(node.value_node)
+        if node.slot is None:
+            self.line(f'add({node.token.value!r}, {value})')
+        else:
+            self.uses_slots = True
+            self.line(f'slots[{node.slot}] = {value}')
+        return value
+
+    def emit_BinaryOperationNode(self, node):
+        left = self.emit(node.left_node)
+        right = self.emit(node.right_node)
+        cache = node.operation_cache()
+        if cache is None:
+            self.fail(node, f"Unknown operator: {node.op_token}")
+            return 'None'
+
+        target, cache = self.temp(), self.constant(cache)
+        self.line(f'{target}, issue = K[{cache}].run({left}, {right})')
+        self.line(f'if issue: return None, issue.locate(K[{cache}].spans, context)')
+        return target
+
+    def emit_UnaryOperationNode(self, node):
+        operand = self.emit(node.node)
+        if node.op_token.type == TT_MINUS:
+            operation = 'multiply(NumericValue(-1))'
+        elif node.op_token.matches(TT_KEYWORD, 'AIN\'T'):
+            operation = 'logical_not()'
+        else:
+            return operand
+        target = self.temp()
+        self.line(f'{target}, issue = {operand}.{operation}')
+        self.line(f'if issue: return None, issue.locate(K[{self.constant(unary_spans(node))}], context)')
+        return target
+
+    def emit_ConditionalNode(self, node, emit_expr=None):
+        emit_expr = emit_expr or self.emit
+        target = self.temp()
+        depth = self.indent
+        for condition, expr in node.cases:
+            self.line(f'if {self.emit_condition(condition)}:')
+            self.indent += 1
+            self.line(f'{target} = {emit_expr(expr)}')
+            self.indent -= 1
+            self.line('else:')
+            self.indent += 1
+
+        if node.default_case:
+            self.line(f'{target} = {emit_expr(node.default_case)}')
+        else:
+            self.line(f'{target} = None')
+        self.indent = depth
+        return target
+
+    def emit_LoopNode(self, node):
+        start = self.emit(node.start_value)
+        end = self.emit(node.end_value)
+        if node.step_value:
+            step = self.emit(node.step_value)
+        else:
+            step = self.temp()
+            self.line(f'{step} = NumericValue(1)')
+        self.line(f'if {step}.value == 0:')
+        self.indent += 1
+        self.fail(node, "Step value cannot be zero")
+        self.indent -= 1
+
+        current, ascending, steps, items = self.temp('i'), self.temp('up'), self.temp('steps'), self.temp('items')
+        self.line(f'{current} = {start}.value')
+        self.line(f'{step} = {step}.value')
+        self.line(f'{ascending} = {step} > 0')
+        self.line(f'{end} = {end}.value')
+        # range() takes the same steps as CodeRunner's while loop when all three are ints
+        self.line(f'if type({current}) is int and type({step}) is int and type({end}) is int:')
+        self.line(f'    {steps} = range({current}, {end} + 1 if {ascending} else {end} - 1, {step})')
+        self.line('else:')
+        self.line(f'    {steps} = loop_steps({current}, {end}, {step}, {ascending})')
+
+        if not node.discard: self.line(f'{items} = []')
+        self.line(f'for {current} in {steps}:')
+        self.indent += 1
+        self.line(f'add({node.var_token.value!r}, number({current}))')
+        value = self.emit(node.body)
+        if not node.discard: self.line(f'{items}.append({value})')
+        self.indent -= 1
+        if node.discard: return 'None'
+        target = self.temp()
+        self.line(f'{target} = Collection({items})')
+        return target
+
+    def emit_WhileLoopNode(self, node):
+        items = self.temp('items')
+        if not node.discard: self.line(f'{items} = []')
+        self.line('while True:')
+        self.indent += 1
+        self.line(f'if not {self.emit_condition(node.condition)}: break')
+        value = self.emit(node.body)
+        if not node.discard: self.line(f'{items}.append({value})')
+        self.indent -= 1
+        if node.discard: return 'None'
+
+        target = self.temp()
+        self.line(f'{target} = Collection({items})')
+        return target
+
+    def emit_HoistedLoopNode(self, node):
+        self.line(f'K[{self.constant(node)}].reset()')
+        return self.emit(node.loop_node)
+
+    def emit_HoistedNode(self, node):
+        cache = self.constant(node)
+        target = self.temp()
+        self.line(f'{target} = K[{cache}].lookup(context)')
+        self.line(f'if {target} is None:')
+        self.indent += 1
+        value = self.emit(node.node)
+        self.line(f'K[{cache}].remember(context, {value})')
+        self.line(f'{target} = {value}')
+        self.indent -= 1
+        return target
+
+    def emit_SharedNode(self, node):
+        value = self.emit(node.node)
+        self.line(f'K[{self.constant(node)}].remember(context, {value})')
+        return value
+
+    def emit_ReusedNode(self, node):
+        target = self.temp()
+        self.line(f'{target} = K[{self.constant(node.shared)}].lookup(context)')
+        self.line(f'if {target} is None:')
+        self.indent += 1
+        self.line(f'{target} = {self.emit(node.node)}')
+        self.indent -= 1
+        return target
+
+    def emit_FunctionDefinitionNode(self, node):
+        func_name = node.func_name_token.value if node.func_name_token else None
+        param_names = [param.value for param in node.param_tokens]
+        template = self.constant((func_name, node.body_node, param_names, node.layout))
+
+        target = self.temp()
+        self.line(f'{target} = new_function(K[{template}], context, {node.start_pos}, {node.end_pos})')
+        if func_name is not None:
+            self.line(f'add({func_name!r}, {target})')
+        return target
+
+    def emit_FunctionCallNode(self, node, tail=False):
+        func = self.emit_callee(node.func_node)
+        self.line(f'{func} = {func}.copy().set_position({node.start_pos}, {node.end_pos})')
+        if type(node.func_node) is VariableAccessNode:
+            self.line(f'{func}.set_context(context)')
+        args = [self.emit(arg_node) for arg_node in node.arg_nodes]
+
+        if tail:
+            self.line(f'if type({func}) is CustomFunction: return TailCall({func}, [{", ".join(args)}]), None')
+        target = self.temp()
+        self.line(f'{target}, issue = call({func}, [{", ".join(args)}])')
+        self.check()
+        self.in_context(target)
+        return target
+
+    def emit_InlinedCallNode(self, node, tail=False):
+        call = node.call
+        site = self.constant(node)
+        if not node.anonymous:
+            func = self.emit_callee(call.func_node)
+        args = [self.emit(arg_node) for arg_node in call.arg_nodes]
+        target, saved = self.temp(), self.temp('saved')
+        depth = self.indent
+        if not node.anonymous:
+            self.line(f'if K[{site}].matches({func}):')
+            self.indent += 1
+
+        # The body runs on the locals of this unit, switched to its own context until it is done
+        self.line(f'{saved} = context, storage, symbols, get, add')
+        self.line(f'context = K[{site}].enter(context, [{", ".join(args)}])')
+        self.line('storage = context.symbol_storage')
+        self.line('symbols, get, add = storage.symbols, storage.get, storage.add')
+        uses_slots, self.uses_slots = self.uses_slots, False
+        entered = len(self.lines)
+        value = self.emit(node.function.body_node)
+        self.line(f'context, storage, symbols, get, add = {saved}')
+        if self.uses_slots:
+            # The header only sets slots for the unit's own storage
+            self.lines.insert(entered, '    ' * self.indent + 'slots = storage.slots')
+            self.line("slots = getattr(storage, 'slots', None)")
+        self.uses_slots = uses_slots
+        self.line(f'{target} = {value}')
+
+        if not node.anonymous:
+            self.indent = depth
+            self.line('else:')
+            self.indent += 1
+            self.line(f'K[{site}].misses += 1')
+            self.line(f'{func} = {func}.copy().set_position({call.start_pos}, {call.end_pos}).set_context(context)')
+            if tail:
+                self.line(f'if type({func}) is CustomFunction: return TailCall({func}, [{", ".join(args)}]), None')
+            self.line(f'{target}, issue = call({func}, [{", ".join(args)}])')
+            self.check()
+            self.indent = depth
+        self.in_context(target)
+        return target
+
+class TranspiledCode:
+    """A unit compiled to a Python function, with the source it came from"""
+    def __init__(self, node, body=False):
+        generator = UnitGenerator()
+        try:
+            self.source = generator.source(node, body)
+            key = code_cache.key('<southscript>', self.source)
+            code = code_cache.get(key)
+            if code is None:
+                code = compile(self.source, '<southscript>', 'exec')
+                code_cache.put(key, code, len(self.source))
+        except (SyntaxError, RecursionError, MemoryError):
+            # Python caps how deeply blocks nest; such units run as closures instead
+            self.source = None
+            compiler = ClosureCompiler()
+            self.run = compiler.compile_tail(node) if body else compiler.compile(node)
+            return
+
+        namespace = dict(RUNTIME, K=generator.constants)
+        exec(code, namespace)
+        self.run = namespace['unit']
+
+class PythonTranspiler:
+    """Runs programs by translating them to Python source, see UnitGenerator.
+
+    Function bodies are translated when first called, and the result is
+    cached on their node.
+    """
+    def evaluate(self, node, context):
+        result = RuntimeResult()
+        value, issue = compiled(node).run(context)
+        if issue: return result.failure(issue)
+        return result.success(value)
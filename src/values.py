@@ -1,20 +1,27 @@
+from array import array
+
 from .runtime_result import RuntimeResult
-from .errors import RuntimeIssue
+from .errors import RuntimeIssue, OperationIssue
 from .context import ExecutionContext
-from .symbol_table import SymbolStorage
+from .position import source_for
+from .symbol_table import SymbolStorage, FrameStorage
 
 class BaseType:
-    def __init__(self):
-        self.set_position()
-        self.set_context()
+    """A runtime value. Values are never changed once made, so engines share
+    them between names, collections and results instead of copying them.
+
+    Values hold nothing but their contents, in __slots__. Their operations
+    report OperationIssues, which the engine places at the operand nodes.
+    Only a BaseFunction has a position and context; other values keep
+    these and ignore the setters.
+    """
+    __slots__ = ()
+    start_pos = end_pos = context = None
         
     def set_position(self, start_pos=None, end_pos=None):
-        self.start_pos = start_pos
-        self.end_pos = end_pos
         return self
         
     def set_context(self, context=None):
-        self.context = context
         return self
         
     def add(self, other):
@@ -66,104 +73,93 @@ class BaseType:
         raise Exception('No copy method defined')
         
     def invalid_operation(self, other=None):
-        if not other: other = self
-        return RuntimeIssue(
-            self.start_pos, other.end_pos,
-            'Cattywampus! Invalid operation',
-            self.context
-        )
+        return OperationIssue('Cattywampus! Invalid operation', 0, 0 if other is None else 1)
 
 class NumericValue(BaseType):
+    __slots__ = ('value',)
+
     def __init__(self, value):
-        super().__init__()
         self.value = value
         
     def add(self, other):
         if isinstance(other, NumericValue):
-            return NumericValue(self.value + other.value).set_context(self.context), None
+            return number(self.value + other.value), None
         else:
             return None, self.invalid_operation(other)
             
     def subtract(self, other):
         if isinstance(other, NumericValue):
-            return NumericValue(self.value - other.value).set_context(self.context), None
+            return number(self.value - other.value), None
         else:
             return None, self.invalid_operation(other)
             
     def multiply(self, other):
         if isinstance(other, NumericValue):
-            return NumericValue(self.value * other.value).set_context(self.context), None
+            return number(self.value * other.value), None
         else:
             return None, self.invalid_operation(other)
             
     def divide(self, other):
         if isinstance(other, NumericValue):
             if other.value == 0:
-                return None, RuntimeIssue(
-                    other.start_pos, other.end_pos,
-                    "Division by zero",
-                    self.context
-                )
-            return NumericValue(self.value / other.value).set_context(self.context), None
+                return None, OperationIssue("Division by zero", 1, 1)
+            return NumericValue(self.value / other.value), None
         else:
             return None, self.invalid_operation(other)
             
     def compare_equal(self, other):
         if isinstance(other, NumericValue):
-            return NumericValue(int(self.value == other.value)).set_context(self.context), None
+            return (NumericValue.true if self.value == other.value else NumericValue.false), None
         else:
             return None, self.invalid_operation(other)
             
     def compare_not_equal(self, other):
         if isinstance(other, NumericValue):
-            return NumericValue(int(self.value != other.value)).set_context(self.context), None
+            return (NumericValue.true if self.value != other.value else NumericValue.false), None
         else:
             return None, self.invalid_operation(other)
             
     def compare_less_than(self, other):
         if isinstance(other, NumericValue):
-            return NumericValue(int(self.value < other.value)).set_context(self.context), None
+            return (NumericValue.true if self.value < other.value else NumericValue.false), None
         else:
             return None, self.invalid_operation(other)
             
     def compare_greater_than(self, other):
         if isinstance(other, NumericValue):
-            return NumericValue(int(self.value > other.value)).set_context(self.context), None
+            return (NumericValue.true if self.value > other.value else NumericValue.false), None
         else:
             return None, self.invalid_operation(other)
             
     def compare_less_or_equal(self, other):
         if isinstance(other, NumericValue):
-            return NumericValue(int(self.value <= other.value)).set_context(self.context), None
+            return (NumericValue.true if self.value <= other.value else NumericValue.false), None
         else:
             return None, self.invalid_operation(other)
             
     def compare_greater_or_equal(self, other):
         if isinstance(other, NumericValue):
-            return NumericValue(int(self.value >= other.value)).set_context(self.context), None
+            return (NumericValue.true if self.value >= other.value else NumericValue.false), None
         else:
             return None, self.invalid_operation(other)
             
     def logical_and(self, other):
         if isinstance(other, NumericValue):
-            return NumericValue(int(self.value and other.value)).set_context(self.context), None
+            return number(int(self.value and other.value)), None
         else:
             return None, self.invalid_operation(other)
             
     def logical_or(self, other):
         if isinstance(other, NumericValue):
-            return NumericValue(int(self.value or other.value)).set_context(self.context), None
+            return number(int(self.value or other.value)), None
         else:
             return None, self.invalid_operation(other)
             
     def logical_not(self):
-        return NumericValue(1 if self.value == 0 else 0).set_context(self.context), None
+        return (NumericValue.true if self.value == 0 else NumericValue.false), None
         
     def copy(self):
-        copy = NumericValue(self.value)
-        copy.set_position(self.start_pos, self.end_pos)
-        copy.set_context(self.context)
-        return copy
+        return NumericValue(self.value)
         
     def is_true(self):
         return self.value != 0
@@ -175,19 +171,20 @@ class NumericValue(BaseType):
         return str(self.value)
 
 class TextValue(BaseType):
+    __slots__ = ('value',)
+
     def __init__(self, value):
-        super().__init__()
         self.value = value
         
     def add(self, other):
         if isinstance(other, TextValue):
-            return TextValue(self.value + other.value).set_context(self.context), None
+            return TextValue(self.value + other.value), None
         else:
             return None, self.invalid_operation(other)
             
     def multiply(self, other):
         if isinstance(other, NumericValue):
-            return TextValue(self.value * other.value).set_context(self.context), None
+            return TextValue(self.value * other.value), None
         else:
             return None, self.invalid_operation(other)
             
@@ -195,10 +192,7 @@ class TextValue(BaseType):
         return len(self.value) > 0
         
     def copy(self):
-        copy = TextValue(self.value)
-        copy.set_position(self.start_pos, self.end_pos)
-        copy.set_context(self.context)
-        return copy
+        return TextValue(self.value)
         
     def __str__(self):
         return self.value
@@ -207,34 +201,47 @@ class TextValue(BaseType):
         return f'"{self.value}"'
 
 class Collection(BaseType):
+    """A collection of values, the one value operations change in place.
+
+    elements is a list of values or, for PACKED_MIN_LENGTH or more numbers
+    that are all ints or all floats, an array of the plain numbers, which
+    keeps each in 8 bytes instead of a NumericValue. Anything else put in
+    a packed collection turns it into a list for good. Read and change the
+    elements with the methods here, which handle both.
+    """
+    __slots__ = ('elements',)
+
     def __init__(self, elements):
-        super().__init__()
+        if (type(elements) is list and len(elements) >= PACKED_MIN_LENGTH
+                and type(elements[0]) is NumericValue):
+            try:
+                numbers = pack([element.value for element in elements])
+            except AttributeError:
+                # A function or collection, which have no value
+                numbers = None
+            if numbers is not None: elements = numbers
         self.elements = elements
         
     def add(self, other):
         new_collection = self.copy()
-        new_collection.elements.append(other)
+        new_collection.append(other)
         return new_collection, None
         
     def subtract(self, other):
         if isinstance(other, NumericValue):
             new_collection = self.copy()
             try:
-                new_collection.elements.pop(other.value)
+                new_collection.pop(other.value)
                 return new_collection, None
             except:
-                return None, RuntimeIssue(
-                    other.start_pos, other.end_pos,
-                    'Cattywampus! Index out of bounds',
-                    self.context
-                )
+                return None, OperationIssue('Cattywampus! Index out of bounds', 1, 1)
         else:
             return None, self.invalid_operation(other)
             
     def multiply(self, other):
         if isinstance(other, Collection):
             new_collection = self.copy()
-            new_collection.elements.extend(other.elements)
+            new_collection.extend(other)
             return new_collection, None
         else:
             return None, self.invalid_operation(other)
@@ -242,21 +249,62 @@ class Collection(BaseType):
     def divide(self, other):
         if isinstance(other, NumericValue):
             try:
-                return self.elements[other.value], None
+                return self.get(other.value), None
             except:
-                return None, RuntimeIssue(
-                    other.start_pos, other.end_pos,
-                    'Cattywampus! Index out of bounds',
-                    self.context
-                )
+                return None, OperationIssue('Cattywampus! Index out of bounds', 1, 1)
         else:
             return None, self.invalid_operation(other)
+
+    def typecode(self):
+        """The typecode of the array a packed collection keeps its numbers in, or None"""
+        return None if type(self.elements) is list else self.elements.typecode
+
+    def get(self, index):
+        element = self.elements[index]
+        return element if type(self.elements) is list else number(element)
+
+    def pop(self, index):
+        element = self.elements.pop(index)
+        return element if type(self.elements) is list else number(element)
+
+    def append(self, value):
+        typecode = self.typecode()
+        if typecode is not None:
+            if type(value) is NumericValue and ARRAY_TYPECODES.get(type(value.value)) == typecode:
+                try:
+                    return self.elements.append(value.value)
+                except OverflowError:
+                    pass
+            self.unpack()
+        self.elements.append(value)
+
+    def extend(self, other):
+        typecode = self.typecode()
+        if typecode is not None and typecode == other.typecode():
+            self.elements.extend(other.elements)
+        else:
+            self.unpack().extend(other.values())
+
+    def values(self):
+        """The elements as a list of values, which is elements itself unless packed"""
+        if type(self.elements) is list: return self.elements
+        return list(map(number, self.elements))
+
+    def numbers(self):
+        """The elements as plain numbers, or None if one is not a NumericValue"""
+        if type(self.elements) is not list: return self.elements
+        if set(map(type, self.elements)) - {NumericValue}: return None
+        return [element.value for element in self.elements]
+
+    def unpack(self):
+        """Turns a packed collection into a list of values for good, returning the list"""
+        self.elements = self.values()
+        return self.elements
             
     def copy(self):
-        copy = Collection(self.elements)
-        copy.set_position(self.start_pos, self.end_pos)
-        copy.set_context(self.context)
-        return copy
+        # Copies used to share the list of elements, so that operations changed
+        # them all; now that a packed one can swap it for a list, one object does
+        return self
         
     def __str__(self):
         return '[' + ', '.join(map(str, self.elements)) + ']'
@@ -264,33 +312,48 @@ class Collection(BaseType):
     def __repr__(self):
         return '[' + ', '.join(map(repr, self.elements)) + ']'
 
-class CustomFunction(BaseType):
-    def __init__(self, name, body_node, param_names):
+class BaseFunction(BaseType):
+    """A function value. Each call site calls a copy placed where the call
+    is, which is where its errors point and what its frame returns to.
+    """
+    __slots__ = ('start_pos', 'end_pos', 'context')
+
+    def __init__(self):
+        self.start_pos = self.end_pos = self.context = None
+
+    def set_position(self, start_pos=None, end_pos=None):
+        self.start_pos = start_pos
+        self.end_pos = end_pos
+        return self
+        
+    def set_context(self, context=None):
+        self.context = context
+        return self
+
+class CustomFunction(BaseFunction):
+    """source is the SourceMap of the body, which the function keeps alive
+    since it can outlive the tree it was defined in"""
+    __slots__ = ('name', 'body_node', 'param_names', 'layout', 'source')
+
+    def __init__(self, name, body_node, param_names, layout=None, source=None):
         super().__init__()
         self.name = name or "<anonymous>"
         self.body_node = body_node
         self.param_names = param_names
+        self.layout = layout
+        self.source = source or source_for(body_node.start_pos)
     
     def execute(self, args):
         from .interpreter import CodeRunner
         
-        result = RuntimeResult()
-        runner = CodeRunner()
-        exec_context = self.create_context()
-        
-        result.record(self.check_and_populate_args(self.param_names, args, exec_context))
-        if result.error: 
-            return result
-        
-        value = result.record(runner.evaluate(self.body_node, exec_context))
-        if result.error: 
-            return result
-        
-        return result.success(value)
+        return CodeRunner().call(self, args)
     
     def create_context(self):
         new_context = ExecutionContext(self.name, self.context, self.start_pos)
-        new_context.symbol_storage = SymbolStorage(new_context.parent.symbol_storage)
+        if self.layout:
+            new_context.symbol_storage = FrameStorage(new_context.parent.symbol_storage, self.layout)
+        else:
+            new_context.symbol_storage = SymbolStorage(new_context.parent.symbol_storage)
         return new_context
     
     def check_and_populate_args(self, param_names, args, context):
@@ -312,14 +375,12 @@ class CustomFunction(BaseType):
 
         for i in range(len(args)):
             arg_name = param_names[i].value if hasattr(param_names[i], 'value') else param_names[i]
-            arg_value = args[i]
-            arg_value.set_context(context)
-            context.symbol_storage.add(arg_name, arg_value)
+            context.symbol_storage.add(arg_name, args[i])
         
         return result.success(None)
     
     def copy(self):
-        copy = CustomFunction(self.name, self.body_node, self.param_names)
+        copy = CustomFunction(self.name, self.body_node, self.param_names, self.layout, self.source)
         copy.set_context(self.context)
         copy.set_position(self.start_pos, self.end_pos)
         return copy
@@ -327,6 +388,37 @@ class CustomFunction(BaseType):
     def __repr__(self):
         return f"<function {self.name}>"
 
-NumericValue.zero = NumericValue(0)
-NumericValue.false = NumericValue(0)
-NumericValue.true = NumericValue(1)
\ No newline at end of file
+# The NumericValues of the ints most programs count with, made once and shared
+SMALL_INTS = range(-5, 257)
+small_numbers = [NumericValue(value) for value in SMALL_INTS]
+
+def number(value):
+    """A NumericValue holding value, which is a shared one for a small int"""
+    if type(value) is int and -5 <= value <= 256:
+        return small_numbers[value + 5]
+    return NumericValue(value)
+
+# Typecodes of the arrays a packed Collection keeps numbers of each type in
+ARRAY_TYPECODES = {int: 'q', float: 'd'}
+# Shorter Collections stay lists, as an array would save next to nothing
+PACKED_MIN_LENGTH = 8
+
+def pack(numbers):
+    """An array of numbers, plain ints or floats, or None if Collection keeps them as values"""
+    if len(numbers) < PACKED_MIN_LENGTH: return None
+    typecode = ARRAY_TYPECODES.get(type(numbers[0]))
+    # An array('d') would take ints too, and print them as floats
+    if typecode == 'd' and set(map(type, numbers)) != {float}: return None
+    try:
+        return array(typecode, numbers)
+    except (TypeError, OverflowError):
+        # Not all ints, or an int past 64 bits
+        return None
+
+def collection_of(numbers):
+    """A Collection of numbers, plain ints or floats, packed if it would be made of their values"""
+    packed = pack(numbers)
+    return Collection(list(map(number, numbers)) if packed is None else packed)
+
+NumericValue.zero = NumericValue.false = number(0)
+NumericValue.true = number(1)
\ No newline at end of file
@@ -13,7 +13,7 @@ while True:
         if not code:
             continue
             
-        outcome, issue = execute('<stdin>', code, main_context)
+        outcome, issue = execute('<stdin>', code, main_context, discard=True)
         
         if issue:
             print(issue.display_error())
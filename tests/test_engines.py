@@ -0,0 +1,197 @@
+"""Every engine in init.ENGINES gives what the tree walker gives.
+
+Each program is a list of lines run one after another in a fresh REPL
+context, like test.py does. For every line the value, what HOLLER printed
+and the display_error() text must match what the tree walker gives
+without the optimizer, on every engine with the optimizer on and off.
+The README's example is run a line at a time too.
+
+Run from the directory that holds the `interpreter` package (like test.py):
+
+    python -m unittest tests.test_engines
+"""
+import contextlib
+import io
+import os
+import re
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from interpreter.init import ENGINES, execute, parse_cached, setup_global_symbols
+from interpreter.context import ExecutionContext
+from interpreter.symbol_table import SymbolStorage
+from interpreter.tiered import TIER_UP_THRESHOLD
+from interpreter.nodes import CompiledForms, iter_child_nodes
+from interpreter import script_cache
+
+README = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'README.md')
+
+# Enough runs for TieredRunner to compile a body
+HOT = TIER_UP_THRESHOLD + 200
+
+PROGRAMS = {
+    'arithmetic': ["1 + 2 * 3", "(1 + 2) * 3", "7 / 2", "10 - 4 - 3", "-5 + +2", "2 * -3.5",
+                   "1 / 0", "THANG x = 4", "x * x - x / 2", "THANG x = x + 1", "x"],
+    'comparisons': ["1 < 2", "2 <= 1", "3 == 3", "3 != 3.0", "\"a\" == \"a\"", "1 > 2 OR 2 > 1",
+                    "1 AN' 0", "AIN'T 0", "AIN'T 1 AN' 1", "TRUE == FALSE"],
+    'text': ["THANG s = \"howdy\"", "s + \" partner\"", "s * 3", "s - 1", "s / 2", "s < 1"],
+    'collections': ["THANG c = [1, 2, 3]", "c + 4", "c - 0", "c - 9", "c * [5, 6]", "c / 2", "c / 7",
+                    "[] + []", "[[1], [2, [3]]]", "c * 2"],
+    'packed': ["THANG p = [1, 2, 3, 4, 5, 6, 7, 8, 9]", "p + 10", "p + 1.5", "p + \"x\"", "p / 3", "p - 0",
+               "THANG f = [0.5, 1.5, 2.5, 3.5, 4.5, 5.5, 6.5, 7.5]", "f / 7", "f + 1"],
+    'builtins': ["THANG c = [1, 2, 3]", "SHOVE(c, 4)", "c", "YANK(c, 0)", "YANK(c, 9)", "c",
+                 "STACKON(c, [7, 8])", "c", "STACKON(c, 1)", "SHOVE(1, 2)", "HOLLER(c)", "HOLLER()",
+                 "PILEON(c, 1)", "WHITTLE(c, [1, 1, 1, 1])", "BEEFUP(c, 2.5)", "DIVVY(c, 0)",
+                 "PILEON(c, [1])", "BEEFUP(\"x\", 2)", "SPEAKUP()"],
+    'packed builtins': ["THANG p = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]", "PILEON(p, p)", "WHITTLE(p, 0.5)",
+                        "BEEFUP(p, p)", "DIVVY(p, 4)", "DIVVY(p, [1, 2, 3, 4, 5, 6, 7, 8, 9, 0])",
+                        "SHOVE(p, 11)", "SHOVE(p, \"x\")", "YANK(p, 0)", "p"],
+    'conditions': ["RECKON 1 THEN 2 ELSE 3", "RECKON 0 THEN 2 MIGHTCOULD 1 THEN 4 ELSE 3",
+                   "RECKON 0 THEN 2 MIGHTCOULD 0 THEN 4", "RECKON 0 THEN 1",
+                   "THANG y = RECKON 0 THEN 1", "y", "RECKON nope THEN 1 ELSE 2"],
+    'loops': ["TROT i = 1 T' 5 THEN i * i", "TROT i = 5 T' 0 BY_A_PEICE -2 THEN i", "TROT i = 0 T' 0 THEN i",
+              "TROT i = 1 T' 3 BY_A_PEICE 0.5 THEN i", "i", "THANG n = 0",
+              "WHILES n < 4 THEN THANG n = n + 1", "n", "WHILES n > 10 THEN 1",
+              "TROT i = 1 T' 4 THEN TROT j = 1 T' i THEN i * j",
+              "TROT i = 1 T' 3 THEN HOLLER(\"Trot #\" + i)", "TROT i = 1 T' 3 THEN i / (2 - i)"],
+    'hot loops': [f"TROT i = 0 T' {HOT} THEN i * 2 + 1", "THANG total = 0",
+                  f"TROT i = 0 T' {HOT} THEN THANG total = total + i", "total",
+                  "THANG k = 0", f"WHILES k < {HOT} THEN THANG k = k + 1", "k",
+                  f"TROT i = 0 T' {HOT} THEN RECKON i == {HOT - 1} THEN THANG total = \"x\" ELSE total + 1",
+                  "total", f"TROT i = 0 T' {HOT} THEN total - i"],
+    'functions': ["FIXIN' add(a, b) -> a + b", "add(1, 2)", "add(1)", "add(\"a\", [1])", "add(1, \"a\")",
+                  "THANG sq = FIXIN'(n) -> n * n", "sq(7)", "(FIXIN'(n) -> n + 1)(1)", "sq",
+                  "FIXIN' nothing() -> RECKON 0 THEN 1", "nothing()", "THANG r = nothing()", "r",
+                  "FIXIN' outer(x) -> inner(x) + 1", "FIXIN' inner(x) -> x / 0", "outer(3)",
+                  "FIXIN' reads() -> x", "reads()", "THANG x = 3", "reads()",
+                  "FIXIN' sets(v) -> THANG x = v", "sets(9)", "x", "5(1)", "add(1, 2)(3)"],
+    'recursion': ["FIXIN' fib(n) -> RECKON n < 2 THEN n ELSE fib(n - 1) + fib(n - 2)", "fib(15)",
+                  "FIXIN' total(n, acc) -> RECKON n < 1 THEN acc ELSE total(n - 1, acc + n)", "total(5000, 0)",
+                  "FIXIN' even(n) -> RECKON n == 0 THEN 1 ELSE odd(n - 1)",
+                  "FIXIN' odd(n) -> RECKON n == 0 THEN 0 ELSE even(n - 1)", "even(301)",
+                  "FIXIN' down(n) -> RECKON n == 0 THEN n / 0 ELSE down(n - 1)", "down(3)"],
+    'hot functions': ["FIXIN' step(n) -> n * 3 + 1", f"TROT i = 0 T' {HOT} THEN step(i)",
+                      "step(\"x\")", "FIXIN' half(n) -> n / 2", f"TROT i = 0 T' {HOT} THEN half(i)",
+                      "half([1, 2])", f"TROT i = {HOT} T' 0 BY_A_PEICE -1 THEN half(i - 3)"],
+    'scoping': ["THANG TRUE = 2", "TROT i = 1 T' 3 THEN [TRUE, THANG TRUE = RECKON 0 THEN 1]",
+                "THANG TRUE = RECKON 0 THEN 1", "TROT i = 1 T' 3 THEN [TRUE, THANG TRUE = RECKON i > 1 THEN 5]",
+                "FIXIN' g() -> TROT i = 1 T' 3 THEN [TRUE, THANG TRUE = RECKON i > 1 THEN i]", "g()",
+                "FIXIN' h(TRUE) -> [TRUE, THANG TRUE = RECKON 0 THEN 1, TRUE]", "h(8)", "h(RECKON 0 THEN 1)",
+                "FIXIN' counter() -> THANG count = count + 1", "THANG count = 0", "counter()", "counter()",
+                "count"],
+    'closures': ["FIXIN' mk5(v) -> [FIXIN'(n) -> n + v]", "THANG fs = mk5(7)", "(fs / 0)(1)",
+                 "FIXIN' mk(v) -> (FIXIN'(n) -> n + v)", "(mk(7))(1)", "FIXIN' f(n) -> n + v",
+                 "FIXIN' wrap(v) -> [f]", "(wrap(7) / 0)(1)", "FIXIN' pick(v) -> (RECKON 1 THEN f ELSE 0)",
+                 "(pick(7))(1)", "(THANG hs = [HOLLER, FIREUP]) / 0", "(hs / 0)(\"held\")", "(hs / 1)(1)"],
+    'constants': ["THANG a = 2 * 3 + 4", "RECKON 1 THEN a ELSE nope", "RECKON 0 THEN nope ELSE a",
+                  "TROT i = 1 T' 3 THEN 2 * 3", "THANG NULL = 1", "NULL + 1", "(1 + 2) * (3 + 4) / 0"],
+    'errors': ["nope", "THANG", "1 +", "(1", "[1, 2", "\"open", "1 ! 2", "@", "RECKON 1", "TROT i = 1",
+               "FIXIN' (", "1 2"],
+    'fireup': ["FIREUP(\"{script}\")", "from_script", "FIREUP(\"{script}\")", "FIREUP(\"{broken}\")",
+               "FIREUP(\"{missing}\")", "FIREUP(1)", "FIREUP(\"{failing}\")"],
+}
+
+SCRIPTS = {
+    'script': "THANG from_script = 6 * 7",
+    'broken': "THANG = 1",
+    'failing': "HOLLER(\"before\")\nnope + 1",
+}
+
+def readme_lines():
+    with open(README, encoding='utf-8') as f:
+        text = f.read()
+    example = re.search(r'```southscript\n(.*?)(?:```|\Z)', text, re.S).group(1)
+    return [line.strip() for line in example.splitlines() if line.strip()]
+
+def run(lines, engine, optimize):
+    """What each line gives on engine, as text"""
+    context = ExecutionContext('<repl>')
+    context.symbol_storage = SymbolStorage(setup_global_symbols())
+    outcomes = []
+    for line in lines:
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output), mock.patch('builtins.input', return_value='howdy'):
+            try:
+                value, issue = execute('<stdin>', line, context, engine=engine, optimize=optimize)
+                outcome = issue.display_error() if issue else repr(value)
+            except Exception as e:
+                # Some lines crash the parser, which is the same on every engine
+                outcome = f'raised {type(e).__name__}: {e}'
+        outcomes.append((line, outcome, output.getvalue()))
+    return outcomes
+
+class EngineAgreementTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.cache_root = script_cache.cache_root
+        script_cache.cache_root = cls.directory
+        cls.paths = {'missing': os.path.join(cls.directory, 'missing.ss')}
+        for name, source in SCRIPTS.items():
+            cls.paths[name] = os.path.join(cls.directory, name + '.ss')
+            with open(cls.paths[name], 'w') as f:
+                f.write(source)
+
+    @classmethod
+    def tearDownClass(cls):
+        script_cache.cache_root = cls.cache_root
+        shutil.rmtree(cls.directory)
+
+    def check(self, lines):
+        for name, path in self.paths.items():
+            lines = [line.replace('{' + name + '}', path) for line in lines]
+        expected = run(lines, 'tree', False)
+        for optimize in (False, True):
+            for engine in ENGINES:
+                if engine == 'tree' and not optimize: continue
+                with self.subTest(engine=engine, optimize=optimize):
+                    self.assertEqual(run(lines, engine, optimize), expected)
+
+    def test_readme(self):
+        self.check(readme_lines())
+
+    def test_programs(self):
+        for name, lines in PROGRAMS.items():
+            with self.subTest(program=name):
+                self.check(lines)
+
+    def test_function_keeps_its_context_unless_read_from_a_name(self):
+        # What the tree walker gave before values were shared
+        outcomes = [outcome for _, outcome, _ in run(PROGRAMS['closures'], 'tree', False)]
+        self.assertEqual(outcomes[2], '8')
+        self.assertIn("'v' ain't defined", outcomes[4])
+        self.assertEqual(outcomes[7], '8')
+        self.assertIn("'v' ain't defined", outcomes[9])
+
+def compiled_forms(syntax_tree):
+    """Every form an engine cached on a node of syntax_tree"""
+    forms = []
+    stack = [syntax_tree]
+    while stack:
+        node = stack.pop()
+        compiled = getattr(node, 'compiled', None)
+        if type(compiled) is CompiledForms: forms.extend(compiled.values())
+        elif compiled is not None: forms.append(compiled)
+        stack.extend(iter_child_nodes(node))
+    return forms
+
+class CompiledFormTest(unittest.TestCase):
+    def test_engines_keep_their_forms_on_a_shared_tree(self):
+        lines = ["FIXIN' step(n) -> n * 3 + 1", f"TROT i = 0 T' {HOT} THEN step(i) + i"]
+        context = ExecutionContext('<repl>')
+        context.symbol_storage = SymbolStorage(setup_global_symbols())
+        for engine in ENGINES:
+            for line in lines: execute('<engines>', line, context, engine=engine)
+        trees = [parse_cached('<engines>', line, optimize=True)[0] for line in lines]
+        forms = [form for tree in trees for form in compiled_forms(tree)]
+
+        for engine in ENGINES:
+            for line in lines: execute('<engines>', line, context, engine=engine)
+        self.assertEqual({type(form).__name__ for form in forms},
+                         {'CodeObject', 'function', 'TranspiledCode', 'HotSpot'})
+        self.assertEqual([id(form) for tree in trees for form in compiled_forms(tree)], [id(form) for form in forms])
+
+if __name__ == '__main__':
+    unittest.main()
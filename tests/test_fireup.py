@@ -0,0 +1,77 @@
+"""FIREUP runs scripts on the caller's engine from cached, optimized trees.
+
+Run from the directory that holds the `interpreter` package (like test.py):
+
+    python -m unittest tests.test_fireup
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from interpreter import init, script_cache
+from interpreter.init import ENGINES, execute, setup_global_symbols
+from interpreter.context import ExecutionContext
+
+def main_context():
+    context = ExecutionContext('<main>')
+    context.symbol_storage = setup_global_symbols()
+    return context
+
+class FireupTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache_root = script_cache.cache_root
+        script_cache.cache_root = self.directory
+        self.path = os.path.join(self.directory, 'library.ss')
+        with open(self.path, 'w') as f:
+            f.write('THANG loaded = 2 * 21')
+        init.syntax_cache.clear()
+
+    def tearDown(self):
+        script_cache.cache_root = self.cache_root
+        shutil.rmtree(self.directory)
+
+    def fireup(self, context, engine='tree'):
+        return execute('<stdin>', f'FIREUP("{self.path}")', context, engine=engine)
+
+    def test_runs_on_callers_engine(self):
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                started = []
+                runner = ENGINES[engine]
+                evaluate = lambda self, *args: started.append(engine) or runner.evaluate(self, *args)
+                with mock.patch.dict(ENGINES, {engine: type(runner.__name__, (runner,), {'evaluate': evaluate})}):
+                    context = main_context()
+                    self.assertIsNone(self.fireup(context, engine)[1])
+                self.assertEqual(started, [engine, engine])
+                self.assertEqual(context.symbol_storage.get('loaded').value, 42)
+
+    def test_repeated_fireup_reuses_optimized_tree(self):
+        context = main_context()
+        self.fireup(context)
+        runs = init.optimizer.runs
+        for _ in range(3):
+            self.assertIsNone(self.fireup(context)[1])
+        self.assertEqual(init.optimizer.runs, runs)
+
+    def test_edited_script_is_parsed_again(self):
+        context = main_context()
+        self.fireup(context)
+        with open(self.path, 'w') as f:
+            f.write('THANG loaded = 7')
+        self.fireup(context)
+        self.assertEqual(context.symbol_storage.get('loaded').value, 7)
+
+    def test_missing_script_fails_to_load(self):
+        _, issue = execute('<stdin>', 'FIREUP("nowhere/missing.ss")', main_context())
+        self.assertIn("Failed to load script 'nowhere/missing.ss'", issue.display_error())
+
+    def test_internal_errors_are_not_load_failures(self):
+        with mock.patch.object(init, 'read_file', side_effect=KeyError('bug')):
+            with self.assertRaises(KeyError):
+                self.fireup(main_context())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+"""Edits to an IncrementalDocument give what parsing the edited text afresh gives.
+
+Random edits are made to a few programs: mostly ones that keep them
+valid, like changing a number or adding an operand or a comment, and now
+and then a stray fragment anywhere, which is undone again. After every
+edit the document's tokens, tree and issue, with each position read
+through its SourceMap, must match those of a new document made from the
+same text, and running the tree must give the same value or error on
+every engine as the new tree gives on the tree walker.
+
+Run from the directory that holds the `interpreter` package (like test.py):
+
+    python -m unittest tests.test_incremental
+"""
+import random
+import re
+import unittest
+
+from interpreter.init import ENGINES, evaluate
+from interpreter.incremental import IncrementalDocument
+from interpreter.tokens import Token
+
+TEXTS = [
+    "# sums\n[FIXIN' add(a, b) -> a + b / a, add(1, 2) * 3, # then\nadd(0, \"b\")]",
+    "# one\n# two\nRECKON 1 == 2 THEN \"no\" MIGHTCOULD 2 > 1 THEN [1, 2, 3] ELSE 4 / 0",
+    "[(1 + 2) * 3, AIN'T 0, -4 / 2, # inline\n\"text\" + \"s\", 10 / 0]",
+    "(FIXIN'(n) -> RECKON n < 2 THEN n ELSE n * 2)(21) - 1 # no m\n+ m",
+    "# nested\n[3 + 2 * RECKON 0 THEN 1 MIGHTCOULD 1 THEN 4 / 0, 7]",
+    "[" + ", ".join(f"{i} / ({i} - 20) # {i}\n" for i in range(40)) + "]",
+]
+
+FRAGMENTS = ['', ' ', '1', '23', '+', '*', ' / ', '(', ')', '[', ']', ', ', '"', 'x', "AIN'T ", ' == ',
+             ' THEN ', ' ELSE ', 'RECKON ', '# note\n', '\n', 'THANG y = ']
+
+def random_edit(text, chooser):
+    """(offset, deleted, inserted) of an edit to text, and whether to undo it"""
+    numbers = [match.span() for match in re.finditer(r'\b[0-9]+\b', text)]
+    spaces = [offset for match in re.finditer(' ', text) for offset in match.span()]
+    kind = chooser.choice(['number', 'number', 'retyped', 'operand', 'comment', 'space', 'fragment'])
+    if kind == 'number' and numbers:
+        start, end = chooser.choice(numbers)
+        return start, end - start, str(chooser.randrange(100)), False
+    if kind == 'retyped' and numbers:
+        # The same number again after a comment, so the tokens only move
+        start, end = chooser.choice(numbers)
+        return start, end - start, '# note\n' + text[start:end], chooser.random() < 0.5
+    if kind == 'operand' and numbers:
+        _, end = chooser.choice(numbers)
+        return end, 0, chooser.choice([' + 7', ' * (2 - 1)', ' / 3']), chooser.random() < 0.5
+    if kind == 'comment' and spaces:
+        return chooser.choice(spaces), 0, '# note\n', chooser.random() < 0.5
+    if kind == 'space' and spaces:
+        return chooser.choice(spaces), 0, ' ' * chooser.randrange(1, 4), chooser.random() < 0.5
+    offset = chooser.randrange(len(text) + 1)
+    return offset, min(chooser.randrange(4), len(text) - offset), chooser.choice(FRAGMENTS), True
+
+def where(position, source):
+    if position is None: return None
+    return source.offset(position), source.line(position), source.column(position)
+
+def dump(value, source):
+    """value, with each position in it as the offset, line and column it maps to"""
+    if isinstance(value, Token):
+        return value.type, value.value, where(value.start_pos, source), where(value.end_pos, source)
+    if isinstance(value, (list, tuple)):
+        return [dump(item, source) for item in value]
+    if hasattr(value, 'fields'):
+        fields = [dump(getattr(value, name), source) for name in value.fields if name not in ('start_pos', 'end_pos')]
+        return type(value).__name__, where(value.start_pos, source), where(value.end_pos, source), fields
+    return value
+
+def state(document):
+    source = document.source
+    issue = document.issue
+    return (dump(document.tokens, source) if document.tokens is not None else None,
+            dump(document.tree, source),
+            issue and (type(issue).__name__, issue.details, where(issue.start_pos, source), where(issue.end_pos, source)))
+
+def outcome(syntax_tree, engine):
+    try:
+        value, issue = evaluate(syntax_tree, engine=engine)
+    except Exception as e:
+        # Calling a number crashes, which is the same on every engine
+        return f'raised {type(e).__name__}: {e}'
+    return issue.display_error() if issue else repr(value)
+
+class IncrementalDocumentTest(unittest.TestCase):
+    def check(self, document):
+        fresh = IncrementalDocument(document.filename, document.text)
+        self.assertEqual(state(document), state(fresh))
+        if fresh.tree is None: return
+        expected = outcome(fresh.tree, 'tree')
+        for engine in ENGINES:
+            self.assertEqual(outcome(document.tree, engine), expected, engine)
+
+    def test_random_edits_match_a_fresh_parse(self):
+        chooser = random.Random(2024)
+        for text in TEXTS:
+            document = IncrementalDocument('doc.ss', text)
+            for step in range(120):
+                offset, deleted, inserted, undo = random_edit(document.text, chooser)
+                removed = document.text[offset:offset + deleted]
+                with self.subTest(text=text, step=step, edit=(offset, deleted, inserted)):
+                    document.edit(offset, deleted, inserted)
+                    self.check(document)
+                    if undo:
+                        document.edit(offset, len(inserted), removed)
+                        self.check(document)
+
+    def test_tokens_that_only_move_keep_the_tree(self):
+        document = IncrementalDocument('doc.ss', '[x + 1, 2]')
+        tree = document.tree
+        self.check(document)
+        document.edit(1, 1, '# one\nx')
+        self.assertIs(document.tree, tree)
+        self.assertEqual(document.reparsed_tokens, 0)
+        self.check(document)
+
+    def test_edit_leaves_positions_after_it_alone(self):
+        document = IncrementalDocument('doc.ss', "[" + ", ".join(f"{i} * {i}" for i in range(500)) + "]")
+        document.edit(1, 1, '7')
+        tail = document.tokens[-100:]
+        stored = [(token.start_pos, token.end_pos) for token in tail]
+        offsets = [document.source.offset(token.start_pos) for token in tail]
+
+        document.edit(1, 1, '123')
+        self.assertLess(document.relexed_tokens, 5)
+        self.assertEqual([(token.start_pos, token.end_pos) for token in tail], stored)
+        self.assertEqual([document.source.offset(token.start_pos) for token in tail], [offset + 2 for offset in offsets])
+        self.check(document)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+"""TableTokenMaker gives the tokens or issue that TokenMaker gives, for any text.
+
+StreamTokenMaker, reading 1, 2 or 3 characters at a time, gives those of
+TableTokenMaker too, with every position on the same line and column, so
+tokens and errors that span chunks are lexed as if read at once.
+
+The lexers lex every line the engine tests run, the README's example, texts
+that end inside a token or run into a bad character, and every prefix of
+each of these, so most texts end partway through something.
+
+Run from the directory that holds the `interpreter` package (like test.py):
+
+    python -m unittest tests.test_lexers
+"""
+import io
+import unittest
+
+from interpreter.lexer import TokenMaker
+from interpreter.table_lexer import TableTokenMaker, StreamTokenMaker
+from tests.test_engines import PROGRAMS, readme_lines
+
+TEXTS = [
+    "", " \t ", "\"open", "\"\"", "\"a\\\"b\"", "\"two\nlines\"", "1 ! 2", "!", "!=", "1 != 2", "1.5.2", "1.", "12.50",
+    "T' 3", "T'", "AIN'T 0", "x'y", "a_b1 + B2", "@", "1 # note", "# note\n1 + 2", "# a\n# b\n", "1\n2", "1 -> 2",
+    "<= >= == = < > - + * / ( ) [ ] ,", "THANG x = [1, 2.25, \"three\", FIXIN'(n) -> n]", "1 + @ 2",
+    "[1, 2, !3]", "THANG s = \"a\" ! \"b\"", "f(x) $ 1", "# fine\n1 ~ 2",
+]
+
+def texts():
+    for lines in PROGRAMS.values():
+        for line in lines:
+            yield from prefixes(line)
+    for line in readme_lines():
+        yield from prefixes(line)
+    for text in TEXTS:
+        yield from prefixes(text)
+
+def prefixes(text):
+    for end in range(len(text) + 1):
+        yield text[:end]
+
+def lexed(token_maker):
+    """The tokens or issue of token_maker, with each position as an offset into its text"""
+    base = token_maker.source.base
+    try:
+        tokens, issue = token_maker.generate_tokens()
+    except Exception as e:
+        return f'raised {type(e).__name__}: {e}'
+    if issue: return type(issue).__name__, issue.details, issue.start_pos - base, issue.end_pos - base
+    return [(token.type, token.value, token.start_pos - base, token.end_pos - base) for token in tokens]
+
+def places(token_maker):
+    """The line and column of every position token_maker gives, once it has lexed"""
+    source = token_maker.source
+    tokens, issue = token_maker.generate_tokens()
+    positions = [issue.start_pos, issue.end_pos] if issue else [pos for token in tokens for pos in (token.start_pos, token.end_pos)]
+    return [(source.line(pos), source.column(pos)) for pos in positions if pos is not None]
+
+class TableTokenMakerTest(unittest.TestCase):
+    def test_matches_token_maker(self):
+        for text in texts():
+            with self.subTest(text=text):
+                self.assertEqual(lexed(TableTokenMaker('<lexers>', text)), lexed(TokenMaker('<lexers>', text)))
+
+class StreamTokenMakerTest(unittest.TestCase):
+    def test_matches_table_token_maker(self):
+        for text in texts():
+            expected = lexed(TableTokenMaker('<lexers>', text))
+            expected_places = places(TableTokenMaker('<lexers>', text))
+            for chunk_size in (1, 2, 3):
+                with self.subTest(text=text, chunk_size=chunk_size):
+                    self.assertEqual(lexed(StreamTokenMaker('<lexers>', io.StringIO(text), chunk_size)), expected)
+                    self.assertEqual(places(StreamTokenMaker('<lexers>', io.StringIO(text), chunk_size)), expected_places)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+"""Name lookups through NameCache agree with SymbolStorage.get.
+
+Run from the directory that holds the `interpreter` package (like test.py):
+
+    python -m unittest tests.test_name_cache
+"""
+import gc
+import unittest
+
+from interpreter import symbol_table
+from interpreter.init import ENGINES, evaluate, execute, setup_global_symbols
+from interpreter.context import ExecutionContext
+from interpreter.incremental import IncrementalDocument
+from interpreter.symbol_table import SymbolStorage
+
+def repl_context():
+    context = ExecutionContext('<repl>')
+    context.symbol_storage = SymbolStorage(setup_global_symbols())
+    return context
+
+def run(lines, engine, optimize):
+    context = repl_context()
+    for line in lines:
+        value, issue = execute('<stdin>', line, context, engine=engine, optimize=optimize)
+        if issue: return issue.display_error()
+    return repr(value)
+
+class NoneBindingTest(unittest.TestCase):
+    def check(self, lines, expected):
+        for engine in ENGINES:
+            for optimize in (False, True):
+                with self.subTest(engine=engine, optimize=optimize):
+                    self.assertEqual(run(lines, engine, optimize), expected)
+
+    def test_cached_binding_set_to_none(self):
+        # The cache found TRUE in the REPL's table, which then holds None, so reads go on to the globals
+        self.check(["THANG TRUE = 2", "TROT i = 1 T' 3 THEN [TRUE, THANG TRUE = RECKON 0 THEN 1]"],
+                   "[[2, None], [1, None], [1, None]]")
+
+    def test_none_binding_rebound(self):
+        # The first read looks past the None in the REPL's table, which the third one has to see again
+        self.check(["THANG TRUE = RECKON 0 THEN 1",
+                    "TROT i = 1 T' 3 THEN [TRUE, THANG TRUE = RECKON i > 1 THEN 5]"],
+                   "[[1, None], [1, 5], [5, 5]]")
+
+    def test_none_binding_in_function(self):
+        self.check(["THANG TRUE = 2",
+                    "FIXIN' f() -> TROT i = 1 T' 3 THEN [TRUE, THANG TRUE = RECKON i > 1 THEN i]",
+                    "f()"],
+                   "[[2, None], [2, 2], [2, 3]]")
+
+class EpochLifetimeTest(unittest.TestCase):
+    def test_epochs_go_with_their_caches(self):
+        context = repl_context()
+        gc.collect()
+        before = len(symbol_table.name_epochs)
+        for i in range(300):
+            for engine in ENGINES:
+                evaluate(IncrementalDocument('names.ss', f'[THANG name{i} = {i}, name{i} + 1]').tree, context, engine=engine)
+        gc.collect()
+        self.assertLessEqual(len(symbol_table.name_epochs), before)
+
+if __name__ == '__main__':
+    unittest.main()
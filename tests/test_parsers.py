@@ -0,0 +1,81 @@
+"""PrattParser gives the tree or SyntaxIssue that CodeParser gives, for any tokens.
+
+Both parse every line the engine tests run and the README's example,
+along with every prefix of each line's tokens and every copy missing one
+token, so most inputs are invalid. Trees are compared node by node with
+the positions of their tokens, and issues by their text and position,
+which covers the messages CodeParser puts in place of the error of a
+rule that consumed no tokens.
+
+Run from the directory that holds the `interpreter` package (like test.py):
+
+    python -m unittest tests.test_parsers
+"""
+import unittest
+
+from interpreter.table_lexer import TableTokenMaker
+from interpreter.parser import CodeParser
+from interpreter.pratt_parser import PrattParser
+from interpreter.tokens import Token
+from interpreter.constants import TT_EOF
+from tests.test_engines import PROGRAMS, readme_lines
+
+# Inputs that fail where a rule has consumed nothing yet, and just after
+CASES = [
+    "", ")", "THANG", "THANG x", "THANG x =", "THANG x = )", "THANG 1 = 2", "1 +", "1 + )", "1 * )", "-", "-)",
+    "AIN'T", "AIN'T )", "AIN'T AIN'T 1", "1 == )", "1 < AIN'T 0", "1 AN' )", "1 OR AN' 2", "(", "()", "(1",
+    "(1 2)", "[", "[)", "[1,", "[1, )", "[1 2]", "[,]", "f(", "f(1,", "f(1, )", "f(1 2)", "f()()", "1(2)",
+    "RECKON", "RECKON 1", "RECKON 1 THEN", "RECKON 1 THEN )", "RECKON 1 THEN 2 ELSE", "RECKON 1 THEN 2 ELSE )",
+    "RECKON 1 THEN 2 MIGHTCOULD", "RECKON 1 THEN 2 MIGHTCOULD 3 THEN", "TROT", "TROT 1", "TROT i", "TROT i =",
+    "TROT i = ) T' 3 THEN 1", "TROT i = 1 T'", "TROT i = 1 T' 3", "TROT i = 1 T' 3 BY_A_PEICE", "TROT i = 1 T' 3 THEN",
+    "WHILES", "WHILES 1", "WHILES 1 THEN", "WHILES ) THEN 1", "FIXIN'", "FIXIN' f", "FIXIN' f(", "FIXIN' f(a",
+    "FIXIN' f(a,", "FIXIN' f(a, 1)", "FIXIN' f(a)", "FIXIN' f(a) ->", "FIXIN' f(a) -> )", "FIXIN'() -> 1",
+    "1 2", "1 THEN", "1 ]", "x = 1", "THANG x = THANG y = 1", "- - + 1", "1 - -2 * +3 / (4 - 5)",
+]
+
+def sources():
+    for lines in PROGRAMS.values():
+        yield from lines
+    yield from readme_lines()
+    yield from CASES
+
+def token_lists(source):
+    """The tokens of source, every prefix of them, and every copy with one token left out"""
+    # Held while the tokens are parsed, since the issues made of them look up its map
+    tokenizer = TableTokenMaker('<parsers>', source)
+    tokens, issue = tokenizer.generate_tokens()
+    if issue: return
+    body, eof = tokens[:-1], tokens[-1]
+    yield tokens
+    for index in range(len(body)):
+        yield body[:index] + [Token(TT_EOF, start_pos=body[index].start_pos)]
+        yield body[:index] + body[index + 1:] + [eof]
+
+def dump(value):
+    if isinstance(value, Token):
+        return value.type, value.value, value.start_pos, value.end_pos
+    if isinstance(value, (list, tuple)):
+        return [dump(item) for item in value]
+    if hasattr(value, 'fields'):
+        return type(value).__name__, value.start_pos, value.end_pos, [dump(getattr(value, name)) for name in value.fields]
+    return value
+
+def outcome(parser_type, tokens):
+    try:
+        result = parser_type(tokens).parse()
+    except Exception as e:
+        # Some inputs crash the parser, which CodeParser does too
+        return f'raised {type(e).__name__}: {e}'
+    issue = result.error
+    if issue: return type(issue).__name__, issue.details, issue.start_pos, issue.end_pos
+    return dump(result.node)
+
+class ParserAgreementTest(unittest.TestCase):
+    def test_parsers_agree(self):
+        for source in sources():
+            for tokens in token_lists(source):
+                with self.subTest(source=source, tokens=tokens):
+                    self.assertEqual(outcome(PrattParser, tokens), outcome(CodeParser, tokens))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+"""Damaged .ssc files are parsed again instead of breaking the run.
+
+Run from the directory that holds the `interpreter` package (like test.py):
+
+    python -m unittest tests.test_script_cache
+"""
+import marshal
+import os
+import shutil
+import tempfile
+import unittest
+
+from interpreter import init, script_cache
+from interpreter.init import execute, parse_file, setup_global_symbols
+from interpreter.context import ExecutionContext
+
+class DamagedCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache_root = script_cache.cache_root
+        script_cache.cache_root = self.directory
+        self.path = os.path.join(self.directory, 'lib.ss')
+        with open(self.path, 'w') as f:
+            f.write('THANG loaded = [1, 2 * 3, "x"]')
+        init.syntax_cache.clear()
+        parse_file(self.path)
+
+    def tearDown(self):
+        script_cache.cache_root = self.cache_root
+        shutil.rmtree(self.directory)
+
+    def damage(self, change):
+        """Rewrites the cache file with change applied to its columns, keeping magic and digest"""
+        cache = script_cache.cache_path(self.path)
+        with open(cache, 'rb') as f:
+            header = f.read(len(script_cache.MAGIC) + 16)
+            line_data, (base, columns, type_pool, literal_pool) = marshal.loads(f.read())
+        change(columns)
+        with open(cache, 'wb') as f:
+            f.write(header)
+            f.write(marshal.dumps((line_data, (base, columns, type_pool, literal_pool))))
+
+    def check_reparsed(self):
+        context = ExecutionContext('<main>')
+        context.symbol_storage = setup_global_symbols()
+        _, issue = execute('<stdin>', f'FIREUP("{self.path}")', context)
+        self.assertIsNone(issue)
+        self.assertEqual(repr(context.symbol_storage.get('loaded')), '[1, 6, "x"]')
+        # The file was written again, so it loads now
+        with open(self.path) as f:
+            self.assertIsNotNone(script_cache.load(self.path, script_cache.source_digest(f)))
+
+    def test_truncated_operands(self):
+        # columns[2] holds the operands, which now run out while nodes are rebuilt
+        self.damage(lambda columns: columns.__setitem__(2, columns[2][:8]))
+        self.check_reparsed()
+
+    def test_operands_out_of_range(self):
+        self.damage(lambda columns: columns.__setitem__(2, b'\x7f' * len(columns[2])))
+        self.check_reparsed()
+
+    def test_unknown_node_kind(self):
+        self.damage(lambda columns: columns.__setitem__(0, b'\xff' * len(columns[0])))
+        self.check_reparsed()
+
+if __name__ == '__main__':
+    unittest.main()
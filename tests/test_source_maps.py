@@ -0,0 +1,94 @@
+"""SourceMaps live exactly as long as something holds positions into them.
+
+Run from the directory that holds the `interpreter` package (like test.py):
+
+    python -m unittest tests.test_source_maps
+"""
+import gc
+import io
+import unittest
+
+from interpreter import position
+from interpreter.init import evaluate, execute, execute_stream, parse, parse_stream, setup_global_symbols
+from interpreter.context import ExecutionContext
+from interpreter.incremental import IncrementalDocument
+
+def main_context():
+    context = ExecutionContext('<main>')
+    context.symbol_storage = setup_global_symbols()
+    return context
+
+def churn():
+    """Collect whatever was let go, then make maps that would take over its file ids"""
+    gc.collect()
+    for i in range(8):
+        IncrementalDocument(f'other{i}.ss', '# one\n# two\n# three\n# four\n1')
+        parse_stream(f'other{i}.ss', io.StringIO('# one\n# two\n# three\n1'))
+
+class SourceMapLifetimeTest(unittest.TestCase):
+    def test_streams_without_digest_free_their_maps(self):
+        execute_stream('loop.ss', io.StringIO('THANG x = 0'))
+        gc.collect()
+        before = len(position.source_maps)
+        for i in range(500):
+            execute_stream('loop.ss', io.StringIO(f'THANG x = x + {i}'))
+        gc.collect()
+        self.assertLessEqual(len(position.source_maps), before)
+
+    def test_interned_maps_go_with_their_trees(self):
+        gc.collect()
+        interned, streams = len(position.interned_sources), len(position.stream_sources)
+        for i in range(500):
+            execute('loop.ss', f'# {i}\n' * (i % 7) + f'THANG x = {i}', cache=False)
+            parse_stream('loop.ss', io.StringIO(f'THANG x = {i}'), digest=str(i).encode())
+        gc.collect()
+        self.assertLessEqual(len(position.interned_sources), interned)
+        self.assertLessEqual(len(position.stream_sources), streams)
+
+    def test_tree_keeps_interned_map(self):
+        tree, _ = parse('text.ss', '# header\n# more\n1 / 0')
+        churn()
+
+        _, issue = evaluate(tree, main_context())
+        self.assertIn('File text.ss, line 3, in <main>', issue.display_error())
+
+    def test_function_keeps_map_of_collected_document(self):
+        context = main_context()
+        document = IncrementalDocument('doc.ss', "# header\nFIXIN' f(x) -> x / 0")
+        evaluate(document.tree, context)
+        del document
+        churn()
+
+        _, issue = evaluate(IncrementalDocument('call.ss', 'f(1)').tree, context)
+        self.assertEqual(issue.display_error(), 'File call.ss, line 1, in <main>\n'
+                                                'File doc.ss, line 2, in f\n'
+                                                'Cattywampus! Runtime Problem: Division by zero')
+
+    def test_issue_keeps_maps_it_shows(self):
+        context = main_context()
+        evaluate(IncrementalDocument('doc.ss', "# header\nFIXIN' f(x) -> x / 0").tree, context)
+        _, issue = evaluate(IncrementalDocument('call.ss', '# a\n# b\nf(1)').tree, context)
+        expected = issue.display_error()
+        del context
+        churn()
+        self.assertEqual(issue.display_error(), expected)
+
+    def test_tree_keeps_map_of_collected_document(self):
+        document = IncrementalDocument('doc.ss', '# header\n1 / 0')
+        document.edit(len(document.text), 0, ' + 1')
+        tree = document.tree
+        del document
+        churn()
+
+        _, issue = evaluate(tree, main_context())
+        self.assertIn('File doc.ss, line 2, in <main>', issue.display_error())
+
+    def test_tree_keeps_map_of_stream(self):
+        tree, _ = parse_stream('stream.ss', io.StringIO('# header\n# more\n1 / 0'))
+        churn()
+
+        _, issue = evaluate(tree, main_context())
+        self.assertIn('File stream.ss, line 3, in <main>', issue.display_error())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+"""syntax_cache is charged for the trees it keeps, not for their source text.
+
+Run from the directory that holds the `interpreter` package (like test.py):
+
+    python -m unittest tests.test_syntax_cache
+"""
+import unittest
+
+from interpreter import init
+from interpreter.init import parse_cached, NODE_BYTES
+from interpreter.nodes import count_nodes
+
+class TreeSizeTest(unittest.TestCase):
+    def setUp(self):
+        self.max_bytes = init.syntax_cache.max_bytes
+        init.syntax_cache.clear()
+
+    def tearDown(self):
+        init.syntax_cache.max_bytes = self.max_bytes
+        init.syntax_cache.clear()
+
+    def test_entries_are_charged_per_node(self):
+        tree, _ = parse_cached('<size>', '[1, x + 2 * y, "text"]')
+        self.assertEqual(init.syntax_cache.stats()['bytes'], NODE_BYTES * count_nodes(tree))
+
+    def test_trees_are_evicted_by_their_size(self):
+        source = '[' + ', '.join(['a + b * c'] * 100) + ']'
+        tree, _ = parse_cached('<size>', source)
+        init.syntax_cache.clear()
+        # Room for two trees, although a thousand sources this long would fit
+        init.syntax_cache.max_bytes = 2 * NODE_BYTES * count_nodes(tree)
+        for index in range(3):
+            parse_cached(f'<size {index}>', source)
+        self.assertEqual(init.syntax_cache.stats()['entries'], 2)
+        self.assertEqual(init.syntax_cache.stats()['evictions'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
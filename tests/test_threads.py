@@ -0,0 +1,67 @@
+"""Runs from several threads go on at once, sharing the trees in the syntax cache.
+
+Run from the directory that holds the `interpreter` package (like test.py):
+
+    python -m unittest tests.test_threads
+"""
+import threading
+import unittest
+from unittest import mock
+
+from interpreter.init import ENGINES, execute, setup_global_symbols
+from interpreter.context import ExecutionContext
+from interpreter.symbol_table import SymbolStorage
+
+def repl_context():
+    context = ExecutionContext('<repl>')
+    context.symbol_storage = SymbolStorage(setup_global_symbols())
+    return context
+
+class ThreadTest(unittest.TestCase):
+    def test_runs_go_on_while_one_waits(self):
+        entered = threading.Event()
+        release = threading.Event()
+        finished = []
+
+        def answer():
+            entered.set()
+            release.wait(5)
+            return 'howdy'
+
+        def run(line):
+            finished.append(execute('<stdin>', line, repl_context())[0].value)
+
+        with mock.patch('builtins.input', side_effect=answer):
+            first = threading.Thread(target=run, args=('SPEAKUP()',))
+            first.start()
+            self.assertTrue(entered.wait(5))
+            for engine in ENGINES:
+                value, _ = execute('<stdin>', "[FIXIN' twice(n) -> n * 2, twice(21)] / 1", repl_context(),
+                                   engine=engine)
+                self.assertEqual(repr(value), '42')
+            self.assertTrue(first.is_alive())
+            release.set()
+            first.join(5)
+        self.assertEqual(finished, ['howdy'])
+
+    def test_threads_share_cached_trees(self):
+        lines = ["THANG total = 0", "TROT i = 1 T' 300 THEN THANG total = total + i * i",
+                 "FIXIN' fib(n) -> RECKON n < 2 THEN n ELSE fib(n - 1) + fib(n - 2)",
+                 "FIXIN' sum(n) -> RECKON n == 0 THEN total ELSE sum(n - 1)", "sum(50) + fib(12)"]
+        expected = 300 * 301 * 601 // 6 + 144
+        results = []
+
+        def run(engine):
+            context = repl_context()
+            for _ in range(20):
+                for line in lines:
+                    value, issue = execute('<stdin>', line, context, engine=engine)
+                results.append(value.value if issue is None else issue.display_error())
+
+        threads = [threading.Thread(target=run, args=(engine,)) for engine in ENGINES for _ in range(2)]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join(60)
+        self.assertEqual(results, [expected] * len(threads) * 20)
+
+if __name__ == '__main__':
+    unittest.main()